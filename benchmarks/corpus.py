@@ -0,0 +1,252 @@
+"""
+Deterministic synthetic corpus generator.
+
+Every file is generated directly from its format specification rather than through libvespy, so that the corpus
+does not depend on the code being measured. The same parameters and seed always produce the same bytes.
+"""
+
+from dataclasses import dataclass, field
+from typing import Literal
+import random
+import struct
+import lzma
+import zlib
+
+
+# Content bitmask combinations that can be extracted without relying on the address of a following entry
+FPS4_CONTENT_BITMASKS: tuple[int, ...] = (
+    0x0003,     # Start pointers, sector sizes
+    0x0005,     # Start pointers, file sizes
+    0x0007,     # Start pointers, sector sizes, file sizes
+    0x000F,     # + filenames
+    0x002F,     # + filenames, file types
+    0x004F,     # + filenames, metadata
+    0x007F,     # + filenames, file extensions, file types, metadata
+)
+
+
+@dataclass
+class FPS4Spec:
+    entries: int = 10
+    content_bitmask: int = 0x000F
+    member_size: int = 0x1000
+    alignment: int = 0x10
+    byteorder: Literal['little', 'big'] = 'little'
+    compressibility: float = 0.5
+    seed: int = 0
+    shuffled: bool = False      # Members are stored in a different order than their entries, so it is not linear
+
+    @property
+    def name(self) -> str:
+        return (f"fps4_{self.content_bitmask:04x}_{self.byteorder[0]}_n{self.entries}_s{self.member_size}"
+                f"_a{self.alignment}" + ("_shuffled" if self.shuffled else ""))
+
+
+@dataclass
+class TLZCSpec:
+    size: int = 0x100000
+    comp_type: Literal[2, 4] = 2
+    compressibility: float = 0.5
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        return f"tlzc_t{self.comp_type}_s{self.size}"
+
+
+@dataclass
+class ScenarioSpec:
+    entries: int = 100
+    member_size: int = 0x2000
+    duplicate_ratio: float = 0.1
+    missing_ratio: float = 0.05
+    compressibility: float = 0.5
+    seed: int = 0
+    members: dict[int, bytes] = field(default_factory=dict, repr=False)
+
+    @property
+    def name(self) -> str:
+        return f"scenario_n{self.entries}_s{self.member_size}"
+
+
+def generate_data(size: int, compressibility: float = 0.5, seed: int = 0) -> bytes:
+    """
+    Generate deterministic data.
+
+    :param size: Size of the data.
+    :param compressibility: Ratio of every 4 KiB block that is made of repeated bytes rather than random ones.
+    :param seed: Seed of the random data.
+    :return: Generated data
+    """
+
+    rng = random.Random(seed)
+    block_size: int = 0x1000
+    random_size: int = block_size - int(block_size * compressibility)
+
+    # Build from a pool of blocks so that generating gigabytes stays fast
+    pool: list[bytes] = [rng.randbytes(random_size) + bytes([i]) * (block_size - random_size) for i in range(64)]
+    blocks: list[bytes] = [pool[rng.randrange(len(pool))] for _ in range((size + block_size - 1) // block_size)]
+
+    return b''.join(blocks)[:size]
+
+def write_data(path: str, size: int, compressibility: float = 0.5, seed: int = 0, chunk_size: int = 0x4000000):
+    """Write generated data to a file in chunks, so that large files do not have to fit in memory."""
+    with open(path, "wb") as f:
+        for i, offset in enumerate(range(0, size, chunk_size)):
+            f.write(generate_data(min(chunk_size, size - offset), compressibility, seed * 0x10000 + i))
+
+def generate_fps4(path: str, spec: FPS4Spec):
+    """
+    Generate an FPS4 archive.
+
+    Member sizes vary between half and one and a half times the member size of the spec.
+    """
+
+    rng = random.Random(spec.seed)
+    order: str = '<' if spec.byteorder == 'little' else '>'
+
+    has = lambda mask: spec.content_bitmask & mask == mask
+    entry_size: int = sum(size for mask, size in ((0x1, 4), (0x2, 4), (0x4, 4), (0x8, 0x20), (0x10, 8), (0x20, 4),
+                                                  (0x40, 4)) if has(mask))
+
+    sizes: list[int] = [max(1, rng.randrange(spec.member_size // 2, spec.member_size * 3 // 2 + 1))
+                        for _ in range(spec.entries)]
+
+    # Header, entries including the terminating entry, then metadata strings
+    header_size: int = 0x1C
+    metadata: list[bytes] = [f"name=member{i:06} id={i}".encode('ascii') + b'\x00' if has(0x40) else b''
+                             for i in range(spec.entries)]
+    metadata_start: int = header_size + (spec.entries + 1) * entry_size
+    file_start: int = _align(metadata_start + sum(len(m) for m in metadata), spec.alignment)
+
+    storage_order: list[int] = list(range(spec.entries))
+    if spec.shuffled:
+        rng.shuffle(storage_order)
+
+    addresses: list[int] = [0] * spec.entries
+    position: int = file_start
+    for i in storage_order:
+        addresses[i] = position
+        position = _align(position + sizes[i], spec.alignment)
+
+    with open(path, "wb") as f:
+        # The entry count includes the terminating entry
+        f.write(struct.pack(order + "4sIIIHHII", b'FPS4', spec.entries + 1, header_size, file_start, entry_size,
+                            spec.content_bitmask, 0, 0))
+
+        metadata_position: int = metadata_start
+        for i in range(spec.entries + 1):
+            is_terminator: bool = i == spec.entries
+            entry: bytes = bytes()
+            if has(0x1): entry += struct.pack(order + "I", position if is_terminator else addresses[i])
+            if has(0x2):
+                # Sector sizes match file sizes when both are present
+                sector_size: int = 0
+                if not is_terminator:
+                    sector_size = sizes[i] if has(0x4) else _align(sizes[i], spec.alignment)
+                entry += struct.pack(order + "I", sector_size)
+            if has(0x4): entry += struct.pack(order + "I", 0 if is_terminator else sizes[i])
+            if has(0x8):
+                entry += bytes(0x20) if is_terminator else f"MEMBER{i:06}.BIN".encode('ascii').ljust(0x20, b'\x00')
+            if has(0x10): entry += bytes(8) if is_terminator else b'BIN'.ljust(8, b'\x00')
+            if has(0x20): entry += bytes(4) if is_terminator else b'BIN\x00'
+            if has(0x40):
+                entry += struct.pack(order + "I", 0 if is_terminator else metadata_position)
+                if not is_terminator:
+                    metadata_position += len(metadata[i])
+            f.write(entry)
+
+        f.write(b''.join(metadata))
+
+        for i, size in enumerate(sizes):
+            f.seek(addresses[i])
+            f.write(generate_data(size, spec.compressibility, spec.seed * 0x100000 + i))
+
+        f.truncate(position)
+
+def generate_tlzc(path: str, spec: TLZCSpec) -> bytes:
+    """
+    Generate a TLZC file.
+
+    :return: The uncompressed data
+    """
+
+    data: bytes = generate_data(spec.size, spec.compressibility, spec.seed)
+    with open(path, "wb") as f:
+        f.write(encode_tlzc(data, spec.comp_type))
+
+    return data
+
+def encode_tlzc(data: bytes, comp_type: Literal[2, 4] = 2) -> bytes:
+    if comp_type == 2:
+        content: bytes = zlib.compress(data, 6)
+        return struct.pack("<4sIIIII", b'TLZC', 0x0201, 0x18 + len(content), len(data), 0, 0) + content
+
+    dict_size, lc, lp, pb = 0x10000, 3, 0, 2
+    filters: list[dict] = [{'id': lzma.FILTER_LZMA1, 'dict_size': dict_size, 'lc': lc, 'lp': lp, 'pb': pb}]
+    props: bytes = struct.pack("<BI", (pb * 5 + lp) * 9 + lc, dict_size)
+
+    streams: list[bytes] = []
+    sizes: list[int] = []
+    for offset in range(0, len(data), 0x10000):
+        chunk: bytes = data[offset:offset + 0x10000]
+        stream: bytes = lzma.compress(chunk, format=lzma.FORMAT_RAW, filters=filters)
+        if len(stream) >= 0x10000:
+            stream, size = chunk, 0
+        else:
+            size = len(stream)
+
+        streams.append(stream)
+        sizes.append(size)
+
+    # The filter properties of type 4 start at 0x14, in place of the last field of the type 2 header
+    body: bytes = props + struct.pack(f"<{len(sizes)}H", *sizes) + b''.join(streams)
+    return struct.pack("<4sIIII", b'TLZC', 0x0401, 0x14 + len(body), len(data), 0) + body
+
+def generate_scenario(path: str, spec: ScenarioSpec):
+    """
+    Generate a scenario archive with TLZC compressed entries.
+
+    Some entries are left empty, and some are immediate duplicates of the previous entry, which share its data.
+    The uncompressed contents of every entry are stored in spec.members.
+    """
+
+    rng = random.Random(spec.seed)
+    file_offset: int = spec.entries * 0x20 + 0x20
+
+    entries: list[tuple[int, int, int]] = []
+    body: bytearray = bytearray(b'DUMMY' + bytes(11))
+    previous: tuple[int, int, int] | None = None
+    spec.members.clear()
+    for i in range(spec.entries):
+        if rng.random() < spec.missing_ratio:
+            entries.append((0, 0, 0))
+            previous = None
+            continue
+
+        if previous is not None and rng.random() < spec.duplicate_ratio:
+            entries.append(previous)
+            spec.members[i] = spec.members[i - 1]
+            continue
+
+        data: bytes = generate_data(max(1, rng.randrange(spec.member_size // 2, spec.member_size * 3 // 2 + 1)),
+                                    spec.compressibility, spec.seed * 0x100000 + i)
+        compressed: bytes = encode_tlzc(data)
+
+        previous = (len(body), len(compressed), len(data))
+        entries.append(previous)
+        spec.members[i] = data
+
+        body += compressed
+        body += bytes(_align(len(body), 0x10) - len(body))
+
+    file_size: int = file_offset + len(body)
+    with open(path, "wb") as f:
+        f.write(struct.pack(">8sIIIIII", b'TO8SCEL\x00', file_size, 0x20, spec.entries, file_offset, file_size, 0))
+        for entry in entries:
+            f.write(struct.pack(">III", *entry).ljust(0x20, b'\x00'))
+
+        f.write(body)
+
+def _align(value: int, alignment: int) -> int:
+    return value if value % alignment == 0 else value + alignment - value % alignment
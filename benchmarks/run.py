@@ -0,0 +1,270 @@
+"""
+Benchmark suite for libvespy.
+
+Generates a synthetic corpus, runs extraction, packing, compression and decompression over it, and writes the wall
+time, throughput and peak memory of every case as JSON.
+
+    python benchmarks/run.py --profile default --output bench_results.json
+"""
+
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable
+import multiprocessing
+import importlib.metadata
+import tracemalloc
+import datetime
+import platform
+import argparse
+import resource
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+from corpus import FPS4_CONTENT_BITMASKS, FPS4Spec, TLZCSpec, ScenarioSpec
+import corpus
+
+
+@dataclass
+class Case:
+    name: str
+    operation: str
+    spec: FPS4Spec | TLZCSpec | ScenarioSpec
+    params: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    case: str
+    operation: str
+    params: dict[str, Any]
+    bytes: int
+    wall_time: float
+    throughput: float
+    peak_traced: int
+    peak_rss: int
+    error: str | None = None
+
+
+def build_cases(profile: str) -> list[Case]:
+    """
+    Build the benchmark cases of a profile.
+
+    :param profile: smoke (seconds), default (minutes) or full (includes 100k entry and multi-gigabyte archives).
+    :return: Cases
+    """
+
+    cases: list[Case] = []
+
+    fps4_specs: list[FPS4Spec] = []
+    if profile == 'smoke':
+        fps4_specs += [FPS4Spec(10, mask) for mask in FPS4_CONTENT_BITMASKS]
+        fps4_specs.append(FPS4Spec(10, 0x000F, byteorder='big'))
+    else:
+        for entries in (10, 1000, 10000):
+            fps4_specs += [FPS4Spec(entries, mask) for mask in FPS4_CONTENT_BITMASKS]
+        fps4_specs.append(FPS4Spec(1000, 0x000F, byteorder='big'))
+        fps4_specs.append(FPS4Spec(1000, 0x0007, alignment=0x800))
+        fps4_specs.append(FPS4Spec(16, 0x0007, member_size=0x400000))
+
+    if profile == 'full':
+        fps4_specs.append(FPS4Spec(100000, 0x000F))
+        fps4_specs.append(FPS4Spec(100000, 0x004F))
+        fps4_specs.append(FPS4Spec(512, 0x0007, member_size=0x400000, alignment=0x800))      # ~2 GiB
+        fps4_specs.append(FPS4Spec(768, 0x0007, member_size=0x400000, alignment=0x800))      # ~3 GiB
+
+    for spec in fps4_specs:
+        cases.append(Case(spec.name, 'fps4.extract', spec))
+        cases.append(Case(spec.name, 'fps4.pack', spec))
+
+    # Every I/O strategy on tiny, many-member, large-member and non-linear archives
+    io_specs: list[FPS4Spec] = [FPS4Spec(10, 0x000F), FPS4Spec(10, 0x0007, shuffled=True)]
+    if profile != 'smoke':
+        io_specs += [FPS4Spec(10000, 0x000F), FPS4Spec(16, 0x0007, member_size=0x400000),
+                     FPS4Spec(1000, 0x0007, shuffled=True)]
+
+    for spec in io_specs:
+        for io_strategy in ('mmap', 'pread', 'buffered'):
+            cases.append(Case(spec.name, 'fps4.extract', spec, {'io_strategy': io_strategy}))
+            cases.append(Case(spec.name, 'fps4.pack', spec, {'io_strategy': io_strategy}))
+
+    tlzc_sizes: list[int] = [0x100000] if profile == 'smoke' else [0x100000, 0x1000000]
+    if profile == 'full':
+        tlzc_sizes.append(0x10000000)
+
+    for size in tlzc_sizes:
+        for comp_type in (2, 4):
+            spec = TLZCSpec(size, comp_type)
+            cases.append(Case(spec.name, 'tlzc.decompress', spec))
+            cases.append(Case(spec.name, 'tlzc.compress', spec, {'comp_type': 'zlib' if comp_type == 2 else 'lzma'}))
+
+    scenario_entries: list[int] = [50] if profile == 'smoke' else [500, 2000]
+    if profile == 'full':
+        scenario_entries.append(20000)
+
+    for entries in scenario_entries:
+        spec = ScenarioSpec(entries)
+        cases.append(Case(spec.name, 'scenario.extract', spec))
+        cases.append(Case(spec.name, 'scenario.extract', spec, {'decompress': True}))
+        cases.append(Case(spec.name, 'scenario.pack', spec))
+        cases.append(Case(spec.name, 'scenario.pack', spec, {'compress': 'zlib'}))
+        for io_strategy in ('pread', 'buffered'):
+            cases.append(Case(spec.name, 'scenario.extract', spec, {'io_strategy': io_strategy}))
+            cases.append(Case(spec.name, 'scenario.pack', spec, {'io_strategy': io_strategy}))
+
+    return cases
+
+def prepare_input(case: Case, corpus_dir: str) -> str:
+    """Generate the corpus input of a case, reusing it if it was already generated."""
+    extension: str = {FPS4Spec: 'fps4', TLZCSpec: 'tlzc', ScenarioSpec: 'dat'}[type(case.spec)]
+    path: str = os.path.join(corpus_dir, f"{case.spec.name}.{extension}")
+    if os.path.isfile(path):
+        return path
+
+    if isinstance(case.spec, FPS4Spec):
+        corpus.generate_fps4(path, case.spec)
+    elif isinstance(case.spec, TLZCSpec):
+        corpus.generate_tlzc(path, case.spec)
+    else:
+        corpus.generate_scenario(path, case.spec)
+
+    return path
+
+def _setup(case: Case, source: str, work_dir: str) -> tuple[Callable[[], None], int]:
+    """Prepare everything an operation needs outside the timed region, and return the operation to time."""
+    from libvespy import fps4, tlzc, scenario
+
+    output: str = os.path.join(work_dir, "output")
+
+    if case.operation == 'fps4.extract':
+        return (lambda: fps4.extract(source, output, os.path.join(work_dir, "manifest.json"), **case.params)), \
+            os.path.getsize(source)
+
+    if case.operation == 'fps4.pack':
+        manifest: str = os.path.join(work_dir, "source.json")
+        fps4.extract(source, os.path.join(work_dir, "source"), manifest)
+        return (lambda: fps4.pack_from_manifest(os.path.join(output, "packed"), manifest, **case.params)), \
+            os.path.getsize(source)
+
+    if case.operation == 'tlzc.decompress':
+        return (lambda: tlzc.decompress(source, os.path.join(output, "decompressed"))), case.spec.size
+
+    if case.operation == 'tlzc.compress':
+        raw: str = os.path.join(work_dir, "raw")
+        corpus.write_data(raw, case.spec.size, case.spec.compressibility, case.spec.seed)
+        return (lambda: tlzc.compress(raw, os.path.join(output, "compressed"), **case.params)), case.spec.size
+
+    if case.operation == 'scenario.extract':
+        return (lambda: scenario.extract(source, output, **case.params)), os.path.getsize(source)
+
+    if case.operation == 'scenario.pack':
+        directory: str = os.path.join(work_dir, "source")
+        scenario.extract(source, directory, decompress='compress' in case.params)
+        size: int = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        return (lambda: scenario.pack(directory, os.path.join(output, "packed.dat"), **case.params)), size
+
+    raise ValueError(f"Unknown operation {case.operation}")
+
+def _measure(case: Case, source: str, work_dir: str, repeat: int, connection):
+    """Run in a fresh process, so that the peak RSS only belongs to this case."""
+    try:
+        operation, size = _setup(case, source, work_dir)
+        output: str = os.path.join(work_dir, "output")
+
+        wall_time: float = float('inf')
+        for _ in range(repeat):
+            shutil.rmtree(output, ignore_errors=True)
+            os.makedirs(output)
+
+            start: float = time.perf_counter()
+            operation()
+            wall_time = min(wall_time, time.perf_counter() - start)
+
+        shutil.rmtree(output, ignore_errors=True)
+        os.makedirs(output)
+
+        tracemalloc.start()
+        operation()
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+        peak_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss *= 1 if sys.platform == 'darwin' else 1024
+
+        connection.send(Result(case.name, case.operation, case.params, size, wall_time,
+                               size / wall_time if wall_time else 0.0, peak_traced, peak_rss))
+    except Exception as e:
+        connection.send(Result(case.name, case.operation, case.params, 0, 0.0, 0.0, 0, 0, repr(e)))
+
+def run_case(case: Case, corpus_dir: str, work_dir: str, repeat: int = 3) -> Result:
+    source: str = prepare_input(case, corpus_dir)
+
+    case_dir: str = tempfile.mkdtemp(dir=work_dir)
+    try:
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_measure, args=(case, source, case_dir, repeat, sender))
+        process.start()
+        result: Result = receiver.recv()
+        process.join()
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+
+    return result
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the libvespy benchmark suite.")
+    parser.add_argument('--profile', choices=('smoke', 'default', 'full'), default='default')
+    parser.add_argument('--output', default="bench_results.json", help="Path to the JSON results.")
+    parser.add_argument('--work-dir', default="", help="Directory for the corpus and outputs. "
+                                                       "Defaults to a temporary directory.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case. The fastest run is reported.")
+    parser.add_argument('--filter', default="", help="Only run cases whose operation or name contain this.")
+    args = parser.parse_args(argv)
+
+    work_dir: str = args.work_dir or tempfile.mkdtemp(prefix="libvespy-bench-")
+    corpus_dir: str = os.path.join(work_dir, "corpus")
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    cases: list[Case] = [c for c in build_cases(args.profile) if args.filter in c.operation or args.filter in c.name]
+
+    results: list[Result] = []
+    for i, case in enumerate(cases):
+        result: Result = run_case(case, corpus_dir, work_dir, args.repeat)
+        results.append(result)
+
+        status: str = result.error or (f"{result.wall_time * 1000:10.1f} ms {result.throughput / 0x100000:10.1f} MiB/s "
+                                       f"{result.peak_traced / 0x100000:8.1f} MiB traced")
+        print(f"[{i + 1}/{len(cases)}] {case.operation:<17} {case.name:<40} {case.params or ''} {status}")
+
+    try:
+        version: str = importlib.metadata.version('libvespy')
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+
+    report: dict = {
+        'meta': {
+            'libvespy': version,
+            'python': sys.version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'profile': args.profile,
+            'repeat': args.repeat,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        'results': [asdict(r) for r in results],
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return 1 if any(r.error for r in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
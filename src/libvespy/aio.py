@@ -0,0 +1,346 @@
+from concurrent.futures import Executor, Future
+from typing import Callable, Literal, TypeVar
+import contextlib
+import functools
+import weakref
+import asyncio
+import ctypes
+import zlib
+import os
+
+from libvespy.structs import TLZCHeader
+from libvespy.cache import HeaderCache
+from libvespy.parallel import create_executor
+from libvespy import fps4, tlzc
+
+T = TypeVar('T')
+
+# Codec input is handed to the executor in blocks of this size, so that cancellation can take effect between them
+BLOCK_SIZE: int = 0x100000
+
+
+class AsyncPool:
+    """
+    Executor that runs blocking work for coroutines, with a limit on how much of it runs at the same time.
+
+    Work runs on threads, as file I/O, zlib and lzma release the GIL. Blocking work that has already started can not
+    be interrupted, so a cancelled coroutine waits for its running work to finish before the cancellation is raised,
+    while work that has not started yet is dropped.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_workers: int | None = None):
+        """
+        :param max_concurrency: The maximum amount of blocking calls that can run at the same time.
+        :param max_workers: The maximum amount of threads. Defaults to the amount of usable CPUs.
+        """
+
+        self.max_concurrency: int = max_concurrency
+        self.executor: Executor = create_executor(max_workers)
+
+        # Semaphores belong to a single event loop
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = \
+            weakref.WeakKeyDictionary()
+
+    async def __aenter__(self) -> 'AsyncPool':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking call on the executor.
+
+        :param func: Function to call.
+        :return: Result of the call
+        """
+
+        loop = asyncio.get_running_loop()
+        semaphore: asyncio.Semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+
+        async with semaphore:
+            future: Future = self.executor.submit(functools.partial(func, *args, **kwargs))
+            wrapped: asyncio.Future = asyncio.wrap_future(future)
+            try:
+                return await asyncio.shield(wrapped)
+            except asyncio.CancelledError:
+                if not future.cancel():
+                    with contextlib.suppress(Exception):
+                        await wrapped
+                raise
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_default_pool: AsyncPool | None = None
+
+def get_default_pool() -> AsyncPool:
+    """
+    :return: Pool used by operations that were not given one
+    """
+
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = AsyncPool()
+
+    return _default_pool
+
+def set_default_pool(pool: AsyncPool):
+    global _default_pool
+    _default_pool = pool
+
+
+class AsyncFPS4Archive:
+    """An opened FPS4 archive, whose members are read without blocking the event loop."""
+
+    def __init__(self, archive: fps4.FPS4Archive, pool: AsyncPool):
+        self.archive: fps4.FPS4Archive = archive
+        self.pool: AsyncPool = pool
+
+    async def __aenter__(self) -> 'AsyncFPS4Archive':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def files(self):
+        return self.archive.files
+
+    async def read(self, index: int) -> bytes:
+        """
+        Read the contents of a member.
+
+        :param index: Index of the member.
+        :return: Contents of the member
+        """
+
+        return await self.pool.run(self.archive.read, index)
+
+    async def close(self):
+        await self.pool.run(self.archive.close)
+
+async def open_archive(filename: str, columnar: bool = False, cache: HeaderCache | None = None,
+                       pool: AsyncPool | None = None) -> AsyncFPS4Archive:
+    """
+    Open an FPS4 file for reading its members.
+
+    :param filename: Path to FPS4 file.
+    :param columnar: If the file entries should be stored in a compact FPS4EntryTable.
+    :param cache: If specified, cache to look up and store the parsed header in.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: Opened archive
+    """
+
+    pool = pool or get_default_pool()
+    return AsyncFPS4Archive(await pool.run(fps4.open_archive, filename, columnar, cache=cache), pool)
+
+async def extract(filename: str, out_dir: str = "", manifest_dir: str = "", ignore_metadata: bool = False,
+                  cache: HeaderCache | None = None, pool: AsyncPool | None = None,
+                  members: fps4.MemberFilter | None = None) -> dict:
+    """
+    Extract contents of FPS4 file. See fps4.extract.
+
+    Members are written concurrently up to the limit of the pool. If cancelled, members that are being written are
+    finished and the remaining ones are skipped.
+
+    :param filename: Path to FPS4 file.
+    :param out_dir: Path to where the extracted files will be saved.
+    :param manifest_dir: If specified, path to where the general data of the FPS4 file will be saved.
+    :param ignore_metadata: If FPS4 metadata should be ignored
+    :param cache: If specified, cache to look up and store the parsed header in.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :param members: If specified, only the members matching this filter are extracted.
+    :return: Manifest data
+    """
+
+    pool = pool or get_default_pool()
+
+    if not out_dir:
+        out_dir = f"{filename}.ext"
+        if not os.path.isdir(out_dir):
+            await pool.run(os.makedirs, out_dir)
+
+    previous: dict[str, dict] = await pool.run(fps4.load_previous_members, manifest_dir) if manifest_dir else {}
+
+    archive: AsyncFPS4Archive = await open_archive(filename, cache=cache, pool=pool)
+    try:
+        manifest, extracted_files = await pool.run(fps4.plan_extraction, archive.archive, out_dir, ignore_metadata,
+                                                   members)
+
+        # A task group waits for every member that already started, so the archive is never closed under them
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(pool.run(fps4.extract_member, archive.archive, path, address, size,
+                                                    previous.get(os.path.abspath(path))))
+                         for _, path, address, size in extracted_files]
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+
+        for ef, task in zip(extracted_files, tasks):
+            fps4.record_member(manifest['files'][ef[0]], task.result())
+
+        fps4.record_source(manifest, archive.archive)
+    finally:
+        await archive.close()
+
+    if manifest_dir:
+        await pool.run(fps4.save_manifest, manifest, manifest_dir)
+
+    return manifest
+
+async def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict = "",
+                             max_threads: int | None = None,
+                             pool: AsyncPool | None = None):
+    """
+    Pack files into an FPS4 archive. See fps4.pack_from_manifest.
+
+    Packing runs as a single blocking call, so a cancellation takes effect once it has finished.
+
+    :param output: Path to where the FPS4 file will be saved.
+    :param manifest_file: Path to manifest file of the FPS4 file.
+    :param manifest_data: Manifest data of the FPS4 file, if no manifest file is specified.
+    :param max_threads: If specified, the amount of threads used for copying files into the archive. Otherwise, it
+        is adjusted to the measured throughput.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: None
+    """
+
+    pool = pool or get_default_pool()
+    await pool.run(fps4.pack_from_manifest, output, manifest_file, manifest_data, max_threads)
+
+async def compress_data(data: bytes, comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib', nice_len: int = 64,
+                        pool: AsyncPool | None = None) -> bytes:
+    """
+    Compress data held in memory into TLZC format. See tlzc.compress_data.
+
+    zlib compression is done block by block, and can be cancelled between blocks. Other compression types run as a
+    single blocking call.
+
+    :param data: Data to compress.
+    :param comp_type: Compression type.
+    :param nice_len: (LZMA Only) What should be considered a “nice length” for a match. This should be 273 or less.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: Compressed TLZC data
+    """
+
+    pool = pool or get_default_pool()
+    if comp_type != 'zlib':
+        return await pool.run(tlzc.compress_data, data, comp_type, nice_len)
+
+    if len(data) > 0xFFFFFFFF:
+        raise tlzc.TLZCError(f"[ERROR]\tCompression of files over 4GB is not supported.")
+
+    # Output of a compressor does not depend on how its input is split, so this matches tlzc.compress_data
+    compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION)
+    content: bytearray = bytearray()
+    view = memoryview(data)
+    try:
+        for position in range(0, len(data), BLOCK_SIZE):
+            content += await pool.run(compressor.compress, view[position:position + BLOCK_SIZE])
+        content += await pool.run(compressor.flush)
+    except zlib.error:
+        raise tlzc.TLZCError("[ERROR]\tzlib Compression failed.")
+
+    header = TLZCHeader(0x0201, ctypes.sizeof(TLZCHeader) + len(content), len(data))
+    return bytearray(header) + content
+
+async def decompress_data(data: bytes, comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto',
+                          pool: AsyncPool | None = None) -> bytes:
+    """
+    Decompress TLZC data held in memory. See tlzc.decompress_data.
+
+    zlib decompression is done block by block, and can be cancelled between blocks. Other compression types run as
+    a single blocking call.
+
+    :param data: Buffer containing the complete TLZC file.
+    :param comp_type: Compression type.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: Decompressed data
+    """
+
+    pool = pool or get_default_pool()
+
+    header = TLZCHeader.from_buffer_copy(data[:ctypes.sizeof(TLZCHeader)])
+    is_zlib: bool = comp_type == 'zlib' or (comp_type == 'auto' and (header.type >> 8) & 0xff == 2)
+    if not is_zlib:
+        return await pool.run(tlzc.decompress_data, data, comp_type)
+
+    header.validate(len(data))
+
+    decompressor = zlib.decompressobj()
+    decompressed: bytearray = bytearray()
+    view = memoryview(data)
+    try:
+        for position in range(0x18, len(data), BLOCK_SIZE):
+            decompressed += await pool.run(decompressor.decompress, view[position:position + BLOCK_SIZE])
+        decompressed += await pool.run(decompressor.flush)
+    except zlib.error:
+        raise tlzc.TLZCError("[ERROR]\tzlib Decompression failed.")
+
+    if not decompressor.eof:
+        raise tlzc.TLZCError("[ERROR]\tzlib Decompression failed.")
+
+    return bytes(decompressed)
+
+async def compress(filename: str, output: str = "", comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib',
+                   nice_len: int = 64, pool: AsyncPool | None = None):
+    """
+    Compress a file into TLZC format. See tlzc.compress.
+
+    :param filename: Path to file to compress.
+    :param output: Path to where the compressed file will be written.
+    :param comp_type: Compression type.
+    :param nice_len: (LZMA Only) What should be considered a “nice length” for a match. This should be 273 or less.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: None
+    """
+
+    pool = pool or get_default_pool()
+
+    if not output:
+        base_file, extension = os.path.splitext(filename)
+        if extension == '.dec':
+            output = f"{base_file}.cmp"
+        else:
+            output = f"{filename}.cmp"
+
+    data: bytes = await pool.run(_read_file, filename)
+    await pool.run(_write_file, output, await compress_data(data, comp_type, nice_len, pool))
+
+async def decompress(filename: str, output: str = "",
+                     comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto', pool: AsyncPool | None = None):
+    """
+    Decompress a TLZC file. See tlzc.decompress.
+
+    :param filename: Path to TLZC file to decompress.
+    :param output: Path to where the decompressed file will be written.
+    :param comp_type: Compression type.
+    :param pool: Pool to run blocking work on. Defaults to get_default_pool().
+    :return: None
+    """
+
+    pool = pool or get_default_pool()
+
+    if not output:
+        output = f"{filename}.dec"
+
+    data: bytes = await pool.run(_read_file, filename)
+    await pool.run(_write_file, output, await decompress_data(data, comp_type, pool))
+
+def _read_file(filename: str) -> bytes:
+    with open(filename, "rb") as f:
+        data: bytes = f.read()
+        f.close()
+
+    return data
+
+def _write_file(filename: str, data: bytes):
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+
+    with open(filename, "wb") as f:
+        f.write(data)
+        f.flush()
+        f.close()
@@ -0,0 +1,466 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field, asdict
+from typing import Any
+import threading
+import tempfile
+import socket
+import glob
+import json
+import time
+import os
+
+from libvespy.parallel import schedule
+from libvespy import pipeline
+
+JOB_VERSION: int = 1
+
+# Outputs are named like the default outputs of the operations
+OUTPUT_SUFFIXES: dict[str, str] = {
+    'tlzc.decompress': '.dec',
+    'tlzc.compress': '.cmp',
+    'fps4.extract': '.ext',
+    'fps4.pack': '',
+    'scenario.extract': '.ext',
+    'scenario.pack': '.pck',
+}
+
+
+@dataclass
+class Job:
+    """
+    A batch job, which runs an operation over every input in a directory tree.
+
+    The inputs are split into shards that are stored in a job directory on a shared filesystem. Any amount of workers,
+    on any amount of hosts, claim shards by creating lease files in it, and write the results of every finished shard
+    next to them. Paths are stored relative to the input and output directories, so every host has to see them at the
+    same paths.
+    """
+
+    op: str
+    input_dir: str
+    output_dir: str
+    manifest_dir: str = ""
+    options: dict[str, Any] = field(default_factory=dict)
+    shards: int = 0
+    lease_timeout: float = 300.0
+
+    @staticmethod
+    def load(job_dir: str) -> 'Job':
+        path: str = os.path.join(job_dir, "job.json")
+        if not os.path.isfile(path):
+            raise BatchError(f"[ERROR]\t{job_dir} is not a job directory.")
+
+        with open(path, "r") as f:
+            data: dict = json.load(f)
+            f.close()
+
+        if data.pop('version', None) != JOB_VERSION:
+            raise BatchError(f"[ERROR]\tJob {job_dir} was created by an incompatible version.")
+
+        return Job(**data)
+
+    def resolve(self, task: dict) -> tuple[str, str, str]:
+        """
+        :return: Absolute input, output and manifest paths of a task
+        """
+
+        return (os.path.join(self.input_dir, task['input']), os.path.join(self.output_dir, task['output']),
+                os.path.join(self.manifest_dir, task['manifest']) if task['manifest'] else "")
+
+
+class Lease:
+    """
+    Claim of a shard by a worker.
+
+    Leases are files named by shard and generation, and are only ever created with O_EXCL, which is atomic on local
+    and network filesystems. A lease whose file was not touched within the lease timeout is stale, and is taken over
+    by creating the next generation, so even when several workers find the same stale lease, only one of them gets it.
+    """
+
+    def __init__(self, job_dir: str, shard: int, generation: int):
+        self.job_dir: str = job_dir
+        self.shard: int = shard
+        self.generation: int = generation
+
+    @property
+    def path(self) -> str:
+        return get_lease_path(self.job_dir, self.shard, self.generation)
+
+    @staticmethod
+    def acquire(job_dir: str, shard: int, generation: int, worker_id: str) -> 'Lease | None':
+        """
+        :return: Lease of the shard, or None if another worker got it first
+        """
+
+        lease = Lease(job_dir, shard, generation)
+        try:
+            fd: int = os.open(lease.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+
+        with os.fdopen(fd, "w") as f:
+            json.dump({'worker': worker_id, 'acquired': time.time()}, f)
+            f.close()
+
+        return lease
+
+    def renew(self) -> bool:
+        """
+        Keep the lease from becoming stale.
+
+        :return: If the lease is still held, which it is not once another worker took it over
+        """
+
+        if os.path.exists(get_lease_path(self.job_dir, self.shard, self.generation + 1)):
+            return False
+
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def release(self):
+        """Remove the lease, along with the stale leases it took over."""
+        for generation in range(self.generation, -1, -1):
+            try:
+                os.remove(get_lease_path(self.job_dir, self.shard, generation))
+            except FileNotFoundError:
+                pass
+
+
+def create(job_dir: str, op: str, input_dir: str, output_dir: str, pattern: str = "**/*", manifest_dir: str = "",
+           options: dict[str, Any] | None = None, shard_size: int = 16, lease_timeout: float = 300.0) -> Job:
+    """
+    Create a batch job, which runs an operation over every input in a directory tree.
+
+    Every input gets an output at the same relative path in the output directory, named like the default output of
+    the operation. FPS4 extraction also saves a manifest for every input at the same relative path in the manifest
+    directory, and FPS4 packing takes manifests as its inputs. Scenario packing takes directories as its inputs, and
+    every other operation takes files.
+
+    :param job_dir: Path to the job directory. It must be on a filesystem shared by every worker.
+    :param op: Name of the operation, one of pipeline.OPERATIONS.
+    :param input_dir: Path to the directory of inputs.
+    :param output_dir: Path to where the outputs will be saved.
+    :param pattern: Glob pattern of the inputs, relative to the input directory.
+    :param manifest_dir: (FPS4 Extraction Only) Path to where manifests will be saved. Defaults to a .manifest
+        directory within the output directory.
+    :param options: Options of the operation, as in pipeline steps.
+    :param shard_size: The amount of inputs of every shard.
+    :param lease_timeout: Seconds after which the shard of a worker that stopped renewing its lease is given to
+        another worker.
+    :return: Created job
+    """
+
+    if op not in pipeline.OPERATIONS:
+        raise BatchError(f"[ERROR]\tUnknown operation \"{op}\".")
+
+    unknown: set[str] = set(options or {}) - pipeline.OPERATIONS[op]
+    if unknown:
+        raise BatchError(f"[ERROR]\tUnknown options for {op}: {', '.join(sorted(unknown))}")
+
+    if os.path.exists(os.path.join(job_dir, "job.json")):
+        raise BatchError(f"[ERROR]\tJob {job_dir} already exists.")
+
+    input_dir, output_dir, job_dir = os.path.abspath(input_dir), os.path.abspath(output_dir), os.path.abspath(job_dir)
+    if op == 'fps4.extract':
+        manifest_dir = os.path.abspath(manifest_dir) if manifest_dir else os.path.join(output_dir, ".manifest")
+    else:
+        manifest_dir = ""
+
+    # Outputs and the job itself are never inputs, even if they are within the input directory
+    excluded: tuple[str, ...] = tuple(os.path.join(path, "") for path in (output_dir, job_dir, manifest_dir) if path)
+    is_input = os.path.isdir if op == 'scenario.pack' else os.path.isfile
+
+    tasks: list[dict[str, str]] = []
+    for path in sorted(glob.glob(os.path.join(input_dir, pattern), recursive=True)):
+        if not is_input(path) or os.path.join(path, "").startswith(excluded): continue
+
+        relative: str = os.path.relpath(path, input_dir)
+        tasks.append({
+            'input': relative,
+            'output': get_output_name(op, relative),
+            'manifest': f"{relative}.json" if op == 'fps4.extract' else "",
+        })
+
+    if not tasks:
+        raise BatchError(f"[ERROR]\tNo inputs in {input_dir} match {pattern}.")
+
+    shard_size = max(shard_size, 1)
+    shards: list[list[dict[str, str]]] = [tasks[i:i + shard_size] for i in range(0, len(tasks), shard_size)]
+
+    for directory in ("shards", "leases", "results"):
+        os.makedirs(os.path.join(job_dir, directory), exist_ok=True)
+    for s, shard in enumerate(shards):
+        write_json(get_shard_path(job_dir, s), shard)
+
+    # The job is only visible to workers once all of its shards exist
+    job = Job(op, input_dir, output_dir, manifest_dir, dict(options or {}), len(shards), lease_timeout)
+    write_json(os.path.join(job_dir, "job.json"), {'version': JOB_VERSION, **asdict(job)})
+
+    return job
+
+def get_output_name(op: str, relative: str) -> str:
+    """
+    :return: Relative path of the output of an input
+    """
+
+    base, extension = os.path.splitext(relative)
+    if op == 'fps4.pack' and extension == '.json':
+        return base
+    if op == 'tlzc.compress' and extension == '.dec':
+        return f"{base}.cmp"
+
+    return relative + OUTPUT_SUFFIXES[op]
+
+def work(job_dir: str, worker_id: str = "", max_workers: int | None = None, max_shards: int | None = None,
+         wait: bool = False, poll_interval: float = 5.0) -> int:
+    """
+    Claim and run the shards of a job until none are left.
+
+    Any amount of workers can run at the same time, on the same or different hosts. A worker keeps renewing the lease
+    of its shard while running it. If it crashes, the lease becomes stale and the shard is run again by another
+    worker.
+
+    :param job_dir: Path to the job directory.
+    :param worker_id: Name of the worker, recorded in leases and results. Defaults to the host name and process ID.
+    :param max_workers: If specified, the maximum amount of inputs of a shard that are processed at the same time.
+        Otherwise, it is adjusted to the measured throughput.
+    :param max_shards: If specified, the maximum amount of shards to run.
+    :param wait: If the worker should wait for shards leased by other workers to finish, and take them over if their
+        leases become stale, instead of returning once no shard can be claimed.
+    :param poll_interval: (Wait Only) Seconds between checks of the leases of other workers.
+    :return: Amount of shards run by this worker
+    """
+
+    job: Job = Job.load(job_dir)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    finished: int = 0
+    while max_shards is None or finished < max_shards:
+        lease: Lease | None = claim(job_dir, job, worker_id)
+        if lease is None:
+            if not wait or not get_pending_shards(job_dir, job):
+                break
+
+            time.sleep(min(poll_interval, job.lease_timeout))
+            continue
+
+        try:
+            if run_shard(job_dir, job, lease, worker_id, max_workers):
+                finished += 1
+        finally:
+            lease.release()
+
+    return finished
+
+def claim(job_dir: str, job: Job, worker_id: str) -> Lease | None:
+    """
+    Claim an unfinished shard that is not leased, or whose lease is stale.
+
+    :return: Lease of the shard, or None if no shard can be claimed
+    """
+
+    generations: dict[int, int] = get_lease_generations(job_dir)
+    for shard in get_pending_shards(job_dir, job):
+        generation: int = 0
+        if shard in generations:
+            try:
+                age: float = time.time() - os.stat(get_lease_path(job_dir, shard, generations[shard])).st_mtime
+            except FileNotFoundError:
+                # Released since the leases were listed, so it was most likely just finished
+                continue
+
+            if age < job.lease_timeout: continue
+            generation = generations[shard] + 1
+
+        lease: Lease | None = Lease.acquire(job_dir, shard, generation, worker_id)
+        if lease is None: continue
+
+        # The shard may have been finished between listing the leases and acquiring this one
+        if os.path.exists(get_result_path(job_dir, shard)):
+            lease.release()
+            continue
+
+        return lease
+
+    return None
+
+def run_shard(job_dir: str, job: Job, lease: Lease, worker_id: str, max_workers: int | None = None) -> bool:
+    """
+    Run every input of a leased shard, and record their results.
+
+    :return: If the results were recorded, which they are not if the lease was taken over while running
+    """
+
+    with open(get_shard_path(job_dir, lease.shard), "r") as f:
+        tasks: list[dict[str, str]] = json.load(f)
+        f.close()
+
+    # Renew the lease in the background, so that long running inputs do not make it stale
+    stopped = threading.Event()
+    lost = threading.Event()
+
+    def _heartbeat():
+        while not stopped.wait(job.lease_timeout / 4):
+            if not lease.renew():
+                lost.set()
+                break
+
+    heartbeat = threading.Thread(target=_heartbeat, daemon=True)
+    heartbeat.start()
+
+    results: list[dict[str, Any]] = []
+    try:
+        with schedule('python', max_workers, tasks=len(tasks)) as executor:
+            futures: list[Future] = [executor.submit(pipeline.run_step, job.op, *job.resolve(task), job.options)
+                                     for task in tasks]
+
+            for task, future in zip(tasks, futures):
+                if lost.is_set():
+                    # Another worker runs the shard now, so inputs that have not started are left to it
+                    for remaining in futures:
+                        remaining.cancel()
+                    break
+
+                result: dict[str, Any] = dict(task, status='built', error=None)
+                try:
+                    future.result()
+                except Exception as e:
+                    result.update(status='failed', error=str(e))
+                results.append(result)
+    finally:
+        stopped.set()
+        heartbeat.join()
+
+    if lost.is_set() or not lease.renew():
+        return False
+
+    write_json(get_result_path(job_dir, lease.shard), {
+        'shard': lease.shard, 'worker': worker_id, 'finished': time.time(), 'tasks': results,
+    })
+
+    return True
+
+def status(job_dir: str) -> dict[str, int]:
+    """
+    :return: Amount of shards of a job that are finished, leased, stale and waiting to be claimed
+    """
+
+    job: Job = Job.load(job_dir)
+    generations: dict[int, int] = get_lease_generations(job_dir)
+
+    counts: dict[str, int] = {'shards': job.shards, 'finished': 0, 'leased': 0, 'stale': 0, 'waiting': 0}
+    pending: list[int] = get_pending_shards(job_dir, job)
+    counts['finished'] = job.shards - len(pending)
+
+    for shard in pending:
+        try:
+            age: float | None = time.time() - os.stat(get_lease_path(job_dir, shard, generations[shard])).st_mtime \
+                if shard in generations else None
+        except FileNotFoundError:
+            age = None
+
+        if age is None:
+            counts['waiting'] += 1
+        elif age < job.lease_timeout:
+            counts['leased'] += 1
+        else:
+            counts['stale'] += 1
+
+    return counts
+
+def merge(job_dir: str) -> dict:
+    """
+    Merge the results of every shard of a finished job into result.json in the job directory.
+
+    For FPS4 extraction, the manifests of every input are merged in as well, keyed by the relative path of the input.
+
+    :param job_dir: Path to the job directory.
+    :return: Merged results
+    """
+
+    job: Job = Job.load(job_dir)
+    pending: list[int] = get_pending_shards(job_dir, job)
+    if pending:
+        raise BatchError(f"[ERROR]\t{len(pending)} of {job.shards} shards of {job_dir} are not finished.")
+
+    tasks: list[dict[str, Any]] = []
+    for shard in range(job.shards):
+        with open(get_result_path(job_dir, shard), "r") as f:
+            result: dict = json.load(f)
+            f.close()
+
+        tasks += [dict(task, worker=result['worker']) for task in result['tasks']]
+
+    manifests: dict[str, dict] = {}
+    if job.op == 'fps4.extract':
+        for task in tasks:
+            if task['status'] != 'built': continue
+
+            with open(job.resolve(task)[2], "r") as f:
+                manifests[task['input']] = json.load(f)
+                f.close()
+
+    merged: dict = {
+        'version': JOB_VERSION,
+        'op': job.op,
+        'input_dir': job.input_dir,
+        'output_dir': job.output_dir,
+        'built': sum(1 for task in tasks if task['status'] == 'built'),
+        'failed': sum(1 for task in tasks if task['status'] == 'failed'),
+        'tasks': tasks,
+        'manifests': manifests,
+    }
+
+    write_json(os.path.join(job_dir, "result.json"), merged)
+
+    return merged
+
+def get_pending_shards(job_dir: str, job: Job) -> list[int]:
+    return [shard for shard in range(job.shards) if not os.path.exists(get_result_path(job_dir, shard))]
+
+def get_lease_generations(job_dir: str) -> dict[int, int]:
+    """
+    :return: Latest lease generation of every leased shard
+    """
+
+    generations: dict[int, int] = {}
+    for name in os.listdir(os.path.join(job_dir, "leases")):
+        shard, _, rest = name.partition('.')
+        generation, _, extension = rest.partition('.')
+        if extension != 'lease' or not shard.isdigit() or not generation.isdigit(): continue
+
+        generations[int(shard)] = max(generations.get(int(shard), 0), int(generation))
+
+    return generations
+
+def get_shard_path(job_dir: str, shard: int) -> str:
+    return os.path.join(job_dir, "shards", f"{shard:05}.json")
+
+def get_lease_path(job_dir: str, shard: int, generation: int) -> str:
+    return os.path.join(job_dir, "leases", f"{shard:05}.{generation}.lease")
+
+def get_result_path(job_dir: str, shard: int) -> str:
+    return os.path.join(job_dir, "results", f"{shard:05}.json")
+
+def write_json(path: str, data: Any):
+    """Write JSON data at once, so that other workers never read a partially written file."""
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            f.close()
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class BatchError(Exception):
+    """"""
@@ -0,0 +1,296 @@
+from collections import OrderedDict
+import threading
+import tempfile
+import hashlib
+import ctypes
+import struct
+import os
+
+from libvespy.structs import FPS4, FPS4EntryTable
+from libvespy.utils import pack_blobs, unpack_blobs
+
+# Identifies files of the persistent cache, and the version of their layout
+CACHE_MAGIC: bytes = b'LVHC'
+CACHE_VERSION: int = 1
+CACHE_EXTENSION: str = '.fps4h'
+
+
+class HeaderCache:
+    """
+    Cache of parsed FPS4 headers, shared between threads.
+
+    Headers are keyed by the path, size, modification time and inode of their file, so a changed file is parsed
+    again. Cached headers must be treated as read-only, as they are shared by every archive opened from them.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        :param max_entries: The maximum amount of headers to keep. The least recently used ones are evicted first.
+        """
+
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[tuple, FPS4] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def get_key(filename: str, stat: os.stat_result, columnar: bool = False) -> tuple:
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, stat.st_ino, columnar
+
+    def get(self, key: tuple) -> FPS4 | None:
+        with self._lock:
+            fps4: FPS4 | None = self._entries.get(key)
+            if fps4 is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return fps4
+
+    def put(self, key: tuple, fps4: FPS4):
+        with self._lock:
+            self._entries[key] = fps4
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class PersistentHeaderCache(HeaderCache):
+    """
+    Cache of parsed FPS4 headers that is also stored on disk, so that it is shared between processes and kept between
+    runs.
+
+    Every archive has a single file in the cache directory, holding the header and file entries in a compact binary
+    form, along with the size, modification time and inode of the archive they were parsed from. An entry is
+    discarded as soon as it no longer matches its archive. When the directory grows over its size limit, the least
+    recently used entries are removed first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0x4000000, max_entries: int = 256):
+        """
+        :param directory: Path to the directory the cache is stored in. It is created if it does not exist.
+        :param max_bytes: The maximum size of the cache on disk.
+        :param max_entries: The maximum amount of headers to also keep in memory.
+        """
+
+        super().__init__(max_entries)
+
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.disk_hits: int = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._disk_bytes: int = sum(size for _, size, _ in self._list_files())
+
+    def get(self, key: tuple) -> FPS4 | None:
+        with self._lock:
+            fps4: FPS4 | None = self._entries.get(key)
+            if fps4 is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return fps4
+
+        fps4 = self._load(key)
+
+        with self._lock:
+            if fps4 is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._put_memory(key, fps4)
+            return fps4
+
+    def put(self, key: tuple, fps4: FPS4):
+        with self._lock:
+            self._put_memory(key, fps4)
+
+        self._store(key, fps4)
+
+    def invalidate(self, filename: str):
+        """Remove the cached header of an archive, if there is one."""
+        path: str = os.path.abspath(filename)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
+        for columnar in (False, True):
+            self._remove(self._get_path((path, 0, 0, 0, columnar)))
+
+    def clear(self):
+        super().clear()
+        for path, _, _ in self._list_files():
+            self._remove(path)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'disk_hits': self.disk_hits, 'disk_bytes': self._disk_bytes}
+
+    def _put_memory(self, key: tuple, fps4: FPS4):
+        self._entries[key] = fps4
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_path(self, key: tuple) -> str:
+        # Named after the archive only, so a newer version of it replaces the stale one
+        name: str = hashlib.blake2b(repr((key[0], key[4])).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name + CACHE_EXTENSION)
+
+    def _load(self, key: tuple) -> FPS4 | None:
+        path: str = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data: bytes = f.read()
+                f.close()
+        except FileNotFoundError:
+            return None
+
+        try:
+            fps4: FPS4 | None = decode_header(data, key)
+        except (ValueError, KeyError, struct.error, UnicodeDecodeError):
+            fps4 = None
+
+        if fps4 is None:
+            # Written for a different version of the archive, or damaged
+            self._remove(path)
+            return None
+
+        # The modification time of an entry is when it was last used, which decides what is evicted first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return fps4
+
+    def _store(self, key: tuple, fps4: FPS4):
+        path: str = self._get_path(key)
+        data: bytes = encode_header(fps4, key)
+
+        # Written to a temporary file first, so that other processes never read a partially written entry
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.close()
+
+            previous: int = os.path.getsize(path) if os.path.isfile(path) else 0
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._disk_bytes += len(data) - previous
+            is_over_limit: bool = self._disk_bytes > self.max_bytes
+
+        if is_over_limit:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in its size limit."""
+        files: list[tuple[str, int, int]] = sorted(self._list_files(), key=lambda file: file[2])
+        total: int = sum(size for _, size, _ in files)
+
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+
+            self._remove(path)
+            total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def _list_files(self) -> list[tuple[str, int, int]]:
+        files: list[tuple[str, int, int]] = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(CACHE_EXTENSION): continue
+            try:
+                stat: os.stat_result = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+        return files
+
+    def _remove(self, path: str):
+        try:
+            size: int = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            self._disk_bytes = max(self._disk_bytes - size, 0)
+
+
+_header_record = struct.Struct('<4sIQqQ??QI?')
+
+def encode_header(fps4: FPS4, key: tuple) -> bytes:
+    """
+    Store a parsed FPS4 header in a compact binary form.
+
+    :param fps4: Parsed header.
+    :param key: Cache key of the archive the header was parsed from.
+    :return: Binary form of the header
+    """
+
+    files = fps4.files if isinstance(fps4.files, FPS4EntryTable) else \
+        FPS4EntryTable.from_files(fps4.files, fps4.content_data)
+
+    record: bytes = _header_record.pack(CACHE_MAGIC, CACHE_VERSION, key[1], key[2], key[3], key[4],
+                                        fps4.byteorder == 'big', fps4.file_size, fps4.file_location_multiplier,
+                                        fps4.should_guess_file_size)
+
+    return record + pack_blobs([bytes(fps4), (fps4.archive_name or '').encode('utf-8'),
+                                b'' if fps4.archive_name is None else b'\x01', files.to_bytes()])
+
+def decode_header(data: bytes, key: tuple) -> FPS4 | None:
+    """
+    Load a header stored by encode_header.
+
+    :param data: Binary form of the header.
+    :param key: Cache key of the archive being opened.
+    :return: Parsed header, or None if it was stored for a different version of the archive
+    """
+
+    magic, version, size, mtime_ns, inode, columnar, is_big, file_size, multiplier, should_guess = \
+        _header_record.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if (size, mtime_ns, inode, columnar) != key[1:5]:
+        return None
+
+    raw_header, archive_name, has_archive_name, table = unpack_blobs(memoryview(data)[_header_record.size:])
+    if len(raw_header) != ctypes.sizeof(FPS4):
+        raise ValueError("Header data is incomplete")
+
+    fps4 = FPS4.from_buffer_copy(raw_header)
+    fps4.set_byteorder('big' if is_big else 'little')
+    fps4.archive_name = archive_name.decode('utf-8') if has_archive_name else None
+    fps4.file_size = file_size
+    fps4.file_location_multiplier = multiplier
+    fps4.should_guess_file_size = should_guess
+
+    entries: FPS4EntryTable = FPS4EntryTable.from_bytes(table)
+    fps4.files = entries if columnar else entries.materialize()
+
+    return fps4
@@ -0,0 +1,279 @@
+import argparse
+import json
+import sys
+import os
+
+from libvespy.index import ArchiveIndex
+from libvespy import batch, daemon, export, memory, patch, pipeline, tune, tlzc
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='libvespy', description="Tools for Tales of Vesperia file formats.")
+    parser.add_argument('--memory-budget', default=None,
+                        help="Maximum amount of memory each process holds data in at the same time, such as 512M. "
+                             "Defaults to $LIBVESPY_MEMORY_BUDGET, or unlimited.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help="Run the steps of a pipeline file that are out of date.")
+    build_parser.add_argument('pipeline', help="Path to pipeline file.")
+    build_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help="Maximum amount of steps to run at the same time. Defaults to the amount of CPUs.")
+    build_parser.add_argument('--state', default="",
+                              help="Path to state file. Defaults to .libvespy-state.json next to the pipeline file.")
+    build_parser.add_argument('--force', action='store_true', help="Run all steps, even if they are unchanged.")
+    build_parser.add_argument('--dry-run', action='store_true', help="Only list the steps that would be run.")
+
+    daemon_parser = commands.add_parser('daemon', help="Run a daemon that serves jobs over a Unix socket.")
+    daemon_parser.add_argument('--socket', default="", help="Path of the socket to listen on.")
+    daemon_parser.add_argument('-j', '--jobs', type=int, default=None,
+                               help="Maximum amount of jobs to run at the same time. Defaults to the amount of CPUs.")
+    daemon_parser.add_argument('--cache-entries', type=int, default=256,
+                               help="Maximum amount of parsed archive headers to cache.")
+    daemon_parser.add_argument('--cache-dir', default="",
+                               help="Directory where parsed archive headers are also cached on disk.")
+
+    call_parser = commands.add_parser('call', help="Run an operation on a running daemon.")
+    call_parser.add_argument('op', help="Name of the operation, such as fps4.extract or tlzc.compress.")
+    call_parser.add_argument('args', nargs='*', metavar='KEY=VALUE',
+                             help="Arguments of the operation. Values are parsed as JSON if possible.")
+    call_parser.add_argument('--socket', default="", help="Path of the socket of the daemon.")
+
+    index_parser = commands.add_parser('index', help="Index the members of every archive in directories.")
+    index_parser.add_argument('database', help="Path to index database.")
+    index_parser.add_argument('roots', nargs='+', help="Directories or files to index.")
+    index_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help="Maximum amount of files to scan at the same time. Defaults to the amount of CPUs.")
+
+    find_parser = commands.add_parser('find', help="Find members in an index.")
+    find_parser.add_argument('database', help="Path to index database.")
+    find_group = find_parser.add_mutually_exclusive_group(required=True)
+    find_group.add_argument('--name', help="Name of the member. May contain the wildcards * and ?.")
+    find_group.add_argument('--hash', help="Content hash of the member.")
+    find_group.add_argument('--size', type=int, help="Size of the member.")
+
+    export_parser = commands.add_parser('export', help="Export the members of an FPS4 or Scenario file.")
+    export_parser.add_argument('filename', help="Path to FPS4 or Scenario file.")
+    export_parser.add_argument('output', help="Path to the written archive, or - to write it to standard output.")
+    export_parser.add_argument('--format', choices=['tar', 'zip'], default='tar', help="Format of the archive.")
+    export_parser.add_argument('--decompress', action='store_true', help="Decompress TLZC compressed members.")
+
+    batch_parser = commands.add_parser('batch', help="Run an operation over a directory tree with many workers.")
+    batch_commands = batch_parser.add_subparsers(dest='batch_command', required=True)
+
+    create_parser = batch_commands.add_parser('create', help="Split a directory tree into the shards of a job.")
+    create_parser.add_argument('job', help="Path to job directory, on a filesystem shared by every worker.")
+    create_parser.add_argument('op', choices=sorted(pipeline.OPERATIONS), help="Name of the operation.")
+    create_parser.add_argument('input', help="Directory of inputs.")
+    create_parser.add_argument('output', help="Directory where outputs will be saved.")
+    create_parser.add_argument('options', nargs='*', metavar='KEY=VALUE',
+                               help="Options of the operation. Values are parsed as JSON if possible.")
+    create_parser.add_argument('--pattern', default="**/*", help="Glob pattern of the inputs.")
+    create_parser.add_argument('--manifest-dir', default="", help="Directory where FPS4 manifests will be saved.")
+    create_parser.add_argument('--shard-size', type=int, default=16, help="Amount of inputs of every shard.")
+    create_parser.add_argument('--lease-timeout', type=float, default=300.0,
+                               help="Seconds after which the shard of an unresponsive worker is run again.")
+
+    work_parser = batch_commands.add_parser('work', help="Run shards of a job until none are left.")
+    work_parser.add_argument('job', help="Path to job directory.")
+    work_parser.add_argument('-j', '--jobs', type=int, default=None,
+                             help="Maximum amount of inputs to run at the same time. Defaults to the amount of CPUs.")
+    work_parser.add_argument('--worker-id', default="", help="Name of the worker. Defaults to the host and PID.")
+    work_parser.add_argument('--wait', action='store_true',
+                             help="Wait for shards of other workers, and take them over if they stop responding.")
+
+    status_parser = batch_commands.add_parser('status', help="Show the progress of a job.")
+    status_parser.add_argument('job', help="Path to job directory.")
+
+    merge_parser = batch_commands.add_parser('merge', help="Merge the results of a finished job.")
+    merge_parser.add_argument('job', help="Path to job directory.")
+
+    tune_parser = commands.add_parser('tune', help="Find the TLZC compression settings that suit data best.")
+    tune_commands = tune_parser.add_subparsers(dest='tune_command', required=True)
+
+    analyze_parser = tune_commands.add_parser('analyze', help="Report the size and speed of compression settings.")
+    analyze_parser.add_argument('paths', nargs='+', help="Files or directories to sample.")
+
+    tune_compress_parser = tune_commands.add_parser('compress', help="Compress a file with the best settings.")
+    tune_compress_parser.add_argument('filename', help="Path to file to compress.")
+    tune_compress_parser.add_argument('output', nargs='?', default="", help="Path to the compressed file.")
+    tune_compress_parser.add_argument('--target-ratio', type=float, default=None,
+                                      help="Maximum compressed size as a fraction of the file size.")
+    tune_compress_parser.add_argument('--time-budget', type=float, default=None,
+                                      help="Maximum CPU seconds compressing may take.")
+    tune_compress_parser.add_argument('--tolerance', type=float, default=0.01,
+                                      help="Fraction of the smallest size that is not worth spending time on.")
+
+    for subparser in (analyze_parser, tune_compress_parser):
+        subparser.add_argument('--type', dest='comp_types', nargs='+', choices=['deflate', 'zlib', 'lzma'],
+                               default=['zlib'], help="Compression types to try.")
+        subparser.add_argument('--thorough', action='store_true', help="Try many more settings.")
+        subparser.add_argument('--block-size', type=int, default=0x20000, help="Size of every sampled block.")
+        subparser.add_argument('--blocks', type=int, default=8, help="Maximum amount of sampled blocks.")
+        subparser.add_argument('-j', '--jobs', type=int, default=None,
+                               help="Maximum amount of threads. Defaults to the amount of CPUs.")
+
+    patch_parser = commands.add_parser('patch', help="Create or apply patches between versions of an archive.")
+    patch_commands = patch_parser.add_subparsers(dest='patch_command', required=True)
+
+    diff_parser = patch_commands.add_parser('diff', help="Create a patch from an FPS4 or Scenario file to a newer one.")
+    diff_parser.add_argument('source', help="Path to the file the patch will be applied to.")
+    diff_parser.add_argument('target', help="Path to the newer version of the file.")
+    diff_parser.add_argument('patch', help="Path to the created patch.")
+    diff_parser.add_argument('--index', default="",
+                             help="Path to an index of both files, so unchanged members are not read.")
+    diff_parser.add_argument('--no-delta', dest='delta', action='store_false',
+                             help="Store changed members whole, instead of their differences.")
+
+    apply_parser = patch_commands.add_parser('apply', help="Apply a patch to the file it was created for.")
+    apply_parser.add_argument('source', help="Path to the file the patch was created for.")
+    apply_parser.add_argument('patch', help="Path to patch.")
+    apply_parser.add_argument('output', help="Path to the patched file.")
+    apply_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help="Maximum amount of threads. Defaults to an amount adjusted to the throughput.")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.memory_budget:
+            memory.set_memory_budget(args.memory_budget)
+            # Processes started by the command use the same budget
+            os.environ['LIBVESPY_MEMORY_BUDGET'] = args.memory_budget
+
+        match args.command:
+            case 'build':
+                return build(args)
+            case 'daemon':
+                daemon.Daemon(args.socket, args.jobs, args.cache_entries, args.cache_dir).serve_forever()
+            case 'call':
+                return call(args)
+            case 'index':
+                with ArchiveIndex(args.database) as index:
+                    stats: dict[str, int] = index.update(args.roots, args.jobs)
+                print(f"{stats['scanned']} scanned, {stats['skipped']} skipped, {stats['removed']} removed")
+            case 'find':
+                return find(args)
+            case 'export':
+                if args.output == '-':
+                    export.export(args.filename, sys.stdout.buffer, args.format, args.decompress)
+                else:
+                    with open(args.output, 'wb') as f:
+                        export.export(args.filename, f, args.format, args.decompress)
+            case 'batch':
+                return run_batch(args)
+            case 'tune':
+                run_tune(args)
+            case 'patch':
+                run_patch(args)
+    except (pipeline.PipelineError, daemon.DaemonError, export.ExportError, batch.BatchError, tlzc.TLZCError,
+            memory.MemoryBudgetError, patch.PatchError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    return 0
+
+def build(args: argparse.Namespace) -> int:
+    state_file: str = args.state or os.path.join(os.path.dirname(os.path.abspath(args.pipeline)),
+                                                 '.libvespy-state.json')
+
+    steps: list[pipeline.Step] = pipeline.load(args.pipeline)
+    results = pipeline.build(steps, state_file, args.jobs, args.force, args.dry_run)
+
+    for step_id, status in results.items():
+        print(f"[{status.upper()}]\t{step_id}")
+
+    built: int = sum(1 for status in results.values() if status == 'built')
+    print(f"{built} built, {len(results) - built} skipped")
+
+    return 0
+
+def call(args: argparse.Namespace) -> int:
+    op_args: dict = parse_arguments(args.args)
+
+    with daemon.Client(args.socket) as client:
+        result = client.request(args.op, **op_args)
+
+    if result is not None:
+        print(json.dumps(result, indent=4))
+
+    return 0
+
+def parse_arguments(arguments: list[str]) -> dict:
+    parsed: dict = {}
+    for arg in arguments:
+        key, separator, value = arg.partition('=')
+        if not separator:
+            raise daemon.DaemonError(f"[ERROR]\tArgument {arg} is not in KEY=VALUE form.")
+
+        try:
+            parsed[key] = json.loads(value)
+        except json.JSONDecodeError:
+            parsed[key] = value
+
+    return parsed
+
+def run_batch(args: argparse.Namespace) -> int:
+    match args.batch_command:
+        case 'create':
+            job: batch.Job = batch.create(args.job, args.op, args.input, args.output, args.pattern, args.manifest_dir,
+                                          parse_arguments(args.options), args.shard_size, args.lease_timeout)
+            print(f"{job.shards} shards created")
+        case 'work':
+            print(f"{batch.work(args.job, args.worker_id, args.jobs, wait=args.wait)} shards run")
+        case 'status':
+            counts: dict[str, int] = batch.status(args.job)
+            print(", ".join(f"{count} {name}" for name, count in counts.items()))
+        case 'merge':
+            merged: dict = batch.merge(args.job)
+            print(f"{merged['built']} built, {merged['failed']} failed")
+            for task in merged['tasks']:
+                if task['status'] == 'failed':
+                    print(f"[FAILED]\t{task['input']}: {task['error']}", file=sys.stderr)
+
+            return 1 if merged['failed'] else 0
+
+    return 0
+
+def run_tune(args: argparse.Namespace):
+    candidates: list[tune.Settings] = tune.get_candidates(args.comp_types, args.thorough)
+
+    if args.tune_command == 'analyze':
+        print(tune.format_report(tune.analyze(args.paths, candidates, args.block_size, args.blocks, args.jobs)))
+        return
+
+    picked: tune.Measurement = tune.compress(args.filename, args.output, args.comp_types, args.target_ratio,
+                                             args.time_budget, args.tolerance, args.thorough, args.block_size,
+                                             args.blocks, args.jobs)
+    print(f"{picked.settings.name} ({picked.ratio:.2%} of sampled size, {picked.throughput / 0x100000:.1f} MiB/s)")
+
+def run_patch(args: argparse.Namespace):
+    if args.patch_command == 'apply':
+        size: int = patch.apply(args.source, args.patch, args.output, args.jobs)
+        print(f"{size} bytes written")
+        return
+
+    if args.index:
+        with ArchiveIndex(args.index) as index:
+            stats: dict[str, int] = patch.diff(args.source, args.target, args.patch, index, args.delta)
+    else:
+        stats = patch.diff(args.source, args.target, args.patch, delta=args.delta)
+
+    print(f"{stats['unchanged']} unchanged, {stats['changed']} changed, {stats['added']} added, "
+          f"{stats['removed']} removed, {stats['size']} bytes")
+
+def find(args: argparse.Namespace) -> int:
+    with ArchiveIndex(args.database) as index:
+        if args.name is not None:
+            members = index.find_by_name(args.name)
+        elif args.hash is not None:
+            members = index.find_by_hash(args.hash)
+        else:
+            members = index.find_by_size(args.size)
+
+    for member in members:
+        print(f"{member.container}\t{member.index}\t{member.offset:#x}\t{member.size}\t{member.hash}\t{member.name}")
+
+    return 0 if members else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+from typing import Any, Callable
+import socketserver
+import threading
+import tempfile
+import socket
+import json
+import os
+
+from libvespy.cache import HeaderCache, PersistentHeaderCache
+from libvespy.parallel import default_workers
+from libvespy import fps4, tlzc, scenario
+
+
+def default_socket_path() -> str:
+    base_dir: str = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base_dir, f"libvespy-{os.getuid()}.sock")
+
+
+class Daemon:
+    """
+    Long-running server that runs library operations for clients connected over a Unix socket.
+
+    Keeping the interpreter and its imports alive avoids paying the startup cost for every file, and parsed FPS4
+    headers are cached between jobs. Jobs run on threads of the daemon, so that they share the header cache.
+
+    Requests and responses are JSON objects, one per line. A request holds the name of an operation in "op", its
+    arguments in "args", and optionally an "id" that is returned in the response. A response holds "ok", and
+    either the "result" of the operation or an "error" message. A connection can be used for any amount of requests.
+    """
+
+    def __init__(self, socket_path: str = "", max_jobs: int | None = None, cache_entries: int = 256,
+                 cache_dir: str = ""):
+        """
+        :param socket_path: Path of the socket to listen on. Defaults to default_socket_path().
+        :param max_jobs: The maximum amount of jobs that can run at the same time. Defaults to the amount of CPUs.
+            Requests over the limit wait until a running job finishes.
+        :param cache_entries: The maximum amount of parsed headers to cache.
+        :param cache_dir: If specified, directory where parsed headers are also cached on disk, so that they are kept
+            when the daemon is restarted.
+        """
+
+        self.socket_path: str = socket_path or default_socket_path()
+        self.max_jobs: int = max_jobs or default_workers()
+        self.cache: HeaderCache = PersistentHeaderCache(cache_dir, max_entries=cache_entries) if cache_dir \
+            else HeaderCache(cache_entries)
+        self.running: int = 0
+        self.completed: int = 0
+
+        self._slots = threading.BoundedSemaphore(self.max_jobs)
+        self._lock = threading.Lock()
+        self._server: socketserver.ThreadingUnixStreamServer | None = None
+
+        # Operations that only report on the daemon itself, which do not take a job slot
+        self.control: dict[str, Callable[..., Any]] = {
+            'ping': lambda: {'pid': os.getpid()},
+            'stats': self.stats,
+            'shutdown': self.shutdown,
+        }
+
+        self.jobs: dict[str, Callable[..., Any]] = {
+            'fps4.extract': self._fps4_extract,
+            'fps4.pack': self._fps4_pack,
+            'fps4.overlay': self._fps4_overlay,
+            'fps4.transcode': fps4.transcode,
+            'fps4.list': self._fps4_list,
+            'fps4.read': self._fps4_read,
+            'tlzc.compress': tlzc.compress,
+            'tlzc.decompress': tlzc.decompress,
+            'scenario.extract': scenario.extract,
+            'scenario.pack': scenario.pack,
+        }
+
+    def serve_forever(self):
+        """Listen on the socket until a shutdown request is received."""
+
+        # Replace a socket left behind by a daemon that did not exit cleanly, but never one that is still in use
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.remove(self.socket_path)
+            else:
+                raise DaemonError(f"[ERROR]\tA daemon is already listening on {self.socket_path}.")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip(): continue
+                    self.wfile.write(json.dumps(daemon.handle(line)).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self) -> dict:
+        # Stopping has to happen outside the thread serving the request, or it would wait for itself
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown).start()
+
+        return {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'running': self.running, 'completed': self.completed, 'max_jobs': self.max_jobs,
+                    'cache': self.cache.stats()}
+
+    def handle(self, line: bytes) -> dict:
+        """
+        Run a single request.
+
+        :param line: Request as a line of JSON.
+        :return: Response
+        """
+
+        request_id: Any = None
+        try:
+            request: dict = json.loads(line)
+            request_id = request.get('id')
+            op: str = request.get('op', '')
+            args: dict = request.get('args', {})
+
+            if op in self.control:
+                return {'id': request_id, 'ok': True, 'result': self.control[op](**args)}
+            if op not in self.jobs:
+                raise DaemonError(f"[ERROR]\tUnknown operation \"{op}\".")
+
+            with self._slots:
+                with self._lock:
+                    self.running += 1
+                try:
+                    result: Any = self.jobs[op](**args)
+                finally:
+                    with self._lock:
+                        self.running -= 1
+                        self.completed += 1
+
+            return {'id': request_id, 'ok': True, 'result': result}
+        except Exception as e:
+            return {'id': request_id, 'ok': False, 'error': str(e) or type(e).__name__}
+
+    def _fps4_extract(self, filename: str, out_dir: str = "", manifest_dir: str = "", ignore_metadata: bool = False,
+                      max_threads: int | None = None, members: dict | None = None, io_strategy: str = 'mmap',
+                      memory_budget: int | str | None = None) -> dict:
+        return fps4.extract(filename, out_dir, manifest_dir, ignore_metadata, max_threads, cache=self.cache,
+                            members=fps4.MemberFilter(**members) if members is not None else None,
+                            io_strategy=io_strategy, memory_budget=memory_budget)
+
+    def _fps4_pack(self, output: str, manifest_file: str = "", manifest_data: dict = "", max_threads: int | None = None,
+                   compress: str | None = None, compress_members: dict | None = None, max_workers: int | None = None,
+                   io_strategy: str = 'mmap', memory_budget: int | str | None = None, optimize_layout: bool = False,
+                   groups: list[dict] | None = None) -> dict[str, int]:
+        layout: fps4.MemberLayout = fps4.pack_from_manifest(
+            output, manifest_file, manifest_data, max_threads, compress=compress,
+            compress_members=fps4.MemberFilter(**compress_members) if compress_members else None,
+            max_workers=max_workers, io_strategy=io_strategy, memory_budget=memory_budget,
+            optimize_layout=optimize_layout,
+            groups=[fps4.MemberFilter(**group) for group in groups] if groups is not None else None)
+
+        return {'size': layout.end, 'saved': layout.saved, 'shared': len(layout.shared)}
+
+    def _fps4_overlay(self, base: str, output: str, replacements: dict[str, str],
+                      max_threads: int | None = None) -> int:
+        # JSON objects only have string keys, so members can also be replaced by their index as a string
+        fps4.pack_overlay(base, output, {int(k) if k.isdigit() else k: v for k, v in replacements.items()},
+                          max_threads)
+
+        return os.path.getsize(output)
+
+    def _fps4_list(self, filename: str) -> list[dict]:
+        with fps4.open_archive(filename, cache=self.cache) as archive:
+            return [file.generate_manifest() for file in archive.files]
+
+    def _fps4_read(self, filename: str, index: int, output: str) -> int:
+        with fps4.open_archive(filename, cache=self.cache) as archive:
+            data: bytes = archive.read(index)
+
+        with open(output, "wb") as f:
+            size: int = f.write(data)
+            f.flush()
+            f.close()
+
+        return size
+
+
+class Client:
+    """
+    Connection to a running daemon.
+
+    The connection is kept open between requests, so that many small jobs can be sent without reconnecting.
+    """
+
+    def __init__(self, socket_path: str = "", timeout: float | None = None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(socket_path or default_socket_path())
+        except OSError:
+            self.socket.close()
+            raise
+
+        self.file = self.socket.makefile('rwb')
+        self._request_id: int = 0
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def request(self, op: str, **args) -> Any:
+        """
+        Run an operation on the daemon and wait for its result.
+
+        :param op: Name of the operation, such as 'fps4.extract' or 'tlzc.compress'.
+        :param args: Arguments of the operation.
+        :return: Result of the operation
+        """
+
+        self._request_id += 1
+        self.file.write(json.dumps({'id': self._request_id, 'op': op, 'args': args}).encode('utf-8') + b'\n')
+        self.file.flush()
+
+        line: bytes = self.file.readline()
+        if not line:
+            raise DaemonError("[ERROR]\tThe daemon closed the connection.")
+
+        response: dict = json.loads(line)
+        if not response.get('ok'):
+            raise DaemonError(response.get('error', ''))
+
+        return response.get('result')
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+class DaemonError(Exception):
+    """"""
@@ -0,0 +1,188 @@
+from typing import BinaryIO, Iterator, Literal
+import tarfile
+import zipfile
+import traceback
+import ctypes
+import time
+import os
+
+from libvespy.structs import ScenarioHeader, ScenarioEntry, TLZCHeader
+from libvespy.utils import ArchiveReader
+from libvespy.instrument import Observer, stage
+from libvespy import fps4, tlzc
+
+# Members are written in pieces of at most this size, so memory use does not depend on the size of members
+CHUNK_SIZE: int = 0x100000
+
+
+def export(filename: str, stream: BinaryIO, archive_format: Literal['tar', 'zip'] = 'tar',
+           decompress: bool = False, ignore_metadata: bool = False, observer: Observer | None = None) -> int:
+    """
+    Export the members of an FPS4 or Scenario file into a tar or zip archive, without extracting them first.
+
+    Members are copied straight from the mapping of the file to the stream, and TLZC compressed members are
+    decompressed piece by piece, so only a small amount of data is held in memory at a time. The stream does not have
+    to be seekable, so the archive can be written directly to a socket or a pipe. Zip archives are not compressed.
+
+    :param filename: Path to FPS4 or Scenario file.
+    :param stream: Binary stream the archive will be written to. It is left open.
+    :param archive_format: Format of the written archive.
+    :param decompress: If TLZC compressed members should be decompressed while they are exported.
+    :param ignore_metadata: (FPS4 Only) If FPS4 metadata should be ignored when naming members.
+    :param observer: If specified, receives an event for every exported member.
+    :return: Amount of exported members
+    """
+
+    if archive_format not in ('tar', 'zip'):
+        raise ExportError(f"[ERROR]\tUnsupported archive format: {archive_format}")
+
+    with ArchiveReader.open(filename) as reader:
+        mtime: float = os.fstat(reader.file.fileno()).st_mtime
+
+        magic: bytes = reader.read(0, 8)
+        if magic[:4] == b'FPS4':
+            members: list[tuple[str, int, int]] = get_fps4_members(reader, filename, ignore_metadata)
+        elif magic == b'TO8SCEL\x00':
+            members = get_scenario_members(reader)
+        else:
+            raise ExportError(f"[ERROR]\t{filename} is not an FPS4 or Scenario file.")
+
+        with memoryview(reader.buffer) as view:
+            writer = TarWriter(stream) if archive_format == 'tar' else ZipWriter(stream)
+            for index, (name, offset, size) in enumerate(members):
+                with stage(observer, 'export', 'member', name, index) as record:
+                    content = view[offset:offset + size]
+                    try:
+                        size, chunks = open_member(content, decompress)
+                        writer.add(name, size, mtime, chunks)
+                        record.bytes = size
+                    except BaseException as e:
+                        # The mapping can only be closed once no views of it are left, including the ones held by
+                        # the frames of the exception
+                        traceback.clear_frames(e.__traceback__)
+                        raise
+                    finally:
+                        chunks = None
+                        content.release()
+
+            writer.close()
+
+    return len(members)
+
+def get_fps4_members(reader: ArchiveReader, filename: str = "",
+                     ignore_metadata: bool = False) -> list[tuple[str, int, int]]:
+    """
+    :return: Name, absolute address and size of every member of an FPS4 file that has data
+    """
+
+    archive = fps4.FPS4Archive(reader, filename)
+
+    members: list[tuple[str, int, int]] = []
+    for file in archive.files:
+        member_range: tuple[int, int] | None = archive.get_member_range(file.index)
+        if member_range is None: continue
+
+        path, name = file.estimate_file_path(ignore_metadata)
+        members.append((name if path is None else f"{path}/{name}", *member_range))
+
+    return members
+
+def get_scenario_members(reader: ArchiveReader) -> list[tuple[str, int, int]]:
+    """
+    :return: Name, absolute address and size of every member of a Scenario file that has data, named like extracted
+        files
+    """
+
+    header = ScenarioHeader.from_buffer_copy(reader.read(0, ctypes.sizeof(ScenarioHeader)))
+
+    members: list[tuple[str, int, int]] = []
+    for e in range(header.file_count):
+        entry = ScenarioEntry.from_buffer_copy(reader.read(0x20 + e * 0x20, ctypes.sizeof(ScenarioEntry)))
+        if not entry.file_size_compressed: continue
+
+        members.append((str(e), entry.offset + header.file_offset, entry.file_size_compressed))
+
+    return members
+
+def open_member(content: memoryview, decompress: bool = False) -> tuple[int, Iterator[bytes | memoryview]]:
+    """
+    :param content: Data of the member.
+    :param decompress: If the member should be decompressed if it is TLZC compressed.
+    :return: Size of the exported member, and an iterator over its data
+    """
+
+    if not decompress or content[:4] != b'TLZC':
+        return len(content), (content[position:position + CHUNK_SIZE] for position in range(0, len(content),
+                                                                                             CHUNK_SIZE))
+
+    header = TLZCHeader.from_buffer_copy(content[:ctypes.sizeof(TLZCHeader)])
+    return header.file_size_uncompressed, tlzc.decompress_stream(content, chunk_size=CHUNK_SIZE)
+
+
+class TarWriter:
+    """Writer of tar archives into a stream, writing member data as it is given instead of copying it."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream: BinaryIO = stream
+        self.written: int = 0
+
+    def add(self, name: str, size: int, mtime: float, chunks: Iterator[bytes | memoryview]):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+
+        self._write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+        written: int = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > size:
+                raise ExportError(f"[ERROR]\tMember {name} is larger than its reported size.")
+            self._write(chunk)
+
+        if written != size:
+            raise ExportError(f"[ERROR]\tMember {name} is smaller than its reported size.")
+
+        # Data is padded to a full block
+        self._write(bytes(-size % tarfile.BLOCKSIZE))
+
+    def close(self):
+        # Two empty blocks end the archive, which is then padded to a full record like tarfile does
+        self._write(bytes(tarfile.BLOCKSIZE * 2))
+        self._write(bytes(-self.written % tarfile.RECORDSIZE))
+        self.stream.flush()
+
+    def _write(self, data: bytes | memoryview):
+        self.stream.write(data)
+        self.written += len(data)
+
+
+class ZipWriter:
+    """Writer of uncompressed zip archives into a stream, which does not have to be seekable."""
+
+    def __init__(self, stream: BinaryIO):
+        self.archive = zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED)
+
+    def add(self, name: str, size: int, mtime: float, chunks: Iterator[bytes | memoryview]):
+        # Zip dates can not be older than 1980
+        date_time: tuple = time.localtime(mtime)[:6]
+        info = zipfile.ZipInfo(name, date_time if date_time[0] >= 1980 else (1980, 1, 1, 0, 0, 0))
+        info.file_size = size
+
+        # The size is known in advance, so zip64 is only used for members that need it
+        written: int = 0
+        with self.archive.open(info, 'w') as f:
+            for chunk in chunks:
+                written += len(chunk)
+                f.write(chunk)
+
+        if written != size:
+            raise ExportError(f"[ERROR]\tMember {name} does not match its reported size.")
+
+    def close(self):
+        self.archive.close()
+
+
+class ExportError(Exception):
+    """"""
@@ -1,128 +1,141 @@
-from typing import Literal
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Literal, NamedTuple, Sequence
+import fnmatch
 import ctypes
 import json
-import mmap
 import sys
 import os
 
-from libvespy import utils
-from libvespy.structs import FPS4FileData, FPS4
+from libvespy import tlzc, utils
+from libvespy.instrument import Observer, stage
+from libvespy.parallel import schedule
+from libvespy.memory import MemoryBudget, create_spill_file, get_memory_budget, spill
+from libvespy.structs import FPS4ContentData, FPS4FileData, FPS4EntryTable, FPS4EntryView, FPS4
+from libvespy.cache import HeaderCache
 
 
-def extract(filename: str, out_dir: str = "", manifest_dir: str = "", ignore_metadata: bool = False):
+def extract(filename: str, out_dir: str = "", manifest_dir: str = "", ignore_metadata: bool = False,
+            max_threads: int | None = None, observer: Observer | None = None, cache: HeaderCache | None = None,
+            members: 'MemberFilter | None' = None, io_strategy: utils.IOStrategy = 'mmap',
+            memory_budget: MemoryBudget | int | str | None = None):
     """
     Extract contents of FPS4 file.
 
+    If only some members are extracted, the manifest still describes the whole file. Members that were not extracted
+    are copied from the FPS4 file when packing, as long as it is not modified.
+
+    Members are read in the order they are stored in, even if the file entries list them in a different order, and
+    the kernel is told to read ahead of the members being extracted and to drop the ones that are done.
+
     :param filename: Path to FPS4 file.
     :param out_dir: Path to where the extracted files will be saved.
     :param manifest_dir: If specified, path to where the general data of the FPS4 file will be saved.
     :param ignore_metadata: If FPS4 metadata should be ignored
+    :param max_threads: If specified, the amount of threads used for writing extracted files. Otherwise, it starts
+        from the storage of out_dir and is adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the extraction.
+    :param cache: If specified, cache to look up and store the parsed header in.
+    :param members: If specified, only the members matching this filter are extracted.
+    :param io_strategy: How the FPS4 file is read. See utils.IOStrategy.
+    :param memory_budget: If specified, budget of the extraction, shared by the members extracted at the same time.
+        Members that do not fit into it are written in chunks. See memory.get_memory_budget.
     :return: Manifest data
     """
 
+    budget: MemoryBudget = get_memory_budget(memory_budget)
+
     if not out_dir:
         out_dir = f"{filename}.ext"
         if not os.path.isdir(out_dir):
             os.makedirs(out_dir)
 
-    byteorder: Literal['little', 'big'] = sys.byteorder
+    # Files of a previous extraction that were not modified since do not have to be written again
+    previous: dict[str, dict] = load_previous_members(manifest_dir) if manifest_dir else {}
 
-    manifest: dict = {}
+    with open_archive(filename, observer=observer, cache=cache, io_strategy=io_strategy) as archive:
+        manifest, extracted_files = plan_extraction(archive, out_dir, ignore_metadata, members)
 
-    with open(filename, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        # Reading members in the order they are stored in keeps the reads sequential
+        if not archive.fps4.is_linear():
+            extracted_files.sort(key=lambda ef: ef[2])
 
-        mm.seek(0)
-        # Check Magic Number
-        if mm.read(4) != 'FPS4'.encode('ascii'):
-            raise FPS4Error(f"[ERROR]\t{filename} is not a valid FPS4 file.")
+        archive.reader.advise('sequential')
 
-        # Use the correct byteorder version of the Header structure
-        mm.seek(0)
-        fps4 = FPS4.from_buffer_copy(mm.read(ctypes.sizeof(FPS4)))
-        if byteorder == 'little' and fps4.little.header_size > 0xFFFF:
-            fps4.set_byteorder('big')
-        elif byteorder == 'big' and fps4.big.header_size > 0xFFFF:
-            fps4.set_byteorder('little')
-        else:
-            fps4.set_byteorder(byteorder)
+        def _extract_file(order: int, index: int, path: str, address: int, size: int) -> dict:
+            # Workers take members in order, so the member after the ones being extracted is the next one needed
+            if order + executor.workers < len(extracted_files):
+                archive.reader.advise('willneed', *extracted_files[order + executor.workers][2:])
 
-        # Get other data
-        mm.seek(fps4.data.archive_name_address)
-        fps4.archive_name = utils.read_null_terminated_string(mm, 'shift-jis', reset_position=False)
-        fps4.file_size = mm.size()
+            with stage(observer, 'fps4.extract', 'member', path, index) as record:
+                member: dict = extract_member(archive, path, address, size, previous.get(os.path.abspath(path)),
+                                              budget)
+                record.bytes = size if member['written'] else 0
 
-        # Get Files in Archive
-        for e in range(fps4.data.file_entries):
-            mm.seek(fps4.data.header_size + (e * fps4.data.entry_size))
-            fps4.files.append(FPS4FileData(mm, e, fps4.content_data, fps4.byteorder))
+            archive.reader.advise('dontneed', address, size)
 
-        # Finalize remaining data
-        fps4.finalize()
+            return member
 
-        # Prepare Extraction
-        manifest = fps4.generate_base_manifest()
-
-        first_file_position: int = 0xffffffffffffffff
-        estimated_alignment: int = 0xffffffffffffffff
-        is_sector_and_file_size_same: bool = fps4.content_data.has_file_sizes and fps4.content_data.has_sector_sizes
-        has_valid_file: bool = False
-
-        # Extract
-        file_data: list[dict] = []
-        for file in fps4.files:
-            file_size: int | None = file.estimate_file_size(fps4.files)
-
-            has_valid_file = True
-            file_manifest: dict = file.generate_manifest()
-            #{k: v for k, v in file.__dict__.items() if v is not None}
-
-            if not file.skippable:
-                if not file.address:
-                    raise FPS4Error("[ERROR]\tFPS4 file may be malformed. "
-                                    "File does not contain file entry start pointer.")
-                if file_size is None:
-                    raise FPS4Error("[ERROR]\tFPS4 file may be malformed. "
-                                    "File does not contain file size data.")
-
-                file_address: int = file.address * fps4.file_location_multiplier
-                first_file_position = min(first_file_position, file_address)
-                estimated_alignment = estimated_alignment & ~file_address
-                path, archived_filename = file.estimate_file_path(ignore_metadata)
-
-                base_out_dir: str = out_dir
-
-                if path is not None:
-                    base_out_dir = os.path.join(base_out_dir, path)
-                    if not os.path.isdir(base_out_dir):
-                        os.makedirs(base_out_dir)
-                else:
-                    base_out_dir = archived_filename
+        with schedule('io', max_threads, out_dir, len(extracted_files)) as executor:
+            futures = [executor.submit_weighted(ef[3], _extract_file, order, *ef)
+                       for order, ef in enumerate(extracted_files)]
+            for ef, future in zip(extracted_files, futures):
+                record_member(manifest['files'][ef[0]], future.result())
+
+        record_source(manifest, archive)
+
+    # Generate Manifest
+    if manifest_dir:
+        save_manifest(manifest, manifest_dir, observer)
 
-                full_out_dir: str = os.path.join(out_dir, base_out_dir)
-                file_manifest['path'] = os.path.abspath(full_out_dir)
+    return manifest
 
-                mm.seek(file_address)
-                contents: bytes = mm.read(file_size)
+def generate_archive_manifest(archive: 'FPS4Archive') -> tuple[dict, list[tuple[int, int, int]]]:
+    """
+    Generate the manifest of an FPS4 file, without paths of extracted members.
 
-                if not os.path.isdir(os.path.dirname(full_out_dir)):
-                    os.makedirs(os.path.dirname(full_out_dir))
+    :param archive: Opened FPS4 file.
+    :return: Manifest data, and the index, absolute address and size of every member that has data
+    """
 
-                with open(full_out_dir, "w+b") as af:
-                    af.truncate(len(contents))
-                    mf = mmap.mmap(af.fileno(), 0, prot=mmap.PROT_WRITE)
+    fps4: FPS4 = archive.fps4
 
-                    mf.resize(len(contents))
-                    mf.write(contents)
+    manifest: dict = fps4.generate_base_manifest()
 
-                    mf.flush()
-                    mf.close()
-                    af.close()
+    first_file_position: int = 0xffffffffffffffff
+    estimated_alignment: int = 0xffffffffffffffff
+    is_sector_and_file_size_same: bool = fps4.content_data.has_file_sizes and fps4.content_data.has_sector_sizes
+    has_valid_file: bool = False
 
-            file_data.append(file_manifest)
+    file_data: list[dict] = []
+    members: list[tuple[int, int, int]] = []
+    for file in fps4.files:
+        file_size: int | None = file.estimate_file_size(fps4.files)
 
-        mm.close()
-        f.close()
+        has_valid_file = True
+        file_manifest: dict = file.generate_manifest()
+        #{k: v for k, v in file.__dict__.items() if v is not None}
+
+        if not file.skippable:
+            if not file.address:
+                raise FPS4Error("[ERROR]\tFPS4 file may be malformed. "
+                                "File does not contain file entry start pointer.")
+            if file_size is None and file.index == len(fps4.files) - 1 and \
+                    file.address * fps4.file_location_multiplier >= max((a + s for _, a, s in members), default=0):
+                # Terminating entry, which only points to the end of the members
+                file_data.append(file_manifest)
+                continue
+            if file_size is None:
+                raise FPS4Error("[ERROR]\tFPS4 file may be malformed. "
+                                "File does not contain file size data.")
+
+            file_address: int = file.address * fps4.file_location_multiplier
+            first_file_position = min(first_file_position, file_address)
+            estimated_alignment = estimated_alignment & ~file_address
+
+            members.append((file.index, file_address, file_size))
+
+        file_data.append(file_manifest)
 
     # More Metadata
     alignment: int = utils.get_alignment_from_lowest_unset_bit(estimated_alignment)
@@ -137,26 +150,309 @@ def extract(filename: str, out_dir: str = "", manifest_dir: str = "", ignore_met
     manifest['set_sector_size_as_file_size'] = has_valid_file and is_sector_and_file_size_same
     manifest['files'] = file_data
 
-    # Generate Manifest
-    if manifest_dir:
-        if not os.path.isdir(os.path.dirname(manifest_dir)):
-            os.makedirs(os.path.dirname(manifest_dir))
-        with open(manifest_dir, "w") as f:
-            json.dump(manifest, f, indent=4)
+    return manifest, members
+
+def plan_extraction(archive: 'FPS4Archive', out_dir: str, ignore_metadata: bool = False,
+                    member_filter: 'MemberFilter | None' = None) -> tuple[dict, list[tuple[int, str, int, int]]]:
+    """
+    Generate the manifest of an FPS4 file and decide where each of its members will be extracted to, creating the
+    directories they will be extracted into.
+
+    :param archive: Opened FPS4 file.
+    :param out_dir: Path to where the extracted files will be saved.
+    :param ignore_metadata: If FPS4 metadata should be ignored
+    :param member_filter: If specified, only the members matching this filter are extracted. The others are given
+        the location of their data in the FPS4 file instead of a path.
+    :return: Manifest data, and the index, output path, absolute address and size of every member to extract
+    """
+
+    manifest, members = generate_archive_manifest(archive)
+
+    extracted_files: list[tuple[int, str, int, int]] = []
+    for index, file_address, file_size in members:
+        path, archived_filename = archive.fps4.files[index].estimate_file_path(ignore_metadata)
+
+        if member_filter is not None and \
+                not member_filter.matches(index, path, archived_filename, manifest['files'][index], file_size):
+            manifest['files'][index]['source_address'] = file_address
+            manifest['files'][index]['source_size'] = file_size
+            continue
+
+        base_out_dir: str = out_dir
+
+        if path is not None:
+            base_out_dir = os.path.join(base_out_dir, path)
+            if not os.path.isdir(base_out_dir):
+                os.makedirs(base_out_dir)
+        else:
+            base_out_dir = archived_filename
+
+        full_out_dir: str = os.path.join(out_dir, base_out_dir)
+        manifest['files'][index]['path'] = os.path.abspath(full_out_dir)
+
+        if not os.path.isdir(os.path.dirname(full_out_dir)):
+            os.makedirs(os.path.dirname(full_out_dir))
+
+        extracted_files.append((index, full_out_dir, file_address, file_size))
+
+    return manifest, extracted_files
+
+def extract_member(archive: 'FPS4Archive', path: str, address: int, size: int,
+                   previous: dict | None = None, budget: MemoryBudget | None = None) -> dict:
+    """
+    Write a member of an FPS4 file, and hash its contents in the same pass.
+
+    :param archive: Opened FPS4 file.
+    :param path: Path to where the member will be saved.
+    :param address: Absolute address of the member.
+    :param size: Size of the member.
+    :param previous: If specified, manifest data of the member from a previous extraction to the same path. The member
+        is not written again if its contents and the file of the previous extraction are both unchanged.
+    :param budget: If specified, budget the member is read with. Members that do not fit into it are hashed and
+        written in chunks. Defaults to the budget set by memory.set_memory_budget.
+    :return: Content hash, address, size and modification time of the member, and if it was written
+    """
+
+    budget = get_memory_budget(budget)
+
+    if not budget.fits(size):
+        with budget.reserve(budget.chunk_size):
+            if previous is None:
+                # Nothing decides if the member is written, so it is hashed while it is written
+                with open(path, "wb") as af:
+                    content_hash: str = utils.hash_chunks(
+                        utils.write_chunks(af, archive.reader.read_chunks(address, size, budget.chunk_size)))
+
+                    af.flush()
+                    af.close()
+
+                return {'hash': content_hash, 'source_address': address, 'source_size': size, 'written': True,
+                        'mtime_ns': os.stat(path).st_mtime_ns}
+
+            # The hash decides if the member is written, so members that do not fit are read once for each
+            member: dict = {'hash': utils.hash_chunks(archive.reader.read_chunks(address, size, budget.chunk_size)),
+                            'source_address': address, 'source_size': size, 'written': True}
 
-            f.flush()
+            if previous.get('hash') == member['hash'] and is_member_unchanged(path, previous):
+                member['written'] = False
+            else:
+                with open(path, "wb") as af:
+                    for chunk in archive.reader.read_chunks(address, size, budget.chunk_size):
+                        af.write(chunk)
+
+                    af.flush()
+                    af.close()
+
+        member['mtime_ns'] = os.stat(path).st_mtime_ns
+        return member
+
+    with budget.reserve(size):
+        data: bytes = archive.reader.read(address, size)
+        member: dict = {'hash': utils.hash_data(data), 'source_address': address, 'source_size': size, 'written': True}
+
+        if previous is not None and previous.get('hash') == member['hash'] and is_member_unchanged(path, previous):
+            member['written'] = False
+        else:
+            with open(path, "wb") as af:
+                af.write(data)
+
+                af.flush()
+                af.close()
+
+    member['mtime_ns'] = os.stat(path).st_mtime_ns
+    return member
+
+def record_member(file_manifest: dict, member: dict):
+    """Add the hash and location of an extracted member to its manifest data."""
+    file_manifest['hash'] = member['hash']
+    file_manifest['mtime_ns'] = member['mtime_ns']
+    file_manifest['source_address'] = member['source_address']
+    file_manifest['source_size'] = member['source_size']
+
+def record_source(manifest: dict, archive: 'FPS4Archive'):
+    """Add the identity of the extracted FPS4 file to its manifest data, so that packing can reuse its contents."""
+    if archive.reader.file is None:
+        return
+
+    stat: os.stat_result = os.fstat(archive.reader.file.fileno())
+    manifest['source'] = {
+        'path': os.path.abspath(archive.filename),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def is_member_unchanged(path: str, file_manifest: dict) -> bool:
+    """
+    Check if an extracted member is unchanged since it was extracted, without reading it.
+
+    :param path: Path to the extracted member.
+    :param file_manifest: Manifest data of the member.
+    :return: If the size and modification time of the member match the ones recorded at extraction
+    """
+
+    if file_manifest.get('mtime_ns') is None:
+        return False
+
+    try:
+        stat: os.stat_result = os.stat(path)
+    except OSError:
+        return False
+
+    return stat.st_size == file_manifest.get('source_size') and stat.st_mtime_ns == file_manifest['mtime_ns']
+
+def load_previous_members(manifest_dir: str) -> dict[str, dict]:
+    """
+    :param manifest_dir: Path to the manifest of a previous extraction.
+    :return: Manifest data of every extracted member, by path. Empty if there is no readable manifest.
+    """
+
+    if not os.path.isfile(manifest_dir):
+        return {}
+
+    try:
+        with open(manifest_dir, "r") as f:
+            manifest: dict = json.load(f)
             f.close()
+    except (OSError, ValueError):
+        return {}
 
-    return manifest
+    return {file['path']: file for file in manifest.get('files', []) if isinstance(file, dict) and file.get('path')}
+
+def save_manifest(manifest: dict, manifest_dir: str, observer: Observer | None = None):
+    """
+    Save manifest data of an extracted FPS4 file.
+
+    :param manifest: Manifest data.
+    :param manifest_dir: Path to where the manifest will be saved.
+    :param observer: If specified, receives an event once the manifest is written.
+    :return: None
+    """
+
+    if not os.path.isdir(os.path.dirname(manifest_dir)):
+        os.makedirs(os.path.dirname(manifest_dir))
+    with stage(observer, 'fps4.extract', 'write', manifest_dir) as record, open(manifest_dir, "w") as f:
+        json.dump(manifest, f, indent=4)
+        record.bytes = f.tell()
+
+        f.flush()
+        f.close()
+
+def open_archive(filename: str, columnar: bool = False, observer: Observer | None = None,
+                 cache: HeaderCache | None = None, io_strategy: utils.IOStrategy = 'mmap') -> 'FPS4Archive':
+    """
+    Open an FPS4 file for reading its members.
+
+    :param filename: Path to FPS4 file.
+    :param columnar: If the file entries should be stored in a compact FPS4EntryTable.
+    :param observer: If specified, receives events for parsing the header and file entries.
+    :param cache: If specified, cache to look up and store the parsed header in.
+    :param io_strategy: How the FPS4 file is read. See utils.IOStrategy.
+    :return: Opened archive
+    """
+
+    reader = utils.ArchiveReader.open(filename, io_strategy)
+    try:
+        if cache is None:
+            return FPS4Archive(reader, filename, columnar, observer)
+
+        # Key by the opened file, so the header always matches the mapped contents
+        key: tuple = cache.get_key(filename, os.fstat(reader.file.fileno()), columnar)
+        fps4: FPS4 | None = cache.get(key)
+        archive = FPS4Archive(reader, filename, columnar, observer, fps4)
+        if fps4 is None:
+            cache.put(key, archive.fps4)
+
+        return archive
+    except Exception:
+        reader.close()
+        raise
+
+def read_header(reader: utils.ArchiveReader, filename: str = "", columnar: bool = False,
+                observer: Observer | None = None) -> FPS4:
+    """
+    Parse the header and file entries of an FPS4 file.
+
+    :param reader: Reader of the FPS4 file.
+    :param filename: Name of the FPS4 file, used for error messages.
+    :param columnar: If the file entries should be stored in a compact FPS4EntryTable instead of a list of
+        FPS4FileData.
+    :param observer: If specified, receives events for parsing the header and file entries.
+    :return: FPS4 header data
+    """
+
+    byteorder: Literal['little', 'big'] = sys.byteorder
+
+    with stage(observer, 'fps4.read', 'header', filename) as record:
+        # Check Magic Number
+        if reader.read(0, 4) != 'FPS4'.encode('ascii'):
+            raise FPS4Error(f"[ERROR]\t{filename} is not a valid FPS4 file.")
+
+        # Use the correct byteorder version of the Header structure
+        fps4 = FPS4.from_buffer_copy(reader.read(0, ctypes.sizeof(FPS4)))
+        if byteorder == 'little' and fps4.little.header_size > 0xFFFF:
+            fps4.set_byteorder('big')
+        elif byteorder == 'big' and fps4.big.header_size > 0xFFFF:
+            fps4.set_byteorder('little')
+        else:
+            fps4.set_byteorder(byteorder)
+
+        # Get other data
+        fps4.archive_name = reader.read_null_terminated_string(fps4.data.archive_name_address, 'shift-jis')
+        fps4.file_size = reader.size()
+
+        record.bytes = ctypes.sizeof(FPS4)
+
+    with stage(observer, 'fps4.read', 'entries', filename) as record:
+        # Get Files in Archive
+        if columnar:
+            fps4.files = FPS4EntryTable.from_buffer(reader.buffer, fps4.data.file_entries, fps4.data.header_size,
+                                                    fps4.data.entry_size, fps4.content_data, fps4.byteorder)
+        else:
+            for e in range(fps4.data.file_entries):
+                fps4.files.append(FPS4FileData(reader, e, fps4.content_data, fps4.byteorder,
+                                               offset=fps4.data.header_size + (e * fps4.data.entry_size)))
+
+        # Finalize remaining data
+        fps4.finalize()
+
+        record.bytes = fps4.data.file_entries * fps4.data.entry_size
+        record.count = fps4.data.file_entries
+
+    return fps4
 
-def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict = ""):
+def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict = "", max_threads: int | None = None,
+                       observer: Observer | None = None, compress: Literal['deflate', 'zlib', 'lzma'] | None = None,
+                       compress_members: 'MemberFilter | None' = None, max_workers: int | None = None,
+                       io_strategy: utils.IOStrategy = 'mmap', memory_budget: MemoryBudget | int | str | None = None,
+                       optimize_layout: bool = False, groups: Sequence['MemberFilter'] | None = None) -> 'MemberLayout':
     """
     Pack files into FPS4 format using data from a manifest.
 
+    Members can be compressed into TLZC format while they are packed, either by marking their entry in the manifest
+    with a compression type in "compress", or with the compress and compress_members arguments. Marked members are
+    compressed in parallel and written straight into the archive.
+
     :param output: Path to where the packed archive will be saved.
     :param manifest_file: Path to file where archive manifest data is stored.
     :param manifest_data: Manifest Data.
-    :return: None
+    :param max_threads: If specified, the amount of threads used for copying files into the archive. Otherwise, it
+        starts from the storage of the output and is adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the packing.
+    :param compress: If specified, compression type of the members matching compress_members.
+    :param compress_members: If specified, the members that are compressed with the compress type. Defaults to every
+        member.
+    :param max_workers: (Compression Only) If specified, the amount of threads used for compressing members.
+        Otherwise, it starts from the amount of CPUs and is adjusted to the measured throughput.
+    :param io_strategy: How the archive is written, and how the FPS4 file the manifest was made from is read. See
+        utils.IOStrategy.
+    :param memory_budget: (Compression Only) If specified, budget of the compression. Members that do not fit into it
+        are compressed in chunks, and compressed members that do not fit are kept in temporary files next to the
+        output until they are written. See memory.get_memory_budget.
+    :param optimize_layout: If the members should be placed by plan_layout instead of in the order of their entries,
+        so that identical members share their data. Archives whose entries have no sizes are always laid out in the
+        order of their entries.
+    :param groups: (Optimized Layout Only) Members that are read together, which are placed next to each other.
+    :return: Placement of the members, and the amount of bytes saved by optimizing it
     """
 
     if not manifest_file and not manifest_data:
@@ -169,17 +465,72 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
     else:
         mf_data = manifest_data
 
+    # Members without a path are copied from the FPS4 file the manifest was made from, if it is still unchanged
+    has_source: bool = is_source_usable(mf_data.get('source'), output)
+
+    def has_data(file_data: dict) -> bool:
+        return os.path.isfile(file_data.get('path', '')) or (has_source and 'path' not in file_data
+                                                             and file_data.get('source_address') is not None)
+
     # Re-check file sizes of extracted files in case they are changed
-    for file in mf_data['files']:
+    for i, file in enumerate(mf_data['files']):
         if os.path.isfile(file.get('path', '')):
             file['file_size'] = os.path.getsize(file['path'])
+        elif has_data(file):
+            file['file_size'] = file['source_size']
+        elif 'path' not in file and file.get('source_address') is not None:
+            raise FPS4Error(f"[ERROR]\tMember {i} was not extracted, and the FPS4 file it "
+                            "would be copied from is missing or was modified.")
+
+    # Compress marked members, which changes their size before the archive is laid out
+    compressions: dict[int, str] = {}
+    for i, file in enumerate(mf_data['files']):
+        if file.get('skippable', False) or not has_data(file): continue
+
+        comp_type: str | None = file.get('compress')
+        if not comp_type and compress is not None and (compress_members is None or compress_members.matches(
+                i, None, file.get('filename') or os.path.basename(file.get('path', '')), file, file['file_size'])):
+            comp_type = compress
+        if comp_type:
+            compressions[i] = comp_type
+
+    budget: MemoryBudget = get_memory_budget(memory_budget)
+    output_dir: str = os.path.dirname(os.path.abspath(output))
+
+    compressed: dict[int, bytes | BinaryIO] = {}
+    if compressions:
+        source_path: str = mf_data['source']['path'] if has_source else ""
+        os.makedirs(output_dir, exist_ok=True)
+
+        # zlib and lzma release the GIL, so members are compressed on threads
+        with schedule('codec', max_workers, tasks=len(compressions)) as executor:
+            futures: dict[int, Future] = {
+                i: executor.submit_weighted(mf_data['files'][i]['file_size'], compress_member, mf_data['files'][i],
+                                            comp_type, source_path, budget, output_dir)
+                for i, comp_type in compressions.items()
+            }
+
+            try:
+                for i, future in futures.items():
+                    with stage(observer, 'fps4.pack', 'codec', mf_data['files'][i].get('path', ''), i) as record:
+                        compressed[i] = future.result()
+                        record.bytes = mf_data['files'][i]['file_size']
+
+                    mf_data['files'][i]['file_size'] = get_compressed_size(compressed[i])
+            except BaseException:
+                # Members that were compressed already are not packed, so their temporary files are closed
+                executor.shutdown(cancel_futures=True)
+                for future in futures.values():
+                    if not future.cancelled() and future.exception() is None:
+                        release_compressed(future.result(), budget)
+                raise
 
     fps4 = FPS4.from_manifest(mf_data)
 
     metadata_offset: int = fps4.content_data.get_metadata_offset()
     alignment = 1 if not mf_data['alignment'] else mf_data['alignment']
     is_sector_and_file_size_same: bool = mf_data['set_sector_size_as_file_size']
-    file_terminator_address: int = mf_data['file_terminator_address']
+    file_terminator_address: int = mf_data.get('file_terminator_address')
 
     first_file_alignment: int = alignment if mf_data.get('first_file_alignment') is None \
         else mf_data['first_file_alignment']
@@ -188,10 +539,7 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
         os.makedirs(os.path.dirname(output))
 
     with open(output, "w+b") as f:
-        # Set initial size
-        if os.path.getsize(output) < 1: f.truncate(0x1C)
-
-        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_WRITE)
+        mm = utils.create_writer(f, io_strategy)
 
         # Skip Header for now
         mm.seek(ctypes.sizeof(fps4))
@@ -199,12 +547,11 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
         for file_data in mf_data['files']:
 
             # Place filler for Start Pointer/Sector Size data for now
-            if fps4.content_data.has_start_pointers: utils.expand_and_write(mm, bytes(4))
-            if fps4.content_data.has_sector_sizes: utils.expand_and_write(mm, bytes(4))
+            if fps4.content_data.has_start_pointers: mm.pad(4)
+            if fps4.content_data.has_sector_sizes: mm.pad(4)
 
             if fps4.content_data.has_file_sizes:
-                utils.expand_and_write(mm, int.to_bytes(file_data.get('file_size', 0),
-                                                        length=4, byteorder=fps4.byteorder))
+                mm.write(int.to_bytes(file_data.get('file_size', 0), length=4, byteorder=fps4.byteorder))
             if fps4.content_data.has_filenames:
                 filename: str = file_data.get('filename', '')
                 if len(filename) > 0x1F:
@@ -212,8 +559,8 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
 
                 as_bytes: bytes = filename.encode('shift-jis')
 
-                utils.expand_and_write(mm, as_bytes)
-                utils.expand_and_write(mm, bytes(0x20 - len(as_bytes)))     # Padding
+                mm.write(as_bytes)
+                mm.pad(0x20 - len(as_bytes))     # Padding
             if fps4.content_data.has_file_extensions:
                 extension: str = file_data.get('file_extension', "")
                 if not extension:
@@ -225,8 +572,8 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
 
                 as_bytes: bytes = extension.encode('shift-jis')
 
-                utils.expand_and_write(mm, as_bytes)
-                utils.expand_and_write(mm, bytes(0x8 - len(as_bytes)))      # Padding
+                mm.write(as_bytes)
+                mm.pad(0x8 - len(as_bytes))      # Padding
             if fps4.content_data.has_file_types:
                 extension: str = file_data.get('file_type', '')
                 if not extension:
@@ -238,17 +585,17 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
 
                 as_bytes: bytes = extension.encode('shift-jis')
 
-                utils.expand_and_write(mm, as_bytes)
-                utils.expand_and_write(mm, bytes(0x4 - len(as_bytes)))     # Padding
+                mm.write(as_bytes)
+                mm.pad(0x4 - len(as_bytes))     # Padding
 
             # Place filler for Metadata for now
-            if fps4.content_data.has_file_metadata: utils.expand_and_write(mm, bytes(4))
+            if fps4.content_data.has_file_metadata: mm.pad(4)
 
-            if fps4.content_data.has_mask_0x080: utils.expand_and_write(mm, bytes(4))
-            if fps4.content_data.has_mask_0x100: utils.expand_and_write(mm, bytes(4))
+            if fps4.content_data.has_mask_0x080: mm.pad(4)
+            if fps4.content_data.has_mask_0x100: mm.pad(4)
 
         # Reserve space for final entry pointing to end of container
-        utils.expand_and_write(mm, bytes(fps4.data.entry_size))
+        mm.pad(fps4.data.entry_size)
 
         # Handle Metadata
         if fps4.content_data.has_file_metadata:
@@ -259,34 +606,27 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
                 pointer: int = ctypes.sizeof(fps4.data) + (i * fps4.data.entry_size) + metadata_offset
 
                 # Write Pointer
-                cur_pos: int = mm.tell()
-                utils.expand_and_seek(mm, pointer)
-                utils.expand_and_write(mm, cur_pos.to_bytes(4, byteorder=fps4.byteorder))
-                mm.seek(cur_pos)
+                mm.write_at(pointer, mm.tell().to_bytes(4, byteorder=fps4.byteorder))
 
-                # Write Metadata
+                # Write Metadata, separated by spaces and terminated by a null byte
+                entries: list[bytes] = []
                 for kv in file['metadata']:
                     if kv[0] is None:
-                        utils.expand_and_write(mm, kv[1].encode('shift-jis'))
+                        entries.append(kv[1].encode('shift-jis'))
                     else:
-                        utils.expand_and_write(mm, f"{kv[0]}={kv[1]}".encode('shift-jis'))
-
-                    utils.expand_and_write(mm, 0x20.to_bytes(1, byteorder=fps4.byteorder))
+                        entries.append(f"{kv[0]}={kv[1]}".encode('shift-jis'))
 
-                mm.seek(-1, 1)
-                mm.write(bytes(1))
+                mm.write(b' '.join(entries) + bytes(1))
 
         # Handle Archive Name
         if fps4.archive_name is not None:
             fps4.data.archive_name_address = mm.tell()
 
             as_bytes = fps4.archive_name.encode('shift-jis')
-            utils.expand_and_write(mm, as_bytes)
-            utils.expand_and_write(mm, bytes(1))
+            mm.write(as_bytes)
+            mm.pad(1)
 
         # Resolve File Pointers
-        last_pos: int = mm.tell()
-
         ## Handle File Start
         fps4.data.file_start = utils.align_number(mm.tell(), first_file_alignment)
 
@@ -297,57 +637,573 @@ def pack_from_manifest(output: str, manifest_file: str = "", manifest_data: dict
             start_addresses.append(start_pointer)
             start_pointer += utils.align_number(file_data.get('file_size', 0), alignment)
 
+        ## Members are only placed out of order if their sizes do not depend on the address of the next member
+        layout: MemberLayout | None = None
+        if optimize_layout and (fps4.content_data.has_file_sizes or fps4.content_data.has_sector_sizes):
+            with stage(observer, 'fps4.pack', 'layout', output) as record:
+                placed: list[int] = [i for i, file_data in enumerate(mf_data['files'])
+                                     if not file_data.get('skippable', False) and has_data(file_data)]
+
+                # Only members as large as another one can be identical to it, so only those are hashed
+                sizes: dict[int, int] = {}
+                for i in placed:
+                    sizes[mf_data['files'][i]['file_size']] = sizes.get(mf_data['files'][i]['file_size'], 0) + 1
+
+                hashes: dict[int, str] = {}
+                source = open_source(mf_data.get('source'), output, io_strategy) if has_source else None
+                try:
+                    for i in placed:
+                        if mf_data['files'][i]['file_size'] and sizes[mf_data['files'][i]['file_size']] > 1:
+                            hashes[i] = hash_member(mf_data['files'][i], compressed.get(i), source)
+                finally:
+                    if source is not None:
+                        source.close()
+
+                layout = plan_layout(mf_data['files'], placed, fps4.data.file_start, alignment, hashes, groups)
+
+                # The address of the end of the last member moves along with what it points to
+                if file_terminator_address is not None:
+                    moved: dict[int, int] = {start_addresses[i]: layout.addresses[i] for i in reversed(placed)}
+                    moved[start_pointer] = layout.end
+                    terminator: int = file_terminator_address * fps4.file_location_multiplier
+                    file_terminator_address = moved.get(terminator, terminator) // fps4.file_location_multiplier
+
+                start_addresses = [layout.addresses.get(i, layout.end) for i in range(len(mf_data['files']))]
+                start_pointer = layout.end
+                record.bytes = layout.saved
+
         ## Handle Start Pointers and Sector Sizes
         for i, file_data in enumerate(mf_data['files']):
-            mm.seek(ctypes.sizeof(fps4.data) + (i * fps4.data.entry_size))
+            entry: bytearray = bytearray()
 
-            does_file_exist: bool = os.path.isfile(file_data.get('path', ''))
+            does_file_exist: bool = has_data(file_data)
             if fps4.content_data.has_start_pointers:
                 if does_file_exist:
                     data = int(start_addresses[i] / fps4.file_location_multiplier)
-                    utils.expand_and_write(mm, int(data).to_bytes(4, byteorder=fps4.byteorder))
+                    entry += int(data).to_bytes(4, byteorder=fps4.byteorder)
                 else:
-                    utils.expand_and_write(mm, 0xffffffff.to_bytes(4, byteorder=fps4.byteorder))
+                    entry += 0xffffffff.to_bytes(4, byteorder=fps4.byteorder)
             if fps4.content_data.has_sector_sizes:
                 if does_file_exist:
                     if is_sector_and_file_size_same:
                         data: int = file_data['file_size']
                     else:
                         data: int = utils.align_number(file_data['file_size'], alignment)
-                    utils.expand_and_write(mm, int(data).to_bytes(4, byteorder=fps4.byteorder))
+                    entry += int(data).to_bytes(4, byteorder=fps4.byteorder)
                 else:
-                    utils.expand_and_write(mm, bytes(4))
+                    entry += bytes(4)
+
+            mm.write_at(ctypes.sizeof(fps4.data) + (i * fps4.data.entry_size), entry)
 
         # Handle Final Entry
-        mm.seek(ctypes.sizeof(fps4.data) + ((len(mf_data['files']) - 1 ) * fps4.data.entry_size))
+        final_entry: int = ctypes.sizeof(fps4.data) + ((len(mf_data['files']) - 1 ) * fps4.data.entry_size)
         if file_terminator_address is None:
-            utils.expand_and_write(mm, int(start_pointer / fps4.file_location_multiplier)
-                                   .to_bytes(4, byteorder=fps4.byteorder))
+            # The start pointer of a last entry with data was already written
+            if not mf_data['files'] or not has_data(mf_data['files'][-1]):
+                mm.write_at(final_entry, int(start_pointer / fps4.file_location_multiplier)
+                            .to_bytes(4, byteorder=fps4.byteorder))
         else:
-            utils.expand_and_write(mm, file_terminator_address.to_bytes(4, byteorder=fps4.byteorder))
+            mm.write_at(final_entry, file_terminator_address.to_bytes(4, byteorder=fps4.byteorder))
 
         # Pad until Files address
-        mm.seek(last_pos)
-        utils.expand_and_write(mm, bytes(fps4.data.file_start - mm.size()))
+        mm.pad(fps4.data.file_start - mm.tell())
 
         # Write Files into archive
-        for file_data in mf_data['files']:
+        ## Members that were not modified since extraction are copied from the extracted FPS4 file, which is
+        ## detected from their size and modification time without reading them
+        source: utils.ArchiveReader | None = open_source(mf_data.get('source'), output, io_strategy) \
+            if has_source else None
+
+        ## Lay out the files first, so that they can be copied in parallel
+        file_positions: list[tuple[int, int, str, int | None]] = []
+        file_end: int = mm.tell()
+        for i, file_data in enumerate(mf_data['files']):
             if file_data.get('skippable', False): continue
-            if not os.path.isfile(file_data.get('path', '')): continue
-            with open(file_data['path'], 'rb') as af:
-                utils.expand_and_write(mm, af.read())
-                f.close()
+            if not has_data(file_data): continue
+            if layout is not None and i in layout.shared: continue
+
+            source_address: int | None = None
+            if source is not None and i not in compressed and file_data.get('source_address') is not None \
+                    and ('path' not in file_data or is_member_unchanged(file_data['path'], file_data)):
+                source_address = file_data['source_address']
 
+            if layout is not None:
+                file_positions.append((i, layout.addresses[i], file_data.get('path', ''), source_address))
+                continue
+
+            file_positions.append((i, file_end, file_data.get('path', ''), source_address))
+
+            file_end += file_data['file_size']
             if alignment > 1:
-                utils.expand_and_write(mm, bytes(utils.align_number(mm.size(), alignment) - mm.size()))
+                file_end = utils.align_number(file_end, alignment)
+
+        if layout is None:
+            layout = MemberLayout({i: position for i, position, _, _ in file_positions}, file_end, {}, 0)
+        else:
+            file_end = layout.end
+
+        try:
+            def _write_file(index: int, position: int, path: str, source_address: int | None):
+                with stage(observer, 'fps4.pack', 'member', path, index) as record:
+                    if index in compressed:
+                        data: bytes | BinaryIO = compressed.pop(index)
+                        try:
+                            if isinstance(data, (bytes, bytearray)):
+                                mm.write_at(position, data)
+                                record.bytes = len(data)
+                            else:
+                                record.bytes = mm.copy_range_at(position, data.fileno(), 0,
+                                                                get_compressed_size(data))
+                        finally:
+                            release_compressed(data, budget)
+                    elif source_address is None:
+                        record.bytes = mm.write_file_at(position, path)
+                    else:
+                        # Copied by the kernel, so unchanged members are never read into Python
+                        record.bytes = mm.copy_range_at(position, source.file.fileno(), source_address,
+                                                        mf_data['files'][index]['file_size'])
+                        source.advise('dontneed', source_address, record.bytes)
+
+            mm.reserve(file_end)
+            with schedule('io', max_threads, output, len(file_positions)) as executor:
+                for future in [executor.submit_weighted(mf_data['files'][fp[0]]['file_size'], _write_file, *fp)
+                               for fp in file_positions]:
+                    future.result()
+        finally:
+            if source is not None:
+                source.close()
+
+            for data in compressed.values():
+                release_compressed(data, budget)
+
+        mm.seek(file_end)
+        mm.pad(0)
 
         # Write Header
-        mm.seek(0)
-        mm.write(bytearray(fps4.data))
+        with stage(observer, 'fps4.pack', 'write', output) as record:
+            mm.write_at(0, bytearray(fps4.data))
+            record.bytes = ctypes.sizeof(fps4.data)
+
+        with stage(observer, 'fps4.pack', 'fsync', output) as record:
+            record.bytes = mm.size
+            mm.close()
+            os.fsync(f.fileno())
+        f.close()
+
+    return layout
+
+def plan_layout(files: list[dict], placed: Sequence[int], file_start: int, alignment: int,
+                hashes: dict[int, str] | None = None, groups: Sequence['MemberFilter'] | None = None) -> 'MemberLayout':
+    """
+    Choose where the members of an FPS4 file are placed, while their entries stay in the same order.
+
+    Entries locate members by their start pointers, so members do not have to be placed in the order of their
+    entries. Members with identical contents share the data of the first one instead of being padded to the alignment
+    once for each copy. Members matching the same group are placed next to each other, in the order of the groups,
+    and the remaining members are placed next to the other members of their directory, so members that are read
+    together are read from one region of the file.
+
+    :param files: Manifest data of every member, with the sizes they are packed with.
+    :param placed: Indices of the members that have data, in the order of their entries.
+    :param file_start: Absolute address of the first member.
+    :param alignment: Alignment of every member.
+    :param hashes: Hashes of the contents of members, by index. Members without a hash are never shared.
+    :param groups: If specified, members that are read together.
+    :return: MemberLayout
+    """
+
+    hashes = hashes or {}
+    groups = groups or []
+
+    def aligned(size: int) -> int:
+        return utils.align_number(size, alignment) if alignment > 1 else size
+
+    # Sort members by the first group they match, and then by the first appearance of their directory
+    directories: dict[str, int] = {}
+    keys: dict[int, tuple[int, int]] = {}
+    for i in placed:
+        filename: str = files[i].get('filename') or os.path.basename(files[i].get('path', ''))
+        group: int = next((g for g, members in enumerate(groups)
+                           if members.matches(i, None, filename, files[i], files[i]['file_size'])), len(groups))
+
+        path: str | None = next((value for key, value in files[i].get('metadata') or [] if key is None), None)
+        keys[i] = (group, directories.setdefault(os.path.dirname(path) if path else "", len(directories)))
+
+    addresses: dict[int, int] = {}
+    shared: dict[int, int] = {}
+    first: dict[tuple[int, str], int] = {}
+    position: int = file_start
+    for i in sorted(placed, key=lambda index: keys[index]):
+        size: int = files[i]['file_size']
+        if i in hashes:
+            original: int = first.setdefault((size, hashes[i]), i)
+            if original != i:
+                shared[i] = original
+                continue
+
+        addresses[i] = position
+        position += aligned(size)
+
+    for i, original in shared.items():
+        addresses[i] = addresses[original]
+
+    return MemberLayout(addresses, position, shared,
+                        file_start + sum(aligned(files[i]['file_size']) for i in placed) - position)
+
+def hash_member(file_data: dict, data: bytes | BinaryIO | None = None,
+                source: utils.ArchiveReader | None = None) -> str:
+    """
+    Hash the contents a member is packed with, without reading members whose hash was recorded at extraction.
+
+    :param file_data: Manifest data of the member.
+    :param data: If the member is compressed, its compressed contents.
+    :param source: If the manifest was made from an FPS4 file that is unchanged, reader of that file.
+    :return: Hash of the contents, as returned by utils.hash_data
+    """
+
+    if isinstance(data, (bytes, bytearray)):
+        return utils.hash_data(data)
+
+    if data is not None:
+        data.seek(0)
+        return utils.hash_chunks(iter(lambda: data.read(0x100000), b''))
+
+    path: str = file_data.get('path', '')
+    if file_data.get('hash') and (not path or is_member_unchanged(path, file_data)):
+        return file_data['hash']
 
-        mm.flush()
-        mm.close()
+    if not path:
+        return utils.hash_chunks(source.read_chunks(file_data['source_address'], file_data['file_size']))
+
+    with open(path, "rb") as f:
+        content_hash: str = utils.hash_chunks(iter(lambda: f.read(0x100000), b''))
         f.close()
 
+    return content_hash
+
+def compress_member(file_data: dict, comp_type: Literal['deflate', 'zlib', 'lzma'], source_path: str = "",
+                    budget: MemoryBudget | None = None, spill_dir: str = "") -> bytes | BinaryIO:
+    """
+    Compress a member into TLZC format.
+
+    :param file_data: Manifest data of the member.
+    :param comp_type: Compression type.
+    :param source_path: Path to the FPS4 file the member is read from, if it has no path.
+    :param budget: If specified, budget the member is compressed with. Defaults to the budget set by
+        memory.set_memory_budget.
+    :param spill_dir: Directory of the temporary file the compressed member is written to if it does not fit into the
+        budget.
+    :return: Compressed TLZC data, which is held in the budget until it is released with release_compressed, or a
+        temporary file containing it
+    """
+
+    budget = get_memory_budget(budget)
+    has_path: bool = os.path.isfile(file_data.get('path', ''))
+    size: int = os.path.getsize(file_data['path']) if has_path else file_data['source_size']
+
+    # Members are already compressed in parallel, so a single member does not use more threads
+    if not budget.fits(size * 2):
+        with budget.reserve(budget.chunk_size * 2), open(file_data['path'] if has_path else source_path, "rb") as f:
+            if not has_path:
+                f.seek(file_data['source_address'])
+
+            cf: BinaryIO = create_spill_file(spill_dir)
+            try:
+                tlzc.compress_file(f, cf, size, comp_type, max_workers=1, chunk_size=budget.chunk_size)
+            except BaseException:
+                cf.close()
+                raise
+            f.close()
+
+        return cf
+
+    with budget.reserve(size * 2):
+        with open(file_data['path'] if has_path else source_path, "rb") as f:
+            data: bytes = f.read() if has_path else os.pread(f.fileno(), size, file_data['source_address'])
+            f.close()
+
+        compressed: bytes = tlzc.compress_data(data, comp_type, max_workers=1)
+        del data
+
+        # Compressed members wait until every member is compressed, so the ones that do not fit are written out
+        return compressed if budget.hold(len(compressed)) else spill(compressed, spill_dir)
+
+def get_compressed_size(data: bytes | BinaryIO) -> int:
+    """Get the size of a member compressed by compress_member."""
+    return len(data) if isinstance(data, (bytes, bytearray)) else os.fstat(data.fileno()).st_size
+
+def release_compressed(data: bytes | BinaryIO, budget: MemoryBudget):
+    """Release a member compressed by compress_member from the budget, or close its temporary file."""
+    if isinstance(data, (bytes, bytearray)):
+        budget.release_held(len(data))
+    else:
+        data.close()
+
+def pack_overlay(base: str, output: str, replacements: dict[int | str, str], max_threads: int | None = None,
+                 observer: Observer | None = None) -> dict:
+    """
+    Pack an FPS4 archive from another one, replacing some of its members with files.
+
+    Members that are not replaced are copied straight from the base archive by the kernel, so only the replacements
+    are read. The archive is laid out again, so replacements of any size are properly aligned.
+
+    :param base: Path to the FPS4 file to start from.
+    :param output: Path to where the packed archive will be saved. It can not be the base archive.
+    :param replacements: Paths to the files replacing members, by index or name of the member they replace.
+    :param max_threads: If specified, the amount of threads used for copying files into the archive. Otherwise, it is
+        adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the packing.
+    :return: Manifest data the archive was packed from
+    """
+
+    if os.path.exists(output) and os.path.samefile(base, output):
+        raise FPS4Error("[ERROR]\tOutput of overlay packing can not be its base archive.")
+
+    with open_archive(base, observer=observer) as archive:
+        manifest: dict = generate_source_manifest(archive)
+
+        names: dict[str, int] = {}
+        for file in archive.files:
+            path, filename = file.estimate_file_path()
+            names.setdefault(filename, file.index)
+            if path is not None:
+                names.setdefault(f"{path}/{filename}", file.index)
+
+    is_layout_changed: bool = False
+    for member, path in replacements.items():
+        index: int | None = member if isinstance(member, int) else names.get(member)
+        if index is None or not 0 <= index < len(manifest['files']):
+            raise FPS4Error(f"[ERROR]\tMember \"{member}\" does not exist in {base}.")
+        if not os.path.isfile(path):
+            raise FPS4Error(f"[ERROR]\tReplacement file {path} does not exist.")
+
+        manifest['files'][index]['path'] = os.path.abspath(path)
+        is_layout_changed |= os.path.getsize(path) != manifest['files'][index].get('source_size')
+
+    # The address of the end of the last member no longer applies once members move
+    if is_layout_changed and manifest.get('file_terminator_address') is not None:
+        manifest['file_terminator_address'] = None
+
+    pack_from_manifest(output, manifest_data=manifest, max_threads=max_threads, observer=observer)
+
+    return manifest
+
+def transcode(filename: str, output: str, byteorder: Literal['little', 'big'] | None = None,
+              alignment: int | None = None, file_location_multiplier: int | None = None,
+              content_bitmask: int | None = None, max_threads: int | None = None,
+              observer: Observer | None = None) -> dict:
+    """
+    Convert an FPS4 archive to a different byteorder, alignment, file location multiplier or content bitmask.
+
+    Only the header and file entries are written again, while member data is copied straight from the original
+    archive by the kernel, without extracting it.
+
+    :param filename: Path to FPS4 file to convert.
+    :param output: Path to where the converted archive will be saved. It can not be the original archive.
+    :param byteorder: If specified, byteorder of the converted archive.
+    :param alignment: If specified, alignment of the members of the converted archive. An alignment of 1 removes all
+        padding between members.
+    :param file_location_multiplier: If specified, multiplier of the start pointers of the converted archive.
+    :param content_bitmask: If specified, content bitmask of the converted archive, which decides what data file
+        entries contain. File entries must still contain start pointers.
+    :param max_threads: If specified, the amount of threads used for copying members into the archive. Otherwise, it
+        is adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the conversion.
+    :return: Manifest data the archive was packed from
+    """
+
+    if os.path.exists(output) and os.path.samefile(filename, output):
+        raise FPS4Error("[ERROR]\tOutput of transcoding can not be the original archive.")
+    if byteorder not in (None, 'little', 'big'):
+        raise FPS4Error(f"[ERROR]\tUnsupported byteorder: {byteorder}")
+    if content_bitmask is not None and not FPS4ContentData(content_bitmask).has_start_pointers:
+        raise FPS4Error("[ERROR]\tFile entries of FPS4 files must contain start pointers.")
+
+    with open_archive(filename, observer=observer) as archive:
+        manifest: dict = generate_source_manifest(archive)
+
+    is_layout_changed: bool = False
+    if byteorder is not None:
+        manifest['byteorder'] = byteorder
+    if alignment is not None:
+        manifest['alignment'] = alignment
+        manifest.pop('first_file_alignment', None)
+        is_layout_changed = True
+    if file_location_multiplier is not None:
+        manifest['file_location_multiplier'] = file_location_multiplier
+        is_layout_changed = True
+    if content_bitmask is not None:
+        manifest['content_bitmask'] = content_bitmask
+        is_layout_changed = True
+
+    # Start pointers are divided by the multiplier, so every member has to start at a multiple of it
+    multiplier: int = manifest['file_location_multiplier']
+    if multiplier < 1 or (manifest['alignment'] or 1) % multiplier or \
+            manifest.get('first_file_alignment', manifest['alignment'] or 1) % multiplier:
+        raise FPS4Error(f"[ERROR]\tAlignment must be a multiple of the file location multiplier {multiplier}.")
+
+    # The address of the end of the last member no longer applies once members move
+    if is_layout_changed and manifest.get('file_terminator_address') is not None:
+        manifest['file_terminator_address'] = None
+
+    pack_from_manifest(output, manifest_data=manifest, max_threads=max_threads, observer=observer)
+
+    return manifest
+
+def generate_source_manifest(archive: 'FPS4Archive') -> dict:
+    """
+    Generate the manifest of an FPS4 file for packing an archive from its members without extracting them.
+
+    :param archive: Opened FPS4 file.
+    :return: Manifest data, where every member is copied from the FPS4 file
+    """
+
+    manifest, members = generate_archive_manifest(archive)
+    for index, address, size in members:
+        manifest['files'][index]['source_address'] = address
+        manifest['files'][index]['source_size'] = size
+
+    record_source(manifest, archive)
+
+    return manifest
+
+def open_source(source: dict | None, output: str = "",
+                io_strategy: utils.IOStrategy = 'mmap') -> utils.ArchiveReader | None:
+    """
+    Open the FPS4 file a manifest was extracted from.
+
+    :param source: Source data of the manifest.
+    :param output: Path of the FPS4 file being packed, which can not be its own source.
+    :param io_strategy: How the FPS4 file is read. See utils.IOStrategy.
+    :return: Reader of the FPS4 file, or None if it is missing or was modified since extraction
+    """
+
+    if not is_source_usable(source, output):
+        return None
+
+    return utils.ArchiveReader.open(source['path'], io_strategy)
+
+def is_source_usable(source: dict | None, output: str = "") -> bool:
+    """
+    :param source: Source data of the manifest.
+    :param output: Path of the FPS4 file being packed, which can not be its own source.
+    :return: If the FPS4 file a manifest was extracted from exists and was not modified since extraction
+    """
+
+    if not source or not os.path.isfile(source.get('path', '')):
+        return False
+    if output and os.path.realpath(output) == os.path.realpath(source['path']):
+        return False
+
+    stat: os.stat_result = os.stat(source['path'])
+    return stat.st_size == source.get('size') and stat.st_mtime_ns == source.get('mtime_ns')
+
+class MemberLayout(NamedTuple):
+    """
+    Placement of the members of a packed FPS4 file.
+    """
+
+    addresses: dict[int, int]       # Absolute address of every member with data, by index
+    end: int                        # End of the data of the members
+    shared: dict[int, int]          # Members that share the data of an identical member, by the index of that member
+    saved: int                      # Bytes saved compared to placing every member in the order of its entry
+
+
+@dataclass
+class MemberFilter:
+    """
+    Selection of the members of an FPS4 file.
+
+    A member matches if it matches every criterion that is specified, and a criterion matches if any of its values
+    match. Names are matched case-insensitively against both the name of the member and its path within the archive,
+    as given by estimate_file_path.
+    """
+
+    indices: Sequence[int | range] | None = None
+    names: Sequence[str] | None = None
+    file_types: Sequence[str] | None = None
+    predicate: Callable[[dict], bool] | None = None     # Called with the manifest data, index and size of the member
+
+    def matches(self, index: int, path: str | None, filename: str, file_manifest: dict, size: int) -> bool:
+        if self.indices is not None and not any(index in i if isinstance(i, range) else index == i
+                                                for i in self.indices):
+            return False
+
+        if self.names is not None:
+            names: list[str] = [filename.lower()] if path is None else [filename.lower(), f"{path}/{filename}".lower()]
+            if not any(fnmatch.fnmatchcase(name, pattern.lower()) for name in names for pattern in self.names):
+                return False
+
+        if self.file_types is not None:
+            file_type: str = file_manifest.get('file_type') or os.path.splitext(filename)[1][1:]
+            if file_type.lower() not in (t.lower().lstrip('.') for t in self.file_types):
+                return False
+
+        return self.predicate is None or self.predicate(dict(file_manifest, index=index, file_size=size))
+
+class FPS4Archive:
+    """
+    An opened FPS4 archive.
+
+    Members are read by absolute offset from a shared mapping, so a single opened archive can serve member reads
+    from any amount of threads at the same time.
+    """
+
+    def __init__(self, reader: utils.ArchiveReader, filename: str = "", columnar: bool = False,
+                 observer: Observer | None = None, fps4: FPS4 | None = None):
+        """
+        :param fps4: If specified, an already parsed header of the archive, which is used instead of parsing it.
+        """
+
+        self.reader: utils.ArchiveReader = reader
+        self.filename: str = filename
+        self.fps4: FPS4 = fps4 if fps4 is not None else read_header(reader, filename, columnar, observer)
+
+    def __enter__(self) -> 'FPS4Archive':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def files(self) -> list[FPS4FileData] | FPS4EntryTable:
+        return self.fps4.files
+
+    def get_member_range(self, index: int) -> tuple[int, int] | None:
+        """
+        Get the location of a member in the archive.
+
+        :param index: Index of the member.
+        :return: Absolute address and size of the member, or None if the member has no data.
+        """
+
+        file: FPS4FileData | FPS4EntryView = self.fps4.files[index]
+        if file.skippable or not file.address:
+            return None
+
+        file_size: int | None = file.estimate_file_size(self.fps4.files)
+        if file_size is None:
+            return None
+
+        return file.address * self.fps4.file_location_multiplier, file_size
+
+    def read(self, index: int) -> bytes:
+        """
+        Read the contents of a member.
+
+        :param index: Index of the member.
+        :return: Contents of the member
+        """
+
+        member_range: tuple[int, int] | None = self.get_member_range(index)
+        if member_range is None:
+            raise FPS4Error(f"[ERROR]\tFile {index} of {self.filename} has no data.")
+
+        return self.reader.read(*member_range)
+
+    def close(self):
+        self.reader.close()
+
+
 class FPS4Error(Exception):
     """"""
\ No newline at end of file
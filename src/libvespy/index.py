@@ -0,0 +1,302 @@
+from typing import Iterable, Literal, NamedTuple
+import sqlite3
+import ctypes
+import os
+
+from libvespy.structs import ScenarioHeader, ScenarioEntry, TLZCHeader
+from libvespy.utils import ArchiveReader, hash_data
+from libvespy.parallel import schedule
+from libvespy import fps4, tlzc
+
+SCHEMA_VERSION: int = 1
+
+# Nested containers are named after their parent, followed by this separator and the index of the member
+NESTED_SEPARATOR: str = "|"
+
+
+class Member(NamedTuple):
+    """
+    A member of an indexed container.
+
+    The container of a member nested in another archive is named after the outer archive, such as
+    "dump/btl.svo|2" for the second member of btl.svo, or "dump/map.DAT|0" for the decompressed contents of a
+    TLZC file. Offsets are relative to the start of the (decompressed) container.
+    """
+
+    container: str
+    index: int
+    offset: int
+    size: int
+    name: str
+    hash: str
+    format: str
+
+
+class ContainerRecord(NamedTuple):
+    path: str
+    parent: str | None
+    format: Literal['fps4', 'scenario', 'tlzc', 'raw']
+    size: int
+    mtime_ns: int
+    members: list[Member]
+
+
+def detect_format(data: bytes) -> Literal['fps4', 'scenario', 'tlzc', 'raw']:
+    """
+    :return: Format of data, based on its magic number
+    """
+
+    if data[:4] == b'FPS4':
+        return 'fps4'
+    if data[:8] == b'TO8SCEL\x00':
+        return 'scenario'
+    if data[:4] == b'TLZC':
+        return 'tlzc'
+
+    return 'raw'
+
+def scan_file(path: str, max_depth: int = 4) -> list[ContainerRecord]:
+    """
+    Read the members of a file and every archive nested in it.
+
+    :param path: Path to the file.
+    :param max_depth: The maximum amount of archive layers to look into.
+    :return: Every container in the file, outer ones first
+    """
+
+    stat: os.stat_result = os.stat(path)
+    records: list[ContainerRecord] = []
+    with ArchiveReader.open(path) as reader:
+        _scan(reader.buffer, path, None, os.path.basename(path), stat.st_size, stat.st_mtime_ns, max_depth, records)
+
+    return records
+
+def _scan(data, path: str, parent: str | None, name: str, size: int, mtime_ns: int, depth: int,
+          records: list[ContainerRecord]):
+    container_format = detect_format(data[:8])
+    members: list[Member] = []
+    ranges: list[tuple[int, int]] = []
+    decompressed: bytes = bytes()
+
+    try:
+        match container_format:
+            case 'fps4':
+                archive = fps4.FPS4Archive(ArchiveReader(data), path)
+                for file in archive.files:
+                    member_range: tuple[int, int] | None = archive.get_member_range(file.index)
+                    if member_range is None: continue
+
+                    directory, filename = file.estimate_file_path()
+                    members.append(Member(path, file.index, *member_range,
+                                          filename if directory is None else f"{directory}/{filename}", "", ""))
+                    ranges.append(member_range)
+            case 'scenario':
+                header = ScenarioHeader.from_buffer_copy(data[:ctypes.sizeof(ScenarioHeader)])
+                for e in range(header.file_count):
+                    entry = ScenarioEntry.from_buffer_copy(data[0x20 + e * 0x20:0x20 + e * 0x20 +
+                                                                ctypes.sizeof(ScenarioEntry)])
+                    if not entry.file_size_compressed: continue
+
+                    offset: int = entry.offset + header.file_offset
+                    members.append(Member(path, e, offset, entry.file_size_compressed, str(e), "", ""))
+                    ranges.append((offset, entry.file_size_compressed))
+            case 'tlzc':
+                # The decompressed contents are the only member, so identical data is found however it is compressed
+                decompressed = tlzc.decompress_data(data)
+                members.append(Member(path, 0, ctypes.sizeof(TLZCHeader), len(decompressed), name, "", ""))
+    except Exception:
+        # Data that only looks like an archive is indexed as plain data
+        container_format = 'raw'
+        members, ranges = [], []
+
+    # Hash through a view, so members are not copied unless they have to be scanned further
+    nested: list[tuple[Member, bytes]] = []
+    with memoryview(decompressed if container_format == 'tlzc' else data) as view:
+        for i, member in enumerate(members):
+            content = view if container_format == 'tlzc' else view[ranges[i][0]:ranges[i][0] + ranges[i][1]]
+            member = members[i] = member._replace(hash=hash_data(content), format=detect_format(content[:8]))
+
+            if member.format != 'raw' and depth > 1:
+                nested.append((member, bytes(content)))
+
+            if content is not view:
+                content.release()
+
+    records.append(ContainerRecord(path, parent, container_format, size, mtime_ns, members))
+
+    for member, content in nested:
+        _scan(content, f"{path}{NESTED_SEPARATOR}{member.index}", path, member.name, member.size, 0, depth - 1,
+              records)
+
+
+class ArchiveIndex:
+    """
+    Persistent SQLite index of the members of every archive in a game dump.
+
+    Updating only rescans files whose size or modification time changed since they were last indexed, and removes
+    files that no longer exist.
+    """
+
+    def __init__(self, database: str):
+        """
+        :param database: Path to the index database. It is created if it does not exist.
+        """
+
+        self.connection = sqlite3.connect(database)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript(f"""
+                DROP TABLE IF EXISTS members;
+                DROP TABLE IF EXISTS containers;
+                CREATE TABLE containers (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    parent_id INTEGER REFERENCES containers(id) ON DELETE CASCADE,
+                    format TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                );
+                CREATE TABLE members (
+                    container_id INTEGER NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+                    idx INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    name TEXT NOT NULL COLLATE NOCASE,
+                    hash TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    PRIMARY KEY (container_id, idx)
+                );
+                CREATE INDEX containers_parent ON containers(parent_id);
+                CREATE INDEX members_name ON members(name);
+                CREATE INDEX members_hash ON members(hash);
+                CREATE INDEX members_size ON members(size);
+                PRAGMA user_version = {SCHEMA_VERSION};
+            """)
+
+    def __enter__(self) -> 'ArchiveIndex':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def update(self, roots: str | Iterable[str], max_workers: int | None = None, max_depth: int = 4) -> dict[str, int]:
+        """
+        Index every file in directories, skipping the ones that did not change.
+
+        :param roots: Paths to directories or files to index.
+        :param max_workers: If specified, the amount of processes used for scanning files. Otherwise, it is adjusted
+            to the measured throughput.
+        :param max_depth: The maximum amount of archive layers to look into.
+        :return: Amount of files that were scanned, skipped and removed
+        """
+
+        roots = [roots] if isinstance(roots, str) else list(roots)
+
+        found: set[str] = set()
+        for root in roots:
+            root = os.path.abspath(root)
+            if os.path.isfile(root):
+                found.add(root)
+                continue
+
+            for directory, _, files in os.walk(root):
+                found.update(os.path.join(directory, file) for file in files)
+
+        indexed: dict[str, tuple[int, int]] = {
+            path: (size, mtime_ns) for path, size, mtime_ns in
+            self.connection.execute("SELECT path, size, mtime_ns FROM containers WHERE parent_id IS NULL")
+        }
+
+        changed: list[str] = []
+        for path in sorted(found):
+            stat: os.stat_result = os.stat(path)
+            if indexed.get(path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(path)
+
+        # Only forget files that disappeared from the roots that were walked
+        removed: list[str] = []
+        for path in indexed:
+            if path in found: continue
+            if any(path == os.path.abspath(root) or path.startswith(os.path.join(os.path.abspath(root), ''))
+                   for root in roots):
+                removed.append(path)
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM containers WHERE path = ?", [(path,) for path in removed])
+
+        with schedule('python', max_workers, tasks=len(changed)) as executor:
+            for path, records in zip(changed, executor.map(scan_file, changed, [max_depth] * len(changed))):
+                # Replace the whole tree of the file at once, so a failed update never leaves half of it
+                with self.connection:
+                    self.connection.execute("DELETE FROM containers WHERE path = ?", (path,))
+
+                    ids: dict[str, int] = {}
+                    for record in records:
+                        cursor = self.connection.execute(
+                            "INSERT INTO containers (path, parent_id, format, size, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                            (record.path, ids.get(record.parent), record.format, record.size, record.mtime_ns))
+                        ids[record.path] = cursor.lastrowid
+
+                        self.connection.executemany(
+                            "INSERT INTO members (container_id, idx, offset, size, name, hash, format) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [(ids[record.path], *member[1:]) for member in record.members])
+
+        return {'scanned': len(changed), 'skipped': len(found) - len(changed), 'removed': len(removed)}
+
+    def _query(self, condition: str, parameters: tuple) -> list[Member]:
+        return [Member(*row) for row in self.connection.execute(
+            "SELECT containers.path, idx, offset, members.size, name, hash, members.format FROM members "
+            f"JOIN containers ON containers.id = members.container_id WHERE {condition} "
+            "ORDER BY containers.path, idx", parameters)]
+
+    def find_by_name(self, name: str) -> list[Member]:
+        """
+        Find members by name, ignoring case. Names may contain the wildcards * and ?.
+
+        :param name: Name of the member.
+        :return: Matching members
+        """
+
+        if '*' in name or '?' in name:
+            return self._query("name LIKE ? ESCAPE '\\'",
+                               (name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                                .replace('*', '%').replace('?', '_'),))
+
+        return self._query("name = ?", (name,))
+
+    def find_by_hash(self, content_hash: str) -> list[Member]:
+        """
+        Find members with identical contents.
+
+        :param content_hash: Hash of the contents, as returned by utils.hash_data.
+        :return: Matching members
+        """
+
+        return self._query("hash = ?", (content_hash,))
+
+    def find_by_size(self, size: int) -> list[Member]:
+        return self._query("members.size = ?", (size,))
+
+    def get_members(self, path: str) -> list[Member] | None:
+        """
+        Get the members of an indexed file, as long as the file did not change since it was indexed.
+
+        :param path: Path to the file.
+        :return: Members of the file, or None if it is not indexed or changed since
+        """
+
+        path = os.path.abspath(path)
+        row = self.connection.execute("SELECT size, mtime_ns FROM containers WHERE path = ? AND parent_id IS NULL",
+                                      (path,)).fetchone()
+
+        stat: os.stat_result = os.stat(path)
+        if row is None or tuple(row) != (stat.st_size, stat.st_mtime_ns):
+            return None
+
+        return self._query("containers.path = ?", (path,))
+
+    def close(self):
+        self.connection.close()
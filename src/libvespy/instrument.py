@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator
+import threading
+import time
+
+
+@dataclass(frozen=True)
+class StageEvent:
+    """
+    A finished stage of an operation.
+
+    Stages are one of 'header' (parsing an archive header), 'entries' (parsing or building an entry table),
+    'member' (copying a member in or out of an archive), 'codec' (compressing or decompressing), 'read', 'write' and
+    'fsync' (flushing written data to disk).
+    """
+
+    operation: str
+    stage: str
+    path: str = ""
+    bytes: int = 0
+    elapsed: float = 0.0
+    index: int | None = None
+    count: int | None = None
+
+
+# Observers may be called from worker threads, and should not raise
+Observer = Callable[[StageEvent], None]
+
+
+class StageRecord:
+    """Mutable details of a running stage."""
+
+    __slots__ = ('bytes', 'count')
+
+    def __init__(self):
+        self.bytes: int = 0
+        self.count: int | None = None
+
+
+@contextmanager
+def stage(observer: Observer | None, operation: str, name: str, path: str = "",
+          index: int | None = None) -> Iterator[StageRecord]:
+    """
+    Time a stage of an operation and report it to an observer.
+
+    :param observer: Observer to report to. Nothing is measured if it is None.
+    :param operation: Name of the operation, such as 'fps4.extract'.
+    :param name: Name of the stage.
+    :param path: Path of the file the stage works on.
+    :param index: Index of the member the stage works on.
+    :return: Record where the amount of bytes and items handled by the stage can be set
+    """
+
+    record = StageRecord()
+    if observer is None:
+        yield record
+        return
+
+    start: float = time.perf_counter()
+    try:
+        yield record
+    finally:
+        observer(StageEvent(operation, name, path, record.bytes, time.perf_counter() - start, index, record.count))
+
+
+@dataclass
+class StageStats:
+    events: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    max_elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+
+class Collector:
+    """
+    Observer that aggregates events per operation and stage.
+
+    Elapsed times of stages that ran in parallel are summed, so they can add up to more than the wall time.
+    """
+
+    def __init__(self, on_event: Observer | None = None):
+        """
+        :param on_event: If specified, also called with every event, such as for driving a progress bar.
+        """
+
+        self.stats: dict[tuple[str, str], StageStats] = {}
+        self.on_event: Observer | None = on_event
+        self._lock = threading.Lock()
+
+    def __call__(self, event: StageEvent):
+        with self._lock:
+            stats: StageStats = self.stats.setdefault((event.operation, event.stage), StageStats())
+            stats.events += 1
+            stats.bytes += event.bytes
+            stats.elapsed += event.elapsed
+            stats.max_elapsed = max(stats.max_elapsed, event.elapsed)
+
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def report(self) -> dict[str, dict[str, dict]]:
+        """
+        :return: Aggregated statistics, keyed by operation and then by stage
+        """
+
+        report: dict[str, dict[str, dict]] = {}
+        with self._lock:
+            for (operation, name), stats in self.stats.items():
+                report.setdefault(operation, {})[name] = {
+                    'events': stats.events,
+                    'bytes': stats.bytes,
+                    'elapsed': stats.elapsed,
+                    'max_elapsed': stats.max_elapsed,
+                    'throughput': stats.throughput,
+                }
+
+        return report
+
+    def format_report(self) -> str:
+        lines: list[str] = [f"{'Operation':<18}{'Stage':<10}{'Events':>8}{'Bytes':>14}{'Time (s)':>12}{'MiB/s':>10}"]
+        for operation, stages in self.report().items():
+            for name, stats in sorted(stages.items(), key=lambda s: -s[1]['elapsed']):
+                lines.append(f"{operation:<18}{name:<10}{stats['events']:>8}{stats['bytes']:>14}"
+                             f"{stats['elapsed']:>12.4f}{stats['throughput'] / 0x100000:>10.1f}")
+
+        return "\n".join(lines)
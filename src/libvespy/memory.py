@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+import threading
+import tempfile
+import re
+import os
+
+
+class MemoryBudget:
+    """
+    Limit on the amount of bytes that operations hold in memory at the same time.
+
+    Operations take in-memory fast paths for data that fits into the budget, and stream data that does not fit in
+    chunks. Work reserves the memory it uses while it runs, and waits while the budget is used up by other work, so a
+    budget shared by multiple operations and worker pools limits the bytes they have in flight together.
+
+    Results that wait to be written, such as compressed members, are held without waiting, and are written to
+    temporary files instead when they do not fit. At most half of the budget is held, so held results never keep work
+    from running.
+    """
+
+    def __init__(self, limit: int | None = None, chunk_size: int = 0x100000):
+        """
+        :param limit: The maximum amount of bytes. Unlimited if not specified.
+        :param chunk_size: Size of the chunks that data which does not fit is streamed in.
+        """
+
+        if limit is not None and limit < 2:
+            raise MemoryBudgetError(f"[ERROR]\tMemory budget of {limit} bytes is too small.")
+
+        self.limit: int | None = limit
+        self.used: int = 0
+        self.held: int = 0
+        self._chunk_size: int = chunk_size
+        self._condition = threading.Condition()
+
+    @property
+    def work_limit(self) -> int | None:
+        """The maximum amount of bytes a single piece of work can reserve."""
+        return None if self.limit is None else self.limit - self.limit // 2
+
+    @property
+    def chunk_size(self) -> int:
+        """Size of the chunks that data which does not fit is streamed in."""
+        return self._chunk_size if self.limit is None else min(self._chunk_size, self.work_limit)
+
+    def fits(self, size: int) -> bool:
+        """
+        Check if work on an amount of bytes can be done in memory.
+
+        :param size: Amount of bytes the work holds in memory at once.
+        :return: If the work fits into the budget
+        """
+
+        return self.limit is None or size <= self.work_limit
+
+    def acquire(self, size: int) -> int:
+        """
+        Reserve memory for work, waiting until enough of the budget is free.
+
+        :param size: Amount of bytes. Amounts over the work limit reserve the work limit.
+        :return: Amount of bytes reserved, which has to be passed to release
+        """
+
+        if self.limit is None:
+            return 0
+
+        size = min(size, self.work_limit)
+        with self._condition:
+            while self.used + size > self.limit:
+                self._condition.wait()
+            self.used += size
+
+        return size
+
+    def release(self, size: int):
+        """Free memory reserved with acquire."""
+        if not size:
+            return
+
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[int]:
+        """Reserve memory for work while in the context. See acquire."""
+        reserved: int = self.acquire(size)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+    def hold(self, size: int) -> bool:
+        """
+        Reserve memory for a result that waits to be written, without waiting.
+
+        :param size: Amount of bytes.
+        :return: If the result can be held in memory. Otherwise, it should be written to a temporary file.
+        """
+
+        if self.limit is None:
+            return True
+
+        with self._condition:
+            if self.held + size > self.limit // 2 or self.used + size > self.limit:
+                return False
+
+            self.used += size
+            self.held += size
+
+        return True
+
+    def release_held(self, size: int):
+        """Free memory reserved with hold."""
+        if self.limit is None:
+            return
+
+        with self._condition:
+            self.used -= size
+            self.held -= size
+            self._condition.notify_all()
+
+_SIZE_UNITS: dict[str, int] = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+def parse_size(size: int | str) -> int:
+    """
+    Parse an amount of bytes, such as 4096, "512M" or "2GiB". Units are powers of 1024.
+
+    :param size: Amount of bytes, optionally with a unit.
+    :return: Amount of bytes
+    """
+
+    if isinstance(size, int):
+        return size
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*', size, re.IGNORECASE)
+    if match is None:
+        raise MemoryBudgetError(f"[ERROR]\tInvalid size: {size}")
+
+    return int(float(match[1]) * _SIZE_UNITS[match[2].lower()])
+
+# The default budget can be set for a whole process by its environment, such as in a container with a memory limit
+_default_budget: MemoryBudget = MemoryBudget(parse_size(os.environ['LIBVESPY_MEMORY_BUDGET'])
+                                             if os.environ.get('LIBVESPY_MEMORY_BUDGET') else None)
+
+def set_memory_budget(limit: int | str | None):
+    """
+    Set the budget of every operation that is not given its own budget.
+
+    :param limit: The maximum amount of bytes, such as 536870912 or "512M". Unlimited if None.
+    :return: None
+    """
+
+    global _default_budget
+    _default_budget = MemoryBudget(None if limit is None else parse_size(limit))
+
+def get_memory_budget(budget: 'MemoryBudget | int | str | None' = None) -> MemoryBudget:
+    """
+    Get the budget an operation runs with.
+
+    :param budget: Budget of the operation, or its limit in bytes. Defaults to the budget set by set_memory_budget.
+    :return: MemoryBudget
+    """
+
+    if budget is None:
+        return _default_budget
+    if isinstance(budget, MemoryBudget):
+        return budget
+
+    return MemoryBudget(parse_size(budget))
+
+def create_spill_file(directory: str = "") -> BinaryIO:
+    """
+    Create a temporary file for a result that does not fit into the budget. The file is removed once it is closed.
+
+    :param directory: Directory of the temporary file. Files in the same directory as the final output can be copied
+        into it by the kernel.
+    :return: Temporary file, opened for reading and writing
+    """
+
+    return tempfile.TemporaryFile(prefix=".libvespy-", suffix=".spill", dir=directory or None)
+
+def spill(data: bytes | bytearray, directory: str = "") -> BinaryIO:
+    """
+    Write a result that does not fit into the budget to a temporary file. See create_spill_file.
+
+    :param data: Data to write.
+    :param directory: Directory of the temporary file.
+    :return: Temporary file, which has to be closed by the caller
+    """
+
+    f: BinaryIO = create_spill_file(directory)
+    f.write(data)
+    f.flush()
+
+    return f
+
+class MemoryBudgetError(Exception):
+    """"""
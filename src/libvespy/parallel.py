@@ -0,0 +1,384 @@
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from typing import Any, Callable, Iterable, Literal, TypeVar
+import functools
+import re
+import threading
+import time
+import sys
+import os
+
+
+# Free-threaded builds (3.13t and later) can run Python code on multiple cores from threads
+FREE_THREADED: bool = hasattr(sys, '_is_gil_enabled') and not sys._is_gil_enabled()
+
+T = TypeVar('T')
+
+# Kinds of parallel work, which decide the type and amount of workers:
+#   io     - Copying, reading and writing files. Runs on threads, and the amount depends on the storage.
+#   codec  - zlib and lzma compression, which release the GIL. Runs on threads, one per CPU.
+#   python - Parsing and laying out archives, which holds the GIL. Runs on processes, one per CPU.
+WorkKind = Literal['io', 'codec', 'python']
+StorageKind = Literal['memory', 'solid', 'rotational', 'network', 'unknown']
+
+NETWORK_FILESYSTEMS: frozenset[str] = frozenset({'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'ceph', 'glusterfs',
+                                                  'lustre', 'gpfs', 'afs', 'beegfs', 'fuse.sshfs',
+                                                  'fuse.glusterfs', 'fuse.s3fs', 'fuse.rclone'})
+MEMORY_FILESYSTEMS: frozenset[str] = frozenset({'tmpfs', 'ramfs'})
+
+# Storage of a device does not change while running
+_storage_kinds: dict[int, StorageKind] = {}
+
+
+def default_workers(kind: WorkKind = 'codec', path: str = "") -> int:
+    """
+    Get the amount of workers parallel work starts with.
+
+    :param kind: Kind of the work. See WorkKind.
+    :param path: (I/O Only) Path the work reads or writes, which decides the amount of workers by its storage.
+    :return: Amount of workers
+    """
+
+    cpus: int = os.process_cpu_count() if hasattr(os, 'process_cpu_count') else (os.cpu_count() or 1)
+    if kind != 'io':
+        return cpus
+
+    match get_storage_kind(path):
+        case 'memory':
+            return cpus
+        case 'solid':
+            # Solid state drives need many requests in flight to reach their throughput
+            return min(max(cpus * 2, 8), 32)
+        case 'rotational':
+            # Every concurrent request makes a hard drive seek between them
+            return 2
+        case 'network':
+            # Requests mostly wait on the network, so more of them can be in flight
+            return 16
+
+    return 8
+
+def get_max_workers(kind: WorkKind, workers: int) -> int:
+    """
+    Get the amount of workers adaptive parallel work can grow to.
+
+    :param kind: Kind of the work. See WorkKind.
+    :param workers: Amount of workers the work starts with.
+    :return: Amount of workers
+    """
+
+    if kind == 'io':
+        return min(max(workers * 4, 16), 64)
+
+    # CPU bound work does not get faster with more workers than CPUs
+    return max(workers, default_workers(kind))
+
+def get_storage_kind(path: str = "") -> StorageKind:
+    """
+    Get the kind of storage a path is on. Only Linux is supported, other platforms always get 'unknown'.
+
+    :param path: Path to a file or directory, which does not have to exist yet. Defaults to the working directory.
+    :return: Kind of storage
+    """
+
+    # Files that are about to be written do not exist yet, but the directory they are written to usually does
+    path = os.path.abspath(path or os.curdir)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+
+    try:
+        device: int = os.stat(path).st_dev
+    except OSError:
+        return 'unknown'
+
+    if device not in _storage_kinds:
+        _storage_kinds[device] = _detect_storage_kind(path, device)
+
+    return _storage_kinds[device]
+
+def _detect_storage_kind(path: str, device: int) -> StorageKind:
+    # The file system of the longest mount point containing the path is the one the path is on
+    fs_type: str = ""
+    mount_point: str = ""
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields: list[str] = line.split()
+                if len(fields) < 3: continue
+
+                # Spaces and other whitespace in mount points are escaped as octal
+                point: str = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m[1], 8)), fields[1])
+                if len(point) > len(mount_point) and (path == point or path.startswith(os.path.join(point, ''))):
+                    mount_point, fs_type = point, fields[2]
+            f.close()
+    except OSError:
+        return 'unknown'
+
+    if fs_type in NETWORK_FILESYSTEMS:
+        return 'network'
+    if fs_type in MEMORY_FILESYSTEMS:
+        return 'memory'
+
+    # Partitions share the queue of the disk they are on
+    block: str = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    if os.path.exists(os.path.join(block, "partition")):
+        block = os.path.join(block, os.pardir)
+
+    try:
+        with open(os.path.join(block, "queue", "rotational")) as f:
+            rotational: str = f.read().strip()
+            f.close()
+    except OSError:
+        return 'unknown'
+
+    return 'rotational' if rotational == '1' else 'solid'
+
+def create_executor(max_workers: int | None = None, cpu_bound: bool = False) -> Executor:
+    """
+    Create an executor suitable for the type of work that will be submitted to it.
+
+    I/O bound work, and CPU bound work that releases the GIL (such as zlib and lzma), always runs on threads.
+    Other CPU bound work runs on threads when the interpreter is free-threaded, and on processes otherwise, in which
+    case submitted functions and their arguments have to be picklable.
+
+    :param max_workers: The maximum amount of workers. Defaults to the amount of usable CPUs.
+    :param cpu_bound: If the submitted work is CPU bound while holding the GIL.
+    :return: Executor
+    """
+
+    if max_workers is None:
+        max_workers = default_workers()
+
+    if not cpu_bound or FREE_THREADED or max_workers <= 1:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+def schedule(kind: WorkKind, max_workers: int | None = None, path: str = "",
+             tasks: int | None = None) -> 'AdaptiveExecutor':
+    """
+    Create an executor for a kind of parallel work, which adjusts its amount of workers to the measured throughput.
+
+    :param kind: Kind of the work. See WorkKind.
+    :param max_workers: If specified, the amount of workers is pinned to it instead of being adjusted.
+    :param path: (I/O Only) Path the work reads or writes, which decides the amount of workers by its storage.
+    :param tasks: If specified, the amount of tasks that will be submitted, which limits the amount of workers.
+    :return: AdaptiveExecutor
+    """
+
+    if max_workers is not None:
+        workers = limit = max(min(max_workers, tasks if tasks is not None else max_workers), 1)
+    else:
+        workers = default_workers(kind, path)
+        limit = get_max_workers(kind, workers)
+        if tasks is not None:
+            workers, limit = max(min(workers, tasks), 1), max(min(limit, tasks), 1)
+
+    return AdaptiveExecutor(kind, workers, limit, adaptive=max_workers is None)
+
+class AdaptiveExecutor(Executor):
+    """
+    Executor that limits how many of its tasks run at the same time, and adjusts the limit to the measured throughput.
+
+    Tasks wait in a queue until a worker is available. Every interval, the throughput of the finished tasks is
+    compared to the previous interval. The amount of workers keeps growing while that makes it faster, and keeps
+    shrinking while that does not make it slower, and turns around otherwise. Tasks can be weighted by the amount of
+    bytes they process, so that tasks of different sizes are measured fairly.
+    """
+
+    # Fraction of the throughput that is considered the same
+    TOLERANCE: float = 0.05
+
+    def __init__(self, kind: WorkKind = 'io', workers: int = 8, max_workers: int = 8, adaptive: bool = True,
+                 interval: float = 0.25):
+        """
+        :param kind: Kind of the work. See WorkKind.
+        :param workers: Amount of workers to start with.
+        :param max_workers: The maximum amount of workers.
+        :param adaptive: If the amount of workers is adjusted to the measured throughput.
+        :param interval: Minimum amount of seconds throughput is measured for before adjusting the amount of workers.
+        """
+
+        self.kind: WorkKind = kind
+        self.workers: int = min(workers, max_workers)
+        self.max_workers: int = max_workers
+        self.adaptive: bool = adaptive and max_workers > 1
+        self.interval: float = interval
+        self.history: list[int] = [self.workers]
+
+        self._executor: Executor = create_executor(max_workers, cpu_bound=kind == 'python')
+        self._condition = threading.Condition()
+        self._pending: deque[tuple[Future, int, Callable, tuple, dict]] = deque()
+        self._running: int = 0
+        self._shutdown: bool = False
+        self._local = threading.local()
+
+        self._step: int = 1
+        self._throughput: float = 0.0
+        self._window_start: float = time.perf_counter()
+        self._window_weight: int = 0
+        self._window_tasks: int = 0
+
+    def submit(self, fn: Callable[..., T], /, *args, **kwargs) -> Future:
+        return self.submit_weighted(1, fn, *args, **kwargs)
+
+    def submit_weighted(self, weight: int, fn: Callable[..., T], /, *args, **kwargs) -> Future:
+        """
+        Submit a task that processes a known amount of work.
+
+        :param weight: Amount of work, such as the amount of bytes, the task processes.
+        :param fn: Function to run.
+        :return: Future of the result of the function
+        """
+
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+
+            self._pending.append((future, weight, fn, args, kwargs))
+            ready = self._take()
+
+        self._dispatch(ready)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                for future, *_ in self._pending:
+                    future.cancel()
+                self._pending.clear()
+
+        if not wait:
+            with self._condition:
+                is_idle: bool = not self._pending and not self._running
+            if is_idle:
+                self._executor.shutdown(wait=False)
+            return
+
+        while True:
+            with self._condition:
+                # Cancelled tasks are dropped from the queue by taking them
+                ready = self._take()
+                if not ready:
+                    if not self._pending and not self._running:
+                        break
+                    self._condition.wait()
+                    continue
+
+            self._dispatch(ready)
+
+        self._executor.shutdown(wait=True)
+
+    def _take(self) -> list[tuple[Future, int, Callable, tuple, dict]]:
+        # Must be called while holding the condition
+        ready: list[tuple[Future, int, Callable, tuple, dict]] = []
+        while self._pending and self._running < self.workers:
+            task = self._pending.popleft()
+            if not task[0].set_running_or_notify_cancel(): continue
+
+            self._running += 1
+            ready.append(task)
+
+        return ready
+
+    def _dispatch(self, ready: list[tuple[Future, int, Callable, tuple, dict]]):
+        # Tasks that finish before their callback is added complete right away, and would dispatch the next ones
+        # recursively, so they are queued for the dispatch that is already running on this thread instead
+        dispatching: list | None = getattr(self._local, 'dispatching', None)
+        if dispatching is not None:
+            dispatching.extend(ready)
+            return
+
+        self._local.dispatching = ready = list(ready)
+        try:
+            while ready:
+                future, weight, fn, args, kwargs = ready.pop(0)
+                try:
+                    inner: Future = self._executor.submit(fn, *args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    self._finish(weight)
+                    continue
+
+                inner.add_done_callback(functools.partial(self._complete, future, weight))
+        finally:
+            self._local.dispatching = None
+
+    def _complete(self, future: Future, weight: int, inner: Future):
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+
+        self._finish(weight)
+
+    def _finish(self, weight: int):
+        with self._condition:
+            self._running -= 1
+            if self.adaptive:
+                self._measure(weight)
+
+            ready = self._take()
+            is_idle: bool = self._shutdown and not self._pending and not self._running
+            self._condition.notify_all()
+
+        self._dispatch(ready)
+
+        # Executors that were shut down without waiting are only shut down once their queue is empty
+        if is_idle:
+            self._executor.shutdown(wait=False)
+
+    def _measure(self, weight: int):
+        # Must be called while holding the condition
+        self._window_weight += weight
+        self._window_tasks += 1
+
+        elapsed: float = time.perf_counter() - self._window_start
+        if elapsed < self.interval or self._window_tasks < self.workers:
+            return
+
+        # Throughput drops while the last tasks finish, which says nothing about the amount of workers
+        if self._pending:
+            # More workers are only worth it if they make it faster, while fewer are worth it unless it gets slower
+            throughput: float = self._window_weight / elapsed
+            if throughput < self._throughput * (1 - self.TOLERANCE) or \
+                    (self._step > 0 and throughput <= self._throughput * (1 + self.TOLERANCE)):
+                self._step = -self._step
+            self._throughput = throughput
+
+            workers: int = min(max(self.workers + self._step * max(self.workers // 4, 1), 1), self.max_workers)
+            if workers == 1:
+                self._step = 1
+
+            if workers != self.workers:
+                self.workers = workers
+                self.history.append(workers)
+
+        self._window_start = time.perf_counter()
+        self._window_weight = 0
+        self._window_tasks = 0
+
+def map_jobs(func: Callable[..., T], jobs: Iterable[dict[str, Any]], max_workers: int | None = None) -> list[T]:
+    """
+    Run a library operation over multiple inputs in parallel, such as extracting or compressing many files.
+
+    Operations mostly run Python code while parsing and laying out archives, so they are run on processes unless
+    the interpreter is free-threaded. The function has to be defined at the top level of a module.
+
+    :param func: Operation to run, such as fps4.extract or tlzc.compress.
+    :param jobs: Keyword arguments for each call of the operation.
+    :param max_workers: If specified, the amount of workers. Otherwise, it is adjusted to the measured throughput.
+    :return: Results of each call, in the same order as the jobs
+    """
+
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    with schedule('python', max_workers, tasks=len(jobs)) as executor:
+        futures: list[Future] = [executor.submit(func, **job) for job in jobs]
+        return [future.result() for future in futures]
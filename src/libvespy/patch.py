@@ -0,0 +1,486 @@
+from typing import BinaryIO
+import json
+import zlib
+import os
+
+from libvespy.instrument import Observer, stage
+from libvespy.utils import ArchiveReader, ArchiveWriter, create_writer, hash_chunks, hash_data
+from libvespy.export import get_fps4_members, get_scenario_members
+from libvespy.index import ArchiveIndex, Member, detect_format
+from libvespy.parallel import schedule
+
+# Patch files start with the magic and version, followed by the literal data of the target, the JSON description of
+# the target and the offset of the description. They end with the magic again, so truncated patches are detected.
+MAGIC: bytes = b'VESPATCH'
+VERSION: int = 1
+
+# Literal data is stored in pieces of at most this size, so neither building nor applying a patch holds more of it
+CHUNK_SIZE: int = 0x100000
+
+# Size of the blocks that changed members of the same size are compared in when delta encoding them
+BLOCK_SIZE: int = 0x1000
+
+# A description is a list of extents that lay out the target file from start to end:
+#   ["copy", source offset, length]                        - A range of the source file.
+#   ["data", patch offset, stored length, length, zlib]    - Literal data stored in the patch, compressed if zlib.
+#   ["zero", length]                                       - Null bytes, such as padding.
+Extent = list
+
+
+def diff(source: str, target: str, output: str, index: ArchiveIndex | None = None, delta: bool = True,
+         observer: Observer | None = None) -> dict[str, int]:
+    """
+    Create a patch that turns an FPS4 or Scenario file into a newer version of it.
+
+    Members are compared by the entry tables of both files. Only members that changed or were added are stored in the
+    patch, and unchanged members are copied from the source file when the patch is applied. If both files are in an
+    up-to-date index, members are compared by their hashes, so unchanged members are never read. Otherwise, members of
+    the same name and size are compared in chunks, stopping at the first difference.
+
+    :param source: Path to the FPS4 or Scenario file the patch will be applied to.
+    :param target: Path to the newer version of the file.
+    :param output: Path to where the patch will be saved.
+    :param index: If specified, index with the hashes of the members of both files.
+    :param delta: If changed members should be stored as the differences to the member they replace, instead of
+        whole.
+    :param observer: If specified, receives an event for every member of the target file.
+    :return: Amount of unchanged, changed, added and removed members, and the size of the patch
+    """
+
+    for path in (source, target):
+        if os.path.exists(output) and os.path.samefile(path, output):
+            raise PatchError(f"[ERROR]\tOutput of the patch can not be {path}.")
+
+    with ArchiveReader.open(source) as src, ArchiveReader.open(target) as tgt:
+        src_format: str = detect_format(src.read(0, 8))
+        if src_format not in ('fps4', 'scenario'):
+            raise PatchError(f"[ERROR]\t{source} is not an FPS4 or Scenario file.")
+        if detect_format(tgt.read(0, 8)) != src_format:
+            raise PatchError(f"[ERROR]\t{target} is not an {src_format.upper()} file like {source}.")
+
+        src_members: list[tuple[str, int, int]] = get_members(src, source)
+        tgt_members: list[tuple[str, int, int]] = get_members(tgt, target)
+        src_hashes: dict[tuple[int, int], str] = get_member_hashes(index, source)
+        tgt_hashes: dict[tuple[int, int], str] = get_member_hashes(index, target)
+
+        # Unchanged members are found by name, or anywhere in the source by hash if it was moved or renamed
+        by_name: dict[str, tuple[int, int]] = {}
+        for name, offset, size in src_members:
+            by_name.setdefault(name, (offset, size))
+        by_hash: dict[str, tuple[int, int]] = {h: member_range for member_range, h in src_hashes.items()}
+
+        header_size: int = min((offset for _, offset, _ in src_members), default=len(src))
+        stats: dict[str, int] = {'unchanged': 0, 'changed': 0, 'added': 0, 'removed': 0}
+        matched: set[tuple[int, int]] = set()
+
+        with open(output, "w+b") as f:
+            writer = PatchWriter(f, src, tgt)
+
+            # Headers change along with the members, but most of their entries stay the same
+            tgt_header_size: int = min((offset for _, offset, _ in tgt_members), default=len(tgt))
+            if delta:
+                writer.add_delta(0, header_size, 0, tgt_header_size)
+            else:
+                writer.add_target(0, tgt_header_size)
+
+            for name, offset, size in sorted(tgt_members, key=lambda member: member[1]):
+                with stage(observer, 'patch.diff', 'member', name) as record:
+                    size = max(min(size, len(tgt) - offset), 0)
+                    end: int = offset + size
+                    if end <= writer.position:
+                        # Members sharing their data with a previous one are already laid out
+                        continue
+
+                    # Headers, padding and the parts of overlapping members that were not laid out yet
+                    writer.add_target(writer.position, max(offset - writer.position, 0))
+                    offset = writer.position
+                    size = end - offset
+
+                    content_hash: str | None = tgt_hashes.get((offset, size))
+                    candidate: tuple[int, int] | None = by_hash.get(content_hash) if content_hash else None
+                    if candidate is None:
+                        candidate = by_name.get(name)
+                        if candidate is not None and candidate in src_hashes and content_hash is not None:
+                            # Both hashes are known, and the contents would have been found by hash if they were equal
+                            unchanged: bool = False
+                        else:
+                            unchanged = candidate is not None and candidate[1] == size and \
+                                is_range_equal(src, candidate[0], tgt, offset, size)
+                    else:
+                        unchanged = True
+
+                    if unchanged:
+                        writer.add_copy(candidate[0], size)
+                        stats['unchanged'] += 1
+                    elif candidate is not None:
+                        record.bytes = writer.add_delta(candidate[0], candidate[1], offset, size) if delta else \
+                            writer.add_target(offset, size)
+                        stats['changed'] += 1
+                    else:
+                        record.bytes = writer.add_target(offset, size)
+                        stats['added'] += 1
+
+                    if candidate is not None:
+                        matched.add(candidate)
+
+            # Data after the last member, such as a member without an entry, is compared to the one of the source
+            src_end: int = max((offset + size for _, offset, size in src_members), default=len(src))
+            if delta and src_end < len(src):
+                writer.add_delta(src_end, len(src) - src_end, writer.position, len(tgt) - writer.position)
+            else:
+                writer.add_target(writer.position, len(tgt) - writer.position)
+
+            stats['removed'] = len({(offset, size) for _, offset, size in src_members} - matched)
+            stats['size'] = writer.close({
+                'format': src_format,
+                'source': {'size': len(src), 'header_size': header_size,
+                           'header_hash': hash_data(src.read(0, header_size))},
+                'target': {'size': len(tgt), 'hash': hash_chunks(tgt.read_chunks(0, len(tgt), CHUNK_SIZE))},
+            })
+
+            f.close()
+
+    return stats
+
+def apply(source: str, patch: str, output: str, max_threads: int | None = None,
+          observer: Observer | None = None) -> int:
+    """
+    Apply a patch to an FPS4 or Scenario file, creating the newer version of the file it was made from.
+
+    Unchanged members are copied straight from the source file by the kernel, so only the data stored in the patch is
+    read. The patched file is then compared to the hash of the newer version, so changes to the copied members of the
+    source file are detected.
+
+    :param source: Path to the file the patch was made for.
+    :param patch: Path to the patch.
+    :param output: Path to where the patched file will be saved. It can not be the source file.
+    :param max_threads: If specified, the amount of threads used for copying data into the file. Otherwise, it is
+        adjusted to the measured throughput.
+    :param observer: If specified, receives an event once the file is patched.
+    :return: Size of the patched file
+    """
+
+    if os.path.exists(output) and os.path.samefile(source, output):
+        raise PatchError("[ERROR]\tOutput of a patch can not be its source file.")
+
+    with open(patch, "rb") as pf, ArchiveReader.open(source) as src, \
+            stage(observer, 'patch.apply', 'apply', output) as record:
+        description: dict = read_description(pf)
+
+        expected: dict = description['source']
+        if len(src) != expected['size'] or \
+                hash_data(src.read(0, expected['header_size'])) != expected['header_hash']:
+            raise PatchError(f"[ERROR]\tPatch {patch} was not made for {source}.")
+
+        extents: list[tuple[int, Extent]] = []
+        position: int = 0
+        for extent in description['extents']:
+            extents.append((position, extent))
+            position += extent[3] if extent[0] == 'data' else extent[-1]
+
+        target_size: int = description['target']['size']
+        if position != target_size:
+            raise PatchError(f"[ERROR]\tPatch {patch} is corrupted.")
+
+        with open(output, "w+b") as f:
+            writer: ArchiveWriter = create_writer(f)
+            try:
+                writer.reserve(target_size)
+
+                def write_extent(offset: int, extent: Extent):
+                    match extent[0]:
+                        case 'copy':
+                            if writer.copy_range_at(offset, src.file.fileno(), extent[1], extent[2]) != extent[2]:
+                                raise PatchError(f"[ERROR]\tSource file {source} is truncated.")
+                        case 'data':
+                            writer.write_at(offset, read_data(pf, extent))
+
+                # Null bytes are left as holes
+                tasks: list[tuple[int, Extent]] = [(offset, extent) for offset, extent in extents
+                                                   if extent[0] != 'zero']
+                with schedule('io', max_threads, path=output, tasks=len(tasks)) as executor:
+                    futures = [executor.submit_weighted(extent[-1] if extent[0] == 'copy' else extent[3],
+                                                        write_extent, offset, extent)
+                               for offset, extent in tasks]
+                    for future in futures:
+                        future.result()
+
+                writer.seek(target_size)
+                writer.pad(0)
+            finally:
+                writer.close()
+
+            f.seek(0)
+            output_hash: str = hash_chunks(iter(lambda: f.read(CHUNK_SIZE), b''))
+            f.close()
+
+        if output_hash != description['target']['hash']:
+            os.remove(output)
+            raise PatchError(f"[ERROR]\tPatched file does not match the file {patch} was made from.")
+
+        record.bytes = target_size
+        pf.close()
+
+    return target_size
+
+def get_members(reader: ArchiveReader, filename: str = "") -> list[tuple[str, int, int]]:
+    """
+    :return: Name, absolute address and size of every member of an FPS4 or Scenario file that has data
+    """
+
+    if detect_format(reader.read(0, 8)) == 'fps4':
+        return get_fps4_members(reader, filename)
+
+    return get_scenario_members(reader)
+
+def get_member_hashes(index: ArchiveIndex | None, path: str) -> dict[tuple[int, int], str]:
+    """
+    :return: Hashes of the members of a file by their address and size, if the file is up-to-date in the index
+    """
+
+    if index is None:
+        return {}
+
+    members: list[Member] | None = index.get_members(path)
+
+    return {} if members is None else {(member.offset, member.size): member.hash for member in members}
+
+def is_range_equal(a: ArchiveReader, a_offset: int, b: ArchiveReader, b_offset: int, size: int) -> bool:
+    """Compare ranges of two files in chunks, stopping at the first chunk that differs."""
+    for position in range(0, size, CHUNK_SIZE):
+        length: int = min(CHUNK_SIZE, size - position)
+        if a.read(a_offset + position, length) != b.read(b_offset + position, length):
+            return False
+
+    return True
+
+def get_common_prefix(a: ArchiveReader, a_offset: int, b: ArchiveReader, b_offset: int, size: int) -> int:
+    """Get the length of the common start of two ranges of at most a size, comparing them in chunks."""
+    position: int = 0
+    while position < size:
+        length: int = min(CHUNK_SIZE, size - position)
+        a_chunk: bytes = a.read(a_offset + position, length)
+        b_chunk: bytes = b.read(b_offset + position, length)
+        if a_chunk != b_chunk:
+            return position + get_first_difference(a_chunk, b_chunk)
+
+        position += length
+
+    return size
+
+def get_common_suffix(a: ArchiveReader, a_end: int, b: ArchiveReader, b_end: int, size: int) -> int:
+    """Get the length of the common end of two ranges of at most a size, comparing them in chunks."""
+    position: int = 0
+    while position < size:
+        length: int = min(CHUNK_SIZE, size - position)
+        a_chunk: bytes = a.read(a_end - position - length, length)
+        b_chunk: bytes = b.read(b_end - position - length, length)
+        if a_chunk != b_chunk:
+            return position + get_first_difference(a_chunk[::-1], b_chunk[::-1])
+
+        position += length
+
+    return size
+
+def get_first_difference(a: bytes, b: bytes) -> int:
+    """Get the position of the first byte that differs between two different chunks of the same size."""
+    start: int = 0
+    while a[start:start + BLOCK_SIZE] == b[start:start + BLOCK_SIZE]:
+        start += BLOCK_SIZE
+
+    return next(i for i in range(start, start + BLOCK_SIZE) if a[i] != b[i])
+
+def read_description(pf: BinaryIO) -> dict:
+    """
+    :param pf: Opened patch file.
+    :return: Description of the target file
+    """
+
+    pf.seek(0, os.SEEK_END)
+    size: int = pf.tell()
+
+    pf.seek(0)
+    start: bytes = pf.read(len(MAGIC) + 4)
+    pf.seek(max(size - len(MAGIC) - 8, 0))
+    end: bytes = pf.read()
+
+    if size < (len(MAGIC) + 8) * 2 or start[:len(MAGIC)] != MAGIC or end[8:] != MAGIC:
+        raise PatchError("[ERROR]\tFile is not a patch, or is truncated.")
+    if int.from_bytes(start[len(MAGIC):], 'little') != VERSION:
+        raise PatchError(f"[ERROR]\tUnsupported patch version: {int.from_bytes(start[len(MAGIC):], 'little')}")
+
+    offset: int = int.from_bytes(end[:8], 'little')
+    pf.seek(offset)
+
+    return json.loads(pf.read(size - len(MAGIC) - 8 - offset))
+
+def read_data(pf: BinaryIO, extent: Extent) -> bytes:
+    """Read the literal data of an extent from a patch file. Multiple threads may read at the same time."""
+    _, offset, stored_size, size, compressed = extent
+
+    data: bytes = os.pread(pf.fileno(), stored_size, offset)
+    try:
+        data = zlib.decompress(data) if compressed else data
+    except zlib.error as e:
+        raise PatchError(f"[ERROR]\tPatch data at {offset:#x} is corrupted.") from e
+
+    if len(data) != size:
+        raise PatchError(f"[ERROR]\tPatch data at {offset:#x} is corrupted.")
+
+    return data
+
+
+class PatchWriter:
+    """
+    Writer of the extents of a patch, from the start to the end of the target file.
+
+    Consecutive copies of the source and null bytes are merged into single extents, so unchanged parts of the
+    source are copied in as few pieces as possible.
+    """
+
+    def __init__(self, file: BinaryIO, source: ArchiveReader, target: ArchiveReader):
+        """
+        :param file: File opened for writing that the patch will be written into.
+        :param source: Reader of the file the patch will be applied to.
+        :param target: Reader of the newer version of the file.
+        """
+
+        self.file: BinaryIO = file
+        self.source: ArchiveReader = source
+        self.target: ArchiveReader = target
+        self.extents: list[Extent] = []
+        self.position: int = 0
+
+        self.file.write(MAGIC + VERSION.to_bytes(4, 'little') + bytes(4))
+
+    def add_copy(self, source_offset: int, length: int):
+        """Copy a range of the source file to the target."""
+        if not length:
+            return
+
+        last: Extent | None = self.extents[-1] if self.extents else None
+        if last is not None and last[0] == 'copy' and last[1] + last[2] == source_offset:
+            last[2] += length
+        else:
+            self.extents.append(['copy', source_offset, length])
+
+        self.position += length
+
+    def add_target(self, offset: int, length: int) -> int:
+        """
+        Store a range of the target file in the patch.
+
+        :return: Amount of bytes stored
+        """
+
+        stored: int = 0
+        for position in range(offset, offset + length, CHUNK_SIZE):
+            data: bytes = self.target.read(position, min(CHUNK_SIZE, offset + length - position))
+            if data.count(0) != len(data):
+                stored += self.add_data(data)
+                continue
+
+            last: Extent | None = self.extents[-1] if self.extents else None
+            if last is not None and last[0] == 'zero':
+                last[1] += len(data)
+            else:
+                self.extents.append(['zero', len(data)])
+
+            self.position += len(data)
+
+        return stored
+
+    def add_data(self, data: bytes) -> int:
+        """
+        Store literal data in the patch, compressed if that makes it smaller.
+
+        :return: Amount of bytes stored
+        """
+
+        compressed: bytes = zlib.compress(data)
+        stored: bytes = compressed if len(compressed) < len(data) else data
+
+        self.extents.append(['data', self.file.tell(), len(stored), len(data), stored is compressed])
+        self.file.write(stored)
+        self.position += len(data)
+
+        return len(stored)
+
+    def add_delta(self, source_offset: int, source_size: int, offset: int, size: int) -> int:
+        """
+        Store a changed member as the differences to the member of the source file it replaces.
+
+        The common start and end of both members are copied from the source. If what is left of both is of the same
+        size, such as after data was changed in place, it is compared block by block, and only the bytes that differ
+        are stored.
+
+        :return: Amount of bytes stored
+        """
+
+        prefix: int = get_common_prefix(self.source, source_offset, self.target, offset, min(source_size, size))
+        suffix: int = get_common_suffix(self.source, source_offset + source_size, self.target, offset + size,
+                                        min(source_size, size) - prefix)
+
+        self.add_copy(source_offset, prefix)
+
+        stored: int = 0
+        start, end = offset + prefix, offset + size - suffix
+        if end - start != source_size - suffix - prefix:
+            stored += self.add_target(start, end - start)
+        else:
+            difference: int = source_offset - offset
+            changed: int | None = None
+            for position in range(start, end, BLOCK_SIZE):
+                length: int = min(BLOCK_SIZE, end - position)
+                if self.source.read(position + difference, length) != self.target.read(position, length):
+                    changed = position if changed is None else changed
+                    continue
+
+                if changed is not None:
+                    stored += self.add_changed(changed + difference, changed, position - changed)
+                    changed = None
+
+                self.add_copy(position + difference, length)
+
+            if changed is not None:
+                stored += self.add_changed(changed + difference, changed, end - changed)
+
+        self.add_copy(source_offset + source_size - suffix, suffix)
+
+        return stored
+
+    def add_changed(self, source_offset: int, offset: int, size: int) -> int:
+        """
+        Store a changed range of the target that is as large as the range of the source it replaces, copying the
+        bytes at its start and end that did not change.
+
+        :return: Amount of bytes stored
+        """
+
+        prefix: int = get_common_prefix(self.source, source_offset, self.target, offset, size)
+        suffix: int = get_common_suffix(self.source, source_offset + size, self.target, offset + size, size - prefix)
+
+        self.add_copy(source_offset, prefix)
+        stored: int = self.add_target(offset + prefix, size - prefix - suffix)
+        self.add_copy(source_offset + size - suffix, suffix)
+
+        return stored
+
+    def close(self, description: dict) -> int:
+        """
+        Write the description of the target after the stored data.
+
+        :param description: Format, source and target of the patch. The extents are added to it.
+        :return: Size of the patch
+        """
+
+        offset: int = self.file.tell()
+        self.file.write(json.dumps({**description, 'extents': self.extents}, separators=(',', ':')).encode())
+        self.file.write(offset.to_bytes(8, 'little') + MAGIC)
+        self.file.flush()
+
+        return self.file.tell()
+
+
+class PatchError(Exception):
+    """"""
@@ -0,0 +1,378 @@
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Literal
+import hashlib
+import glob
+import json
+import os
+
+from libvespy.parallel import schedule
+from libvespy import fps4, tlzc, scenario
+
+
+# Options that are passed through from a step declaration to its operation
+OPERATIONS: dict[str, set[str]] = {
+    'tlzc.decompress': {'comp_type', 'memory_budget'},
+    'tlzc.compress': {'comp_type', 'nice_len', 'max_workers', 'level', 'strategy', 'lzma_options', 'memory_budget'},
+    'fps4.extract': {'ignore_metadata', 'max_threads', 'members', 'io_strategy', 'memory_budget'},
+    'fps4.pack': {'max_threads', 'compress', 'compress_members', 'max_workers', 'io_strategy', 'memory_budget',
+                  'optimize_layout', 'groups'},
+    'scenario.extract': {'decompress', 'max_threads', 'io_strategy', 'memory_budget'},
+    'scenario.pack': {'compress', 'max_threads', 'io_strategy', 'memory_budget'},
+}
+
+STATE_VERSION: int = 1
+
+
+@dataclass
+class Step:
+    """
+    A single operation of a pipeline.
+
+    Steps depend on the steps that produce their inputs, either as the exact path or as a directory containing it.
+    """
+
+    id: str
+    op: str
+    input: str
+    output: str
+    manifest: str = ""
+    options: dict[str, Any] = field(default_factory=dict)
+    inputs: list[str] = field(default_factory=list)
+    depends: set[str] = field(default_factory=set)
+
+    @property
+    def outputs(self) -> list[str]:
+        return [self.output, self.manifest] if self.manifest else [self.output]
+
+    def get_inputs(self) -> list[str]:
+        """
+        :return: Every path the result of the step depends on
+        """
+
+        inputs: list[str] = [self.input, *self.inputs]
+
+        # Packing reads the members listed in the manifest, which may live anywhere
+        if self.op == 'fps4.pack' and os.path.isfile(self.input):
+            with open(self.input, "r") as f:
+                manifest: dict = json.load(f)
+                f.close()
+
+            # Members missing from disk are left out of the archive, so they are not required
+            inputs += [file['path'] for file in manifest.get('files', []) if os.path.isfile(file.get('path', ''))]
+
+        return inputs
+
+
+def load(filename: str) -> list[Step]:
+    """
+    Load the steps declared in a pipeline file.
+
+    A pipeline file is a JSON object with a list of "pipelines", each being a chain of "steps". If a pipeline has a
+    "foreach" glob pattern, its steps are repeated for every matching path, with "{path}", "{name}" and "{stem}"
+    in step paths replaced by the matched path, its file name, and its file name without extension.
+    Relative paths are relative to the directory of the pipeline file.
+
+    :param filename: Path to pipeline file.
+    :return: Declared steps
+    """
+
+    with open(filename, "r") as f:
+        declaration: dict = json.load(f)
+        f.close()
+
+    base_dir: str = os.path.dirname(os.path.abspath(filename))
+    resolve = lambda path: os.path.normpath(os.path.join(base_dir, path))
+
+    steps: list[Step] = []
+    for p, pipeline in enumerate(declaration.get('pipelines', [])):
+        pipeline_name: str = pipeline.get('name', str(p))
+
+        items: list[str | None] = [None]
+        if pipeline.get('foreach'):
+            items = sorted(glob.glob(resolve(pipeline['foreach']), recursive=True))
+
+        for item in items:
+            substitutions: dict[str, str] = {}
+            if item is not None:
+                substitutions = {
+                    'path': item,
+                    'name': os.path.basename(item),
+                    'stem': os.path.splitext(os.path.basename(item))[0],
+                }
+
+            for s, declared in enumerate(pipeline.get('steps', [])):
+                op: str = declared.get('op', '')
+                if op not in OPERATIONS:
+                    raise PipelineError(f"[ERROR]\tUnknown operation \"{op}\" in pipeline {pipeline_name}.")
+                if not declared.get('input') or not declared.get('output'):
+                    raise PipelineError(f"[ERROR]\tStep {s} of pipeline {pipeline_name} needs an input and output.")
+                if op == 'fps4.extract' and not declared.get('manifest'):
+                    raise PipelineError(f"[ERROR]\tStep {s} of pipeline {pipeline_name} needs a manifest path.")
+
+                expand = lambda path: resolve(path.format(**substitutions)) if path else ""
+
+                step_name: str = declared.get('name', op)
+                steps.append(Step(
+                    id=f"{pipeline_name}:{substitutions.get('name', '')}:{s}:{step_name}",
+                    op=op,
+                    input=expand(declared['input']),
+                    output=expand(declared['output']),
+                    manifest=expand(declared.get('manifest', '')),
+                    options={k: v for k, v in declared.items() if k in OPERATIONS[op]},
+                    inputs=[expand(path) for path in declared.get('inputs', [])],
+                ))
+
+    link(steps)
+    return steps
+
+def link(steps: list[Step]):
+    """
+    Resolve the dependencies between steps, and check that they form a DAG.
+
+    :param steps: Steps to link.
+    :return: None
+    """
+
+    producers: dict[str, str] = {}
+    for step in steps:
+        for output in step.outputs:
+            if output in producers:
+                raise PipelineError(f"[ERROR]\t{output} is produced by both {producers[output]} and {step.id}.")
+            producers[output] = step.id
+
+    for step in steps:
+        for path in [step.input, *step.inputs]:
+            # Walk up the path, as steps that output a directory produce everything within it
+            current: str = path
+            while True:
+                if current in producers and producers[current] != step.id:
+                    step.depends.add(producers[current])
+                    break
+
+                parent: str = os.path.dirname(current)
+                if parent == current: break
+                current = parent
+
+    # Check for cycles
+    remaining: dict[str, set[str]] = {step.id: set(step.depends) for step in steps}
+    while remaining:
+        ready: list[str] = [i for i, depends in remaining.items() if not depends]
+        if not ready:
+            raise PipelineError(f"[ERROR]\tPipeline steps have circular dependencies: {', '.join(remaining)}")
+
+        for i in ready:
+            del remaining[i]
+        for depends in remaining.values():
+            depends.difference_update(ready)
+
+def build(steps: list[Step], state_file: str, max_workers: int | None = None, force: bool = False,
+          dry_run: bool = False) -> dict[str, Literal['built', 'skipped']]:
+    """
+    Run steps in dependency order, skipping the ones whose inputs have not changed since they were last built.
+
+    Independent steps run in parallel. The state file records the hashes of the inputs each step was last built
+    from, and is updated after every finished step, so an interrupted build resumes where it stopped.
+
+    :param steps: Steps to run, as returned by load.
+    :param state_file: Path to the state file.
+    :param max_workers: If specified, the maximum amount of steps that can run at the same time. Otherwise, it is
+        adjusted to the measured throughput.
+    :param force: If steps should be run even if they are unchanged.
+    :param dry_run: If the steps that would be run should only be reported.
+    :return: Status of every step
+    """
+
+    state: BuildState = BuildState.load(state_file)
+    by_id: dict[str, Step] = {step.id: step for step in steps}
+    dependents: dict[str, list[str]] = {step.id: [] for step in steps}
+    waiting: dict[str, int] = {}
+    for step in steps:
+        waiting[step.id] = len(step.depends)
+        for dependency in step.depends:
+            dependents[dependency].append(step.id)
+
+    results: dict[str, Literal['built', 'skipped']] = {}
+    errors: list[str] = []
+    ready: list[str] = [step.id for step in steps if not step.depends]
+    running: dict[Future, tuple[str, str]] = {}
+
+    def _finish(step_id: str, status: Literal['built', 'skipped']):
+        results[step_id] = status
+        for dependent in dependents[step_id]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                ready.append(dependent)
+
+    with schedule('python', max_workers, tasks=len(steps)) as executor:
+        while ready or running:
+            while ready and not errors:
+                step: Step = by_id[ready.pop(0)]
+
+                # Dependencies of a step that would be rebuilt are unknown without running it
+                if dry_run:
+                    stale: bool = any(results.get(d) == 'built' for d in step.depends)
+                    digest: str = "" if stale else state.digest(step)
+                else:
+                    digest: str = state.digest(step)
+
+                is_unchanged: bool = (digest and digest == state.steps.get(step.id)
+                                      and all(os.path.exists(output) for output in step.outputs))
+                if is_unchanged and not force:
+                    _finish(step.id, 'skipped')
+                elif dry_run:
+                    _finish(step.id, 'built')
+                else:
+                    running[executor.submit(run_step, step.op, step.input, step.output, step.manifest,
+                                            step.options)] = (step.id, digest)
+
+            if not running: break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id, digest = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"{step_id}: {e}")
+                    state.steps.pop(step_id, None)
+                else:
+                    state.steps[step_id] = digest
+                    _finish(step_id, 'built')
+
+            if not dry_run: state.save()
+
+    if errors:
+        raise PipelineError("[ERROR]\tPipeline failed.\n" + "\n".join(errors))
+
+    return results
+
+def run_step(op: str, input_path: str, output: str, manifest: str, options: dict[str, Any]):
+    """
+    Run a single operation, creating the directories of its outputs.
+
+    :param op: Name of the operation, one of OPERATIONS.
+    :param input_path: Path to the input of the operation.
+    :param output: Path to the output of the operation.
+    :param manifest: (FPS4 Extraction Only) Path to where the manifest will be saved.
+    :param options: Options of the operation.
+    :return: None
+    """
+
+    for path in (output, manifest):
+        if path and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    match op:
+        case 'tlzc.decompress':
+            tlzc.decompress(input_path, output, **options)
+        case 'tlzc.compress':
+            tlzc.compress(input_path, output, **options)
+        case 'fps4.extract':
+            if not os.path.isdir(output):
+                os.makedirs(output)
+            if options.get('members') is not None:
+                options = dict(options, members=fps4.MemberFilter(**options['members']))
+            fps4.extract(input_path, output, manifest, **options)
+        case 'fps4.pack':
+            if options.get('compress_members') is not None:
+                options = dict(options, compress_members=fps4.MemberFilter(**options['compress_members']))
+            if options.get('groups') is not None:
+                options = dict(options, groups=[fps4.MemberFilter(**group) for group in options['groups']])
+            fps4.pack_from_manifest(output, input_path, **options)
+        case 'scenario.extract':
+            scenario.extract(input_path, output, **options)
+        case 'scenario.pack':
+            scenario.pack(input_path, output, **options)
+
+
+class BuildState:
+    """
+    Hashes of built steps and of the files they were built from.
+
+    File hashes are cached by size and modification time, so unchanged files are not read again.
+    """
+
+    def __init__(self, filename: str, files: dict[str, list] | None = None, steps: dict[str, str] | None = None):
+        self.filename: str = filename
+        self.files: dict[str, list] = files or {}
+        self.steps: dict[str, str] = steps or {}
+
+    @staticmethod
+    def load(filename: str) -> 'BuildState':
+        if not os.path.isfile(filename):
+            return BuildState(filename)
+
+        with open(filename, "r") as f:
+            data: dict = json.load(f)
+            f.close()
+
+        # Outdated states are discarded, which rebuilds everything
+        if data.get('version') != STATE_VERSION:
+            return BuildState(filename)
+
+        return BuildState(filename, data.get('files'), data.get('steps'))
+
+    def save(self):
+        if os.path.dirname(self.filename) and not os.path.isdir(os.path.dirname(self.filename)):
+            os.makedirs(os.path.dirname(self.filename))
+
+        # Replace the state at once, so an interruption can not leave it half written
+        temp: str = f"{self.filename}.tmp"
+        with open(temp, "w") as f:
+            json.dump({'version': STATE_VERSION, 'files': self.files, 'steps': self.steps}, f)
+            f.flush()
+            f.close()
+
+        os.replace(temp, self.filename)
+
+    def hash_file(self, path: str) -> str:
+        stat: os.stat_result = os.stat(path)
+        cached: list | None = self.files.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        with open(path, "rb") as f:
+            file_hash: str = hashlib.file_digest(f, 'sha256').hexdigest()
+            f.close()
+
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+        return file_hash
+
+    def hash_path(self, path: str) -> str:
+        """
+        :return: Hash of a file, or of the names and contents of all files in a directory
+        """
+
+        if os.path.isfile(path):
+            return self.hash_file(path)
+
+        if not os.path.isdir(path):
+            raise PipelineError(f"[ERROR]\tInput {path} does not exist.")
+
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                file_path: str = os.path.join(root, file)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(bytes.fromhex(self.hash_file(file_path)))
+
+        return digest.hexdigest()
+
+    def digest(self, step: Step) -> str:
+        """
+        :return: Hash of everything the result of the step depends on
+        """
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([step.op, step.outputs, step.options], sort_keys=True).encode('utf-8'))
+        for path in step.get_inputs():
+            digest.update(path.encode('utf-8'))
+            digest.update(bytes.fromhex(self.hash_path(path)))
+
+        return digest.hexdigest()
+
+
+class PipelineError(Exception):
+    """"""
@@ -1,24 +1,38 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor, Future
 from collections import namedtuple
+from typing import BinaryIO, Literal
 import hashlib
 import ctypes
-import mmap
 import sys
 import os
 
-from libvespy.utils import expand_and_write
-from libvespy.structs import ScenarioHeader, ScenarioEntry
+from libvespy.utils import ArchiveReader, IOStrategy, create_writer
+from libvespy.instrument import Observer, stage
+from libvespy.parallel import schedule
+from libvespy.memory import MemoryBudget, create_spill_file, get_memory_budget, spill
+from libvespy.structs import ScenarioHeader, ScenarioEntry, TLZCHeader
+from libvespy import tlzc
 
 
-def extract(filename: str, out_dir: str = "", max_threads: int = 8):
+def extract(filename: str, out_dir: str = "", max_threads: int | None = None, decompress: bool = False,
+            observer: Observer | None = None, io_strategy: IOStrategy = 'mmap',
+            memory_budget: MemoryBudget | int | str | None = None):
     """
     Extract Scenario file.
 
     :param filename: Path to Scenario file.
     :param out_dir: Path to where the extracted files will be saved.
-    :param max_threads: The maximum amount of threads that can be used for extraction.
+    :param max_threads: If specified, the amount of threads used for extraction. Otherwise, it starts from the storage
+        of out_dir, or the amount of CPUs when decompressing, and is adjusted to the measured throughput.
+    :param decompress: If the TLZC compressed entries should be decompressed while they are extracted.
+    :param observer: If specified, receives an event for every finished stage of the extraction.
+    :param io_strategy: How the Scenario file is read. See utils.IOStrategy.
+    :param memory_budget: If specified, budget of the extraction, shared by the entries extracted at the same time.
+        Entries that do not fit into it are written in chunks. See memory.get_memory_budget.
     :return: None
     """
+    budget: MemoryBudget = get_memory_budget(memory_budget)
+
     if not out_dir:
         out_dir = f"{filename}.ext"
         os.makedirs(out_dir)
@@ -26,124 +40,256 @@ def extract(filename: str, out_dir: str = "", max_threads: int = 8):
     if not os.path.isdir(out_dir):
         os.makedirs(out_dir)
 
-    File = namedtuple("File", ["filename", "data"])
+    File = namedtuple("File", ["filename", "offset", "size"])
     file_data: list[File] = []
 
-    with open(filename, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
-
-        header = ScenarioHeader.from_buffer_copy(mm.read(ctypes.sizeof(ScenarioHeader)))
-        _file_size_duplicate: int = int.from_bytes(mm.read(4), 'big')
-        _padding: bytes = mm.read(4)
-
-        for e in range(header.file_count):
-            mm.seek(0x20 + e * 0x20)
-
-            scenario_entry = ScenarioEntry.from_buffer_copy(mm.read(ctypes.sizeof(ScenarioEntry)))
-            if not scenario_entry.file_size_compressed: continue
-
-            mm.seek(scenario_entry.offset + header.file_offset)
-            file_data.append(File(str(e), mm.read(scenario_entry.file_size_compressed)))
-
-        mm.close()
-        f.close()
-
-    def _extract_file(fd: File):
-        with open(os.path.join(out_dir, fd.filename), "w+b") as ef:
-            ef.truncate(len(fd.data))
-            em = mmap.mmap(ef.fileno(), 0, prot=mmap.PROT_WRITE)
-            em.resize(len(fd.data))
-
-            em.write(fd.data)
-
-            em.flush()
-            ef.close()
-
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        for file in file_data:
-            executor.submit(_extract_file, file)
-
-def pack(directory: str, output: str = ""):
+    with ArchiveReader.open(filename, io_strategy) as reader:
+        with stage(observer, 'scenario.extract', 'header', filename) as record:
+            header = ScenarioHeader.from_buffer_copy(reader.read(0, ctypes.sizeof(ScenarioHeader)))
+            _file_size_duplicate: int = reader.read_int(ctypes.sizeof(ScenarioHeader), 4, 'big')
+            record.bytes = ctypes.sizeof(ScenarioHeader) + 4
+
+        with stage(observer, 'scenario.extract', 'entries', filename) as record:
+            for e in range(header.file_count):
+                scenario_entry = ScenarioEntry.from_buffer_copy(reader.read(0x20 + e * 0x20,
+                                                                            ctypes.sizeof(ScenarioEntry)))
+                if not scenario_entry.file_size_compressed: continue
+
+                file_data.append(File(str(e), scenario_entry.offset + header.file_offset,
+                                      scenario_entry.file_size_compressed))
+
+            record.bytes = header.file_count * 0x20
+            record.count = header.file_count
+
+        reader.advise('sequential')
+
+        def _extract_file(fd: File):
+            # Reads do not depend on a position, so the reader can be shared between workers
+            size: int = fd.size
+            if decompress:
+                if reader.read(fd.offset, 4) != b'TLZC':
+                    raise ScenarioError(f"[ERROR]\tEntry {fd.filename} is not TLZC compressed.")
+
+                size += TLZCHeader.from_buffer_copy(reader.read(fd.offset, ctypes.sizeof(TLZCHeader))) \
+                    .file_size_uncompressed
+
+            if not budget.fits(size):
+                _stream_file(fd)
+                return
+
+            with budget.reserve(size):
+                data: bytes = reader.read(fd.offset, fd.size)
+                reader.advise('dontneed', fd.offset, fd.size)
+                if decompress:
+                    with stage(observer, 'scenario.extract', 'codec', fd.filename, int(fd.filename)) as record:
+                        data = tlzc.decompress_data(data)
+                        record.bytes = len(data)
+
+                path: str = os.path.join(out_dir, fd.filename)
+                with stage(observer, 'scenario.extract', 'member', path, int(fd.filename)) as record, \
+                        open(path, "wb") as ef:
+                    record.bytes = ef.write(data)
+
+                    ef.flush()
+                    ef.close()
+
+        def _stream_file(fd: File):
+            # Entries that do not fit into the budget are decompressed and written a chunk at a time
+            path: str = os.path.join(out_dir, fd.filename)
+            with budget.reserve(budget.chunk_size * 2), \
+                    stage(observer, 'scenario.extract', 'member', path, int(fd.filename)) as record, \
+                    open(path, "wb") as ef:
+                if decompress:
+                    chunks = tlzc.decompress_stream(reader.view(fd.offset, fd.size), chunk_size=budget.chunk_size)
+                else:
+                    chunks = reader.read_chunks(fd.offset, fd.size, budget.chunk_size)
+
+                for chunk in chunks:
+                    record.bytes += ef.write(chunk)
+
+                ef.flush()
+                ef.close()
+
+            reader.advise('dontneed', fd.offset, fd.size)
+
+        with schedule('codec' if decompress else 'io', max_threads, out_dir, len(file_data)) as executor:
+            for future in [executor.submit_weighted(file.size, _extract_file, file) for file in file_data]:
+                future.result()
+
+def pack(directory: str, output: str = "", compress: Literal['deflate', 'zlib', 'lzma'] | None = None,
+         max_threads: int | None = None, observer: Observer | None = None, io_strategy: IOStrategy = 'mmap',
+         memory_budget: MemoryBudget | int | str | None = None):
     """
     Pack scenario files.
 
     :param directory: Path to directory of scenario files.
     :param output: Path to where the archived scenario file will be saved.
+    :param compress: If specified, the files in the directory are treated as decompressed and are compressed
+        into TLZC format with this compression type before being archived.
+    :param max_threads: (Compression Only) If specified, the amount of threads used for compression. Otherwise, it
+        starts from the amount of CPUs and is adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the packing.
+    :param io_strategy: How the archive is written. See utils.IOStrategy.
+    :param memory_budget: If specified, budget of the packing. Files that do not fit into it are copied or compressed
+        in chunks, and compressed files that do not fit are kept in temporary files next to the output until they are
+        written. See memory.get_memory_budget.
     :return: None
     """
 
+    budget: MemoryBudget = get_memory_budget(memory_budget)
+
     if not output:
         output = f"{directory}.pck"
+    output_dir: str = os.path.dirname(os.path.abspath(output))
 
     # Get number of files for the archive, including ones skipped from extraction
     # Add one to the max, as the files start count at index 0
     extracted: list[str] = os.listdir(directory)
     header = ScenarioHeader(file_count=max([int(c) for c in extracted]) + 1)
 
-    with open(output, "w+b") as f:
-        # Set initial size if needed
-        if os.path.getsize(output) < header.file_offset: f.truncate(header.file_offset)
-
-        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_WRITE)
-        mm.seek(header.file_offset)
-
-        # Write dummy entry as first entry
-        expand_and_write(mm, bytes.fromhex('44554D4D59'))
-        expand_and_write(mm, bytes(11))
-
-        # Get Files metadata and write to archive
-        previous_hash: str = ""
-        entries: list[ScenarioEntry] = []
-        for i in range(header.file_count):
-            if not str(i) in extracted:
-                entries.append(ScenarioEntry())
-                previous_hash = ""
-                continue
+    def _read_file(name: str) -> tuple[bytes | BinaryIO, int]:
+        # Files, and compressed files, that do not fit into the budget are returned as files to be copied from
+        path: str = os.path.join(directory, name)
+        size: int = os.path.getsize(path)
+
+        if compress is None:
+            if not budget.hold(size):
+                cf: BinaryIO = open(path, "rb")
+                return cf, int.from_bytes(os.pread(cf.fileno(), 4, 0x5), sys.byteorder)
+        elif not budget.fits(size * 2):
+            with budget.reserve(budget.chunk_size * 2), \
+                    stage(observer, 'scenario.pack', 'codec', path, int(name)) as record, open(path, "rb") as cf:
+                compressed: BinaryIO = create_spill_file(output_dir)
+                try:
+                    tlzc.compress_file(cf, compressed, size, compress, max_workers=1, chunk_size=budget.chunk_size)
+                except BaseException:
+                    compressed.close()
+                    raise
+                record.bytes = size
+                cf.close()
 
-            with open(os.path.join(directory, str(i)), "rb") as cf:
-                entry = ScenarioEntry()
+            return compressed, size
 
-                file_hash = hashlib.sha256(cf.read()).hexdigest()
-                is_duplicate_from_previous: bool = file_hash == previous_hash
-                previous_hash = file_hash
+        with budget.reserve(0 if compress is None else size * 2):
+            with stage(observer, 'scenario.pack', 'read', path, int(name)) as record, open(path, "rb") as cf:
+                data: bytes = cf.read()
+                record.bytes = len(data)
+                cf.close()
 
-                # Check Validity
-                # The file size check is for mocking an exception where a duplicate was still valid
-                cm = mmap.mmap(cf.fileno(), 0, prot=mmap.PROT_READ)
-                is_valid: bool = not is_duplicate_from_previous and cm.size() > 0x30
+            if compress is None:
+                return data, int.from_bytes(data[0x5:0x9], sys.byteorder)
 
-                entry.offset = mm.tell() - header.file_offset if is_valid else entries[-1].offset
-                entry.file_size_compressed = cm.size()
+            with stage(observer, 'scenario.pack', 'codec', path, int(name)) as record:
+                record.bytes = len(data)
+                data = tlzc.compress_data(data, compress, max_workers=1)
 
-                cm.seek(0x5)
-                entry.file_size_uncompressed = int.from_bytes(cm.read(4), sys.byteorder)
+        # Compressed files wait until they are written in order, so the ones that do not fit are written out
+        return (data, size) if budget.hold(len(data)) else (spill(data, output_dir), size)
 
-                entries.append(entry)
+    def _release(data: bytes | BinaryIO):
+        if isinstance(data, (bytes, bytearray)):
+            budget.release_held(len(data))
+        else:
+            data.close()
 
-                # No need to write contents if the file is an immediate duplicate of a previous file
-                if is_valid:
-                    cf.seek(0)
-                    expand_and_write(mm, cf.read())
+    # Compress all files ahead of time, as they have to be written into the archive sequentially. Files are already
+    # compressed in parallel, so a single file does not use more threads
+    executor: Executor | None = None
+    compressed: dict[str, Future] = {}
+    if compress is not None:
+        executor = schedule('codec', max_threads, tasks=len(extracted))
+        compressed = {name: executor.submit_weighted(os.path.getsize(os.path.join(directory, name)), _read_file, name)
+                      for name in extracted}
 
-                    # Pad until aligned
-                    if mm.size() % 0x10 != 0:
-                        pad_length: int = 0x10 - mm.size() % 0x10
-                        expand_and_write(mm, bytes(pad_length))
+    with open(output, "w+b") as f:
+        mm = create_writer(f, io_strategy)
+        mm.seek(header.file_offset)
 
-                cm.close()
-                cf.close()
+        # Write dummy entry as first entry
+        mm.write(bytes.fromhex('44554D4D59'))
+        mm.pad(11)
 
-        # Write Header
-        mm.seek(0)
-        header.file_size = mm.size()
-        mm.write(bytearray(header))
-        mm.write(header.file_size.to_bytes(4, sys.byteorder))   # Don't forget the duplicate size entry
-        mm.write(bytes(4))
+        # Get Files metadata and write to archive
+        previous_hash: str = ""
+        entries: list[ScenarioEntry] = []
+        try:
+            for i in range(header.file_count):
+                if not str(i) in extracted:
+                    entries.append(ScenarioEntry())
+                    previous_hash = ""
+                    continue
+
+                data, file_size_uncompressed = compressed.pop(str(i)).result() if executor else _read_file(str(i))
+                try:
+                    entry = ScenarioEntry()
+
+                    if isinstance(data, (bytes, bytearray)):
+                        size: int = len(data)
+                        file_hash = hashlib.sha256(data).hexdigest()
+                    else:
+                        size: int = os.fstat(data.fileno()).st_size
+                        data.seek(0)
+                        file_hash = hashlib.file_digest(data, 'sha256').hexdigest()
+
+                    is_duplicate_from_previous: bool = file_hash == previous_hash
+                    previous_hash = file_hash
+
+                    # Check Validity
+                    # The file size check is for mocking an exception where a duplicate was still valid
+                    is_valid: bool = not is_duplicate_from_previous and size > 0x30
+
+                    entry.offset = mm.tell() - header.file_offset if is_valid else entries[-1].offset
+                    entry.file_size_compressed = size
+                    entry.file_size_uncompressed = file_size_uncompressed
+
+                    entries.append(entry)
+
+                    # No need to write contents if the file is an immediate duplicate of a previous file
+                    if is_valid:
+                        with stage(observer, 'scenario.pack', 'member', output, i) as record:
+                            if isinstance(data, (bytes, bytearray)):
+                                mm.write(data)
+                                record.bytes = size
+                            else:
+                                record.bytes = mm.copy_range_at(mm.tell(), data.fileno(), 0, size)
+                                mm.seek(record.bytes, 1)
+
+                        # Pad until aligned
+                        mm.align(0x10)
+                finally:
+                    _release(data)
+        except BaseException:
+            # Compressed files that were not written yet still hold memory of the budget, or temporary files
+            if executor:
+                executor.shutdown(cancel_futures=True)
+                for future in compressed.values():
+                    if not future.cancelled() and future.exception() is None:
+                        _release(future.result()[0])
+            raise
+
+        if executor: executor.shutdown()
+
+        with stage(observer, 'scenario.pack', 'entries', output) as record:
+            # Write Header
+            header.file_size = mm.size
+            mm.write_at(0, bytearray(header))
+
+            # Don't forget the duplicate size entry
+            mm.write_at(ctypes.sizeof(header), header.file_size.to_bytes(4, sys.byteorder))
+
+            # Write File List/Metadata
+            for i, e in enumerate(entries):
+                mm.write_at(0x20 + i * 0x20, bytearray(e))
+
+            record.bytes = 0x20 + len(entries) * 0x20
+            record.count = len(entries)
+
+        with stage(observer, 'scenario.pack', 'fsync', output) as record:
+            record.bytes = mm.size
+            mm.close()
+            os.fsync(f.fileno())
+        f.close()
 
-        # Write File List/Metadata
-        for i, e in enumerate(entries):
-            mm.seek(0x20 + i * 0x20)
-            mm.write(bytearray(e))
 
-        mm.close()
-        f.close()
\ No newline at end of file
+class ScenarioError(Exception):
+    """"""
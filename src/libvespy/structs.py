@@ -1,12 +1,15 @@
 from dataclasses import dataclass
 from typing import Literal
+from array import array
 import ctypes
+import struct
+import json
 import math
 import mmap
 import sys
 import os
 
-from libvespy.utils import read_null_terminated_string
+from libvespy.utils import ArchiveReader, FileBuffer, pack_blobs, unpack_blobs
 
 
 class FPS4ContentData:
@@ -78,48 +81,77 @@ class FPS4FileData:
 
     skippable: bool = False
 
-    def __init__(self, mm: mmap.mmap, index: int, data: FPS4ContentData,
-                 byteorder: Literal['little', 'big'] = 'little', encoding: str = 'ascii'):
+    def __init__(self, mm: mmap.mmap | ArchiveReader, index: int, data: FPS4ContentData,
+                 byteorder: Literal['little', 'big'] = 'little', encoding: str = 'ascii', offset: int | None = None):
+        reader: ArchiveReader = mm if isinstance(mm, ArchiveReader) else ArchiveReader(mm)
+        if offset is None:
+            offset = mm.tell()
+
         self.index = index
 
         if data.has_start_pointers:
-            self.address = int.from_bytes(mm.read(4), byteorder)
+            self.address = reader.read_int(offset, 4, byteorder)
+            offset += 4
 
         if data.has_sector_sizes:
-            self.sector_size = int.from_bytes(mm.read(4), byteorder)
+            self.sector_size = reader.read_int(offset, 4, byteorder)
+            offset += 4
 
         if data.has_file_sizes:
-            self.file_size = int.from_bytes(mm.read(4), byteorder)
+            self.file_size = reader.read_int(offset, 4, byteorder)
+            offset += 4
 
         if data.has_filenames:
-            self.filename = mm.read(0x20).decode(encoding).rstrip('\x00')
+            self.filename = reader.read(offset, 0x20).decode(encoding).rstrip('\x00')
+            offset += 0x20
 
         if data.has_file_extensions:
-            self.file_extension = mm.read(0x8).decode(encoding)
+            self.file_extension = reader.read(offset, 0x8).decode(encoding)
+            offset += 0x8
 
         if data.has_file_types:
-            self.file_type = mm.read(0x4).decode(encoding)
+            self.file_type = reader.read(offset, 0x4).decode(encoding)
+            offset += 0x4
 
         if data.has_file_metadata:
-            path_location: int = int.from_bytes(mm.read(4), byteorder)
+            path_location: int = reader.read_int(offset, 4, byteorder)
+            offset += 4
             if path_location != 0:
-                raw: str = read_null_terminated_string(mm, encoding, path_location)
-                self.metadata: list[tuple] = []
-                for md in [d for d in raw.split(' ') if d]:
-                    if "=" in md:
-                        pair: tuple = tuple(md.split('=', 1))
-                        self.metadata.append(pair)
-                    else:
-                        self.metadata.append(tuple([None, md]))
+                self.metadata = self.parse_metadata(reader.read_null_terminated_string(path_location, encoding))
 
         if data.has_mask_0x080:
-            self.unknown_0x080 = int.from_bytes(mm.read(4), byteorder)
+            self.unknown_0x080 = reader.read_int(offset, 4, byteorder)
+            offset += 4
 
         if data.has_mask_0x100:
-            self.unknown_0x100 = int.from_bytes(mm.read(4), byteorder)
+            self.unknown_0x100 = reader.read_int(offset, 4, byteorder)
 
         self.skippable = self.address == 0xFFFFFFFF or (self.unknown_0x080 and self.unknown_0x080 > 0)
 
+    @classmethod
+    def from_values(cls, index: int, **values) -> 'FPS4FileData':
+        """Create file data from already parsed values instead of reading them from an FPS4 file."""
+        file: FPS4FileData = cls.__new__(cls)
+        file.index = index
+        for key, value in values.items():
+            setattr(file, key, value)
+
+        file.skippable = file.address == 0xFFFFFFFF or (file.unknown_0x080 and file.unknown_0x080 > 0)
+
+        return file
+
+    @staticmethod
+    def parse_metadata(raw: str) -> list[tuple]:
+        metadata: list[tuple] = []
+        for md in [d for d in raw.split(' ') if d]:
+            if "=" in md:
+                pair: tuple = tuple(md.split('=', 1))
+                metadata.append(pair)
+            else:
+                metadata.append(tuple([None, md]))
+
+        return metadata
+
     def estimate_file_size(self, files: list['FPS4FileData']) -> int | None:
         if self.file_size:
             return self.file_size
@@ -184,6 +216,283 @@ class FPS4FileData:
         return manifest
 
 
+class FPS4EntryTable:
+    """
+    Compact storage of the file entries of an FPS4 file.
+
+    Numeric fields are stored in arrays with one column per field, filenames are packed into a single buffer, and
+    file extensions and types (which are mostly the same few values) are interned into a shared pool, so that large
+    amounts of entries can be kept in memory. Entries are accessed through views, which can be used in place of
+    FPS4FileData, and which only create FPS4FileData objects when materialized.
+    """
+
+    __slots__ = ('count', 'encoding', 'addresses', 'sector_sizes', 'file_sizes', 'filename_data',
+                 'filename_offsets', 'file_extensions', 'file_types', 'strings', 'metadata', 'unknown_0x080',
+                 'unknown_0x100')
+
+    # Fields stored as raw binary data by to_bytes, in order
+    _BINARY_FIELDS: tuple[str, ...] = ('addresses', 'sector_sizes', 'file_sizes', 'filename_data', 'filename_offsets',
+                                       'file_extensions', 'file_types', 'unknown_0x080', 'unknown_0x100')
+
+    def __init__(self, encoding: str = 'ascii'):
+        self.count: int = 0
+        self.encoding: str = encoding
+        self.addresses: array = array('I')
+        self.sector_sizes: array = array('I')
+        self.file_sizes: array = array('I')
+        self.filename_data: bytearray = bytearray()
+        self.filename_offsets: array = array('I')
+        self.file_extensions: array = array('I')
+        self.file_types: array = array('I')
+        self.strings: list[str] = []
+        self.metadata: dict[int, str] = {}
+        self.unknown_0x080: array = array('I')
+        self.unknown_0x100: array = array('I')
+
+    @staticmethod
+    def from_buffer(buffer: bytes | mmap.mmap | FileBuffer, file_entries: int, header_size: int, entry_size: int,
+                    data: FPS4ContentData, byteorder: Literal['little', 'big'] = 'little',
+                    encoding: str = 'ascii') -> 'FPS4EntryTable':
+        """
+        Read the file entries of an FPS4 file.
+
+        :param buffer: Buffer containing the FPS4 file.
+        :param file_entries: Amount of file entries.
+        :param header_size: Offset of the first file entry.
+        :param entry_size: Size of each file entry.
+        :param data: Content data of the FPS4 file.
+        :param byteorder: Byteorder of the FPS4 file.
+        :param encoding: Encoding of the strings in the file entries.
+        :return: Entry table
+        """
+
+        table = FPS4EntryTable(encoding)
+        reader = ArchiveReader(buffer)
+        string_ids: dict[bytes, int] = {}
+
+        def _intern(value: bytes) -> int:
+            if value not in string_ids:
+                string_ids[value] = len(table.strings)
+                table.strings.append(value.decode(encoding))
+
+            return string_ids[value]
+
+        fields: list[tuple[str, str]] = []
+        if data.has_start_pointers: fields.append(('addresses', 'I'))
+        if data.has_sector_sizes: fields.append(('sector_sizes', 'I'))
+        if data.has_file_sizes: fields.append(('file_sizes', 'I'))
+        if data.has_filenames: fields.append(('filenames', '32s'))
+        if data.has_file_extensions: fields.append(('file_extensions', '8s'))
+        if data.has_file_types: fields.append(('file_types', '4s'))
+        if data.has_file_metadata: fields.append(('metadata', 'I'))
+        if data.has_mask_0x080: fields.append(('unknown_0x080', 'I'))
+        if data.has_mask_0x100: fields.append(('unknown_0x100', 'I'))
+
+        if data.has_filenames:
+            table.filename_offsets.append(0)
+
+        # The entries are read in one piece, so buffers that read from the file on access are read only once
+        entry = struct.Struct(('<' if byteorder == 'little' else '>') + ''.join(f[1] for f in fields))
+        entries: bytes = reader.read(header_size, max(file_entries * entry_size,
+                                                      (file_entries - 1) * entry_size + entry.size, 0))
+        for e in range(file_entries):
+            values: tuple = entry.unpack_from(entries, e * entry_size)
+            for (name, _), value in zip(fields, values):
+                if name == 'filenames':
+                    table.filename_data += value.rstrip(b'\x00')
+                    table.filename_offsets.append(len(table.filename_data))
+                elif name in ('file_extensions', 'file_types'):
+                    getattr(table, name).append(_intern(value))
+                elif name == 'metadata':
+                    if value != 0:
+                        table.metadata[e] = reader.read_null_terminated_string(value, encoding)
+                else:
+                    getattr(table, name).append(value)
+
+        table.count = file_entries
+
+        return table
+
+    @staticmethod
+    def from_files(files: list['FPS4FileData'], data: FPS4ContentData, encoding: str = 'ascii') -> 'FPS4EntryTable':
+        """
+        Store already parsed file entries in a table.
+
+        :param files: File entries.
+        :param data: Content data of the FPS4 file the entries were read from.
+        :param encoding: Encoding of the strings in the file entries.
+        :return: Entry table
+        """
+
+        table = FPS4EntryTable(encoding)
+        string_ids: dict[str, int] = {}
+
+        def _intern(value: str) -> int:
+            if value not in string_ids:
+                string_ids[value] = len(table.strings)
+                table.strings.append(value)
+
+            return string_ids[value]
+
+        if data.has_filenames:
+            table.filename_offsets.append(0)
+
+        for file in files:
+            if data.has_start_pointers: table.addresses.append(file.address)
+            if data.has_sector_sizes: table.sector_sizes.append(file.sector_size)
+            if data.has_file_sizes: table.file_sizes.append(file.file_size)
+            if data.has_filenames:
+                table.filename_data += file.filename.encode(encoding)
+                table.filename_offsets.append(len(table.filename_data))
+            if data.has_file_extensions: table.file_extensions.append(_intern(file.file_extension))
+            if data.has_file_types: table.file_types.append(_intern(file.file_type))
+            if data.has_file_metadata and file.metadata is not None:
+                table.metadata[file.index] = ' '.join(v if k is None else f"{k}={v}" for k, v in file.metadata)
+            if data.has_mask_0x080: table.unknown_0x080.append(file.unknown_0x080)
+            if data.has_mask_0x100: table.unknown_0x100.append(file.unknown_0x100)
+
+        table.count = len(files)
+
+        return table
+
+    def to_bytes(self) -> bytes:
+        """Store the table in a compact binary form, which can be loaded again by from_bytes on the same machine."""
+        info: dict = {'count': self.count, 'encoding': self.encoding, 'byteorder': sys.byteorder,
+                      'strings': self.strings, 'metadata': list(self.metadata.items())}
+
+        return pack_blobs([json.dumps(info).encode('utf-8')] +
+                          [getattr(self, name).tobytes() if name != 'filename_data' else self.filename_data
+                           for name in self._BINARY_FIELDS])
+
+    @staticmethod
+    def from_bytes(data: bytes | memoryview) -> 'FPS4EntryTable':
+        """
+        Load a table stored by to_bytes.
+
+        :param data: Binary form of the table.
+        :return: Entry table
+        """
+
+        blobs: list[bytes] = unpack_blobs(data)
+        if len(blobs) != len(FPS4EntryTable._BINARY_FIELDS) + 1:
+            raise ValueError("Entry table data is incomplete")
+
+        info: dict = json.loads(blobs[0])
+        table = FPS4EntryTable(info['encoding'])
+        table.count = info['count']
+        table.strings = info['strings']
+        table.metadata = {index: raw for index, raw in info['metadata']}
+
+        for name, blob in zip(FPS4EntryTable._BINARY_FIELDS, blobs[1:]):
+            if name == 'filename_data':
+                table.filename_data = bytearray(blob)
+                continue
+
+            column: array = getattr(table, name)
+            column.frombytes(blob)
+            if info['byteorder'] != sys.byteorder:
+                column.byteswap()
+
+        return table
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> 'FPS4EntryView':
+        if index < 0:
+            index += self.count
+
+        if not 0 <= index < self.count:
+            raise IndexError("Entry index out of range")
+
+        return FPS4EntryView(self, index)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield FPS4EntryView(self, index)
+
+    def materialize(self) -> list[FPS4FileData]:
+        return [view.materialize() for view in self]
+
+
+class FPS4EntryView:
+    """View of a single entry of an FPS4EntryTable, with the same fields and methods as FPS4FileData."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: FPS4EntryTable, index: int):
+        self.table: FPS4EntryTable = table
+        self.index: int = index
+
+    @staticmethod
+    def _get(column: array, index: int) -> int | None:
+        return column[index] if column else None
+
+    @property
+    def address(self) -> int | None:
+        return self._get(self.table.addresses, self.index)
+
+    @property
+    def sector_size(self) -> int | None:
+        return self._get(self.table.sector_sizes, self.index)
+
+    @property
+    def file_size(self) -> int | None:
+        return self._get(self.table.file_sizes, self.index)
+
+    @property
+    def filename(self) -> str | None:
+        offsets: array = self.table.filename_offsets
+        if not offsets:
+            return None
+
+        return self.table.filename_data[offsets[self.index]:offsets[self.index + 1]].decode(self.table.encoding)
+
+    @property
+    def file_extension(self) -> str | None:
+        string_id: int | None = self._get(self.table.file_extensions, self.index)
+        return None if string_id is None else self.table.strings[string_id]
+
+    @property
+    def file_type(self) -> str | None:
+        string_id: int | None = self._get(self.table.file_types, self.index)
+        return None if string_id is None else self.table.strings[string_id]
+
+    @property
+    def metadata(self) -> list[tuple] | None:
+        raw: str | None = self.table.metadata.get(self.index)
+        return None if raw is None else FPS4FileData.parse_metadata(raw)
+
+    @property
+    def unknown_0x080(self) -> int | None:
+        return self._get(self.table.unknown_0x080, self.index)
+
+    @property
+    def unknown_0x100(self) -> int | None:
+        return self._get(self.table.unknown_0x100, self.index)
+
+    @property
+    def skippable(self) -> bool:
+        return self.address == 0xFFFFFFFF or (self.unknown_0x080 and self.unknown_0x080 > 0)
+
+    def materialize(self) -> FPS4FileData:
+        return FPS4FileData.from_values(self.index, address=self.address, sector_size=self.sector_size,
+                                        file_size=self.file_size, filename=self.filename,
+                                        file_extension=self.file_extension, file_type=self.file_type,
+                                        metadata=self.metadata, unknown_0x080=self.unknown_0x080,
+                                        unknown_0x100=self.unknown_0x100)
+
+    # The methods of FPS4FileData only depend on its fields, which views provide as well
+    def estimate_file_size(self, files: 'FPS4EntryTable | list') -> int | None:
+        return FPS4FileData.estimate_file_size(self, files)
+
+    def estimate_file_path(self, ignore_metadata: bool = False) -> tuple[str | None, str]:
+        return FPS4FileData.estimate_file_path(self, ignore_metadata)
+
+    def generate_manifest(self) -> dict:
+        return FPS4FileData.generate_manifest(self)
+
+
 class FPS4LittleEndian(ctypes.LittleEndianStructure):
     _pack_ = 1
     _fields_ = [
@@ -227,7 +536,8 @@ class FPS4(ctypes.Union):
     file_location_multiplier: int
     should_guess_file_size: bool = False
 
-    files: list[FPS4FileData] = []
+    # Set per instance by set_byteorder, as ctypes does not call __init__ for structures created from buffers
+    files: list[FPS4FileData] | FPS4EntryTable
 
     def set_byteorder(self, byteorder: Literal['little', 'big']):
         self.byteorder = byteorder
@@ -1,27 +1,36 @@
-from typing import TYPE_CHECKING, Any, Literal, Sequence
+from typing import Any, BinaryIO, Iterator, Literal, Sequence
+from contextlib import nullcontext
 import warnings
 import ctypes
 import struct
 import mmap
 import lzma
 import zlib
+import io
 import os
 
 from libvespy.structs import TLZCHeader
-from libvespy.utils import format_lzma_filters
+from libvespy.utils import ArchiveReader, format_lzma_filters
+from libvespy.instrument import Observer, stage
+from libvespy.memory import MemoryBudget, get_memory_budget
+from libvespy.parallel import schedule
 from libvespy.res import Defaults
 
-if TYPE_CHECKING:
-    import io
+# Type 4 files have no last field in their header, and their LZMA filter properties start in its place
+TYPE_4_HEADER_SIZE: int = 0x14
 
 def decompress(filename: str, output: str = "",
-               comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto'):
+               comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto', observer: Observer | None = None,
+               memory_budget: MemoryBudget | int | str | None = None):
     """
     Decompress a TLZC file.
 
     :param filename: Path to TLZC file to decompress.
     :param output: Path to where the decompressed file will be written.
     :param comp_type: Compression type.
+    :param observer: If specified, receives an event for every finished stage of the decompression.
+    :param memory_budget: If specified, budget of the decompression. Files that do not fit into it are written while
+        they are decompressed. See memory.get_memory_budget.
     :return: None
     """
 
@@ -31,85 +40,192 @@ def decompress(filename: str, output: str = "",
     if not os.path.isdir(os.path.dirname(output)):
         os.makedirs(os.path.dirname(output))
 
-    with open(filename, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+    budget: MemoryBudget = get_memory_budget(memory_budget)
 
-        header = TLZCHeader.from_buffer_copy(mm.read(ctypes.sizeof(TLZCHeader)))
-        header.validate(mm.size())
+    with ArchiveReader.open(filename) as reader:
+        header = TLZCHeader.from_buffer_copy(reader.read(0, ctypes.sizeof(TLZCHeader)))
 
-        mm.close()
+        if not budget.fits(len(reader) + header.file_size_uncompressed):
+            # Decompressed data that does not fit into the budget is written while it is decompressed
+            with budget.reserve(budget.chunk_size * 2), \
+                    stage(observer, 'tlzc.decompress', 'codec', filename) as record, open(output, "wb") as f:
+                for chunk in decompress_stream(reader.buffer, comp_type, budget.chunk_size):
+                    record.bytes += f.write(chunk)
 
-        decompressed: bytes = bytes()
-        compression_type: int = 2
-        compression_subtype = comp_type
-        if comp_type == 'auto':
-            compression_type = (header.type >> 8) & 0xff
-            if compression_type == 2:
-                compression_subtype = 'zlib'
-        elif comp_type == 'lzma':
-            compression_type = 4
+                f.flush()
+                f.close()
 
-        # <!> lib is only tested with zlib for now
-        if comp_type == 'deflate' or compression_type == 4:
-            warnings.warn("[WARNING]\tSupport for Type 2 deflate and Type 4 lzma are only experimental."
-                          "Uncompressed output may get corrupted.")
+            return
 
+        with budget.reserve(len(reader) + header.file_size_uncompressed):
+            with stage(observer, 'tlzc.decompress', 'codec', filename) as record:
+                decompressed: bytes = decompress_data(reader.buffer, comp_type)
+                record.bytes = len(decompressed)
+
+            with stage(observer, 'tlzc.decompress', 'write', output) as record, open(output, "wb") as f:
+                record.bytes = f.write(decompressed)
+                f.flush()
+                f.close()
+
+def decompress_data(data: bytes | mmap.mmap, comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto') -> bytes:
+    """
+    Decompress TLZC data held in memory.
+
+    :param data: Buffer containing the complete TLZC file.
+    :param comp_type: Compression type.
+    :return: Decompressed data
+    """
+
+    header = TLZCHeader.from_buffer_copy(data[:ctypes.sizeof(TLZCHeader)])
+    header.validate(len(data))
+
+    decompressed: bytes = bytes()
+    compression_type: int = 2
+    compression_subtype = comp_type
+    if comp_type == 'auto':
+        compression_type = (header.type >> 8) & 0xff
         if compression_type == 2:
-            data: bytes = f.read()[0x18:]
-            if compression_subtype == 'deflate':
-                zd = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+            compression_subtype = 'zlib'
+    elif comp_type == 'lzma':
+        compression_type = 4
+
+    # <!> lib is only tested with zlib for now
+    if comp_type == 'deflate' or compression_type == 4:
+        warnings.warn("[WARNING]\tSupport for Type 2 deflate and Type 4 lzma are only experimental."
+                      "Uncompressed output may get corrupted.")
+
+    if compression_type == 2:
+        content: bytes = data[0x18:]
+        if compression_subtype == 'deflate':
+            zd = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+            try:
+                decompressed = zd.decompress(content)
+                decompressed += zd.flush()
+            except zlib.error:
+                raise TLZCError("[ERROR]\tdeflate Decompression failed.")
+        else:
+            try:
+                decompressed = zlib.decompress(content)
+            except zlib.error:
+                raise TLZCError("[ERROR]\tzlib Decompression failed.")
+    elif compression_type == 4:
+        # Get LZMA Filters Data
+        filters = _get_lzma_filters(data)
+
+        # Get Stream Data, every stream holds up to 64KiB of uncompressed data
+        stream_count: int = (header.file_size_uncompressed + 0xffff) >> 0x10
+        position: int = 0x19 + 2 * stream_count
+        stream_sizes = list(struct.unpack(f"<{stream_count}H", data[0x19:position]))
+
+        # Decompress
+        for s in stream_sizes:
+            stream_len: int = min(header.file_size_uncompressed - len(decompressed), 0x10000)
+            if s:
+                lz = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=filters)
                 try:
-                    decompressed = zd.decompress(data)
-                    decompressed += zd.flush()
-                except zlib.error:
-                    raise TLZCError("[ERROR]\tdeflate Decompression failed.")
+                    decompressed += lz.decompress(data[position:position + s], max_length=stream_len)
+                except lzma.LZMAError:
+                    raise TLZCError("[ERROR]\tLZMA decompression failed")
+                position += s
             else:
-                try:
-                    decompressed = zlib.decompress(data)
-                except zlib.error:
-                    raise TLZCError("[ERROR]\tzlib Decompression failed.")
-        elif compression_type == 4:
-            # Get LZMA Filters Data
-            f.seek(0x14)
-            mask, size = struct.unpack("<BI", f.read(5))
-            filters = [{
-                "id": lzma.FILTER_LZMA1,
-                "dict_size": size,
-                "lc": mask % 9,
-                "lp": (mask // 9) % 5,
-                "pb": (mask // 9) // 5,
-                "mode": lzma.MODE_NORMAL
-            }]
-
-            # Get Stream Data
-            stream_count: int = (header.file_size_compressed + 0xffff) >> 0x10
-            stream_sizes = list(struct.unpack(f"<{stream_count}H", f.read(2 * stream_count)))
-
-            # Decompress
-            decompressed: bytes = bytes()
-            for s in stream_sizes:
-                stream_len: int = min(header.file_size_compressed - len(decompressed), 0x10000)
-                if s:
-                    lz = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=filters)
-                    try:
-                        decompressed += lz.decompress(f.read(s), max_length=stream_len)
-                    except lzma.LZMAError:
-                        raise TLZCError("[ERROR]\tLZMA decompression failed")
-                else:
-                    decompressed += f.read(stream_len)
+                decompressed += data[position:position + stream_len]
+                position += stream_len
 
-        else:
-            raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {compression_type}")
+    else:
+        raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {compression_type}")
 
-        f.close()
+    return decompressed
 
-    with open(output, "wb") as f:
-        f.write(decompressed)
-        f.flush()
-        f.close()
+def decompress_stream(data: bytes | mmap.mmap | memoryview,
+                      comp_type: Literal['deflate', 'zlib', 'lzma', 'auto'] = 'auto',
+                      chunk_size: int = 0x100000) -> Iterator[bytes]:
+    """
+    Decompress TLZC data piece by piece, without holding the whole decompressed data in memory.
 
-def compress(filename: str, output: str = "",
-             comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib', nice_len: int = 64):
+    :param data: Buffer containing the complete TLZC file.
+    :param comp_type: Compression type.
+    :param chunk_size: (zlib/deflate Only) The maximum size of each decompressed piece. LZMA data is decompressed one
+        64KiB stream at a time.
+    :return: Iterator over the decompressed data
+    """
+
+    header = TLZCHeader.from_buffer_copy(data[:ctypes.sizeof(TLZCHeader)])
+    header.validate(len(data))
+
+    compression_type: int = 2
+    compression_subtype = comp_type
+    if comp_type == 'auto':
+        compression_type = (header.type >> 8) & 0xff
+        if compression_type == 2:
+            compression_subtype = 'zlib'
+    elif comp_type == 'lzma':
+        compression_type = 4
+
+    # <!> lib is only tested with zlib for now
+    if comp_type == 'deflate' or compression_type == 4:
+        warnings.warn("[WARNING]\tSupport for Type 2 deflate and Type 4 lzma are only experimental."
+                      "Uncompressed output may get corrupted.")
+
+    if compression_type == 2:
+        zd = zlib.decompressobj(wbits=-zlib.MAX_WBITS if compression_subtype == 'deflate' else zlib.MAX_WBITS)
+        try:
+            for position in range(0x18, len(data), chunk_size):
+                content = data[position:position + chunk_size]
+                while content:
+                    decompressed: bytes = zd.decompress(content, chunk_size)
+                    if decompressed:
+                        yield decompressed
+                    content = zd.unconsumed_tail
+
+            decompressed = zd.flush()
+            if decompressed:
+                yield decompressed
+        except zlib.error:
+            raise TLZCError(f"[ERROR]\t{compression_subtype} Decompression failed.")
+
+        if compression_subtype != 'deflate' and not zd.eof:
+            raise TLZCError("[ERROR]\tzlib Decompression failed.")
+    elif compression_type == 4:
+        filters = _get_lzma_filters(data)
+
+        stream_count: int = (header.file_size_uncompressed + 0xffff) >> 0x10
+        position: int = 0x19 + 2 * stream_count
+        stream_sizes = struct.unpack(f"<{stream_count}H", data[0x19:position])
+
+        remaining: int = header.file_size_uncompressed
+        for s in stream_sizes:
+            stream_len: int = min(remaining, 0x10000)
+            if s:
+                lz = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=filters)
+                try:
+                    decompressed = lz.decompress(data[position:position + s], max_length=stream_len)
+                except lzma.LZMAError:
+                    raise TLZCError("[ERROR]\tLZMA decompression failed")
+                position += s
+            else:
+                decompressed = bytes(data[position:position + stream_len])
+                position += stream_len
+
+            remaining -= len(decompressed)
+            yield decompressed
+    else:
+        raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {compression_type}")
+
+def _get_lzma_filters(data: bytes | mmap.mmap | memoryview) -> list[dict[str, Any]]:
+    mask, size = struct.unpack("<BI", data[0x14:0x19])
+    return [{
+        "id": lzma.FILTER_LZMA1,
+        "dict_size": size,
+        "lc": mask % 9,
+        "lp": (mask // 9) % 5,
+        "pb": (mask // 9) // 5,
+        "mode": lzma.MODE_NORMAL
+    }]
+
+def compress(filename: str, output: str = "", comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib',
+             nice_len: int = 64, max_workers: int | None = None, observer: Observer | None = None,
+             level: int | None = None, strategy: int = zlib.Z_DEFAULT_STRATEGY,
+             lzma_options: dict[str, Any] | None = None, memory_budget: MemoryBudget | int | str | None = None):
     """
     Compress a file into TLZC format.
 
@@ -117,6 +233,15 @@ def compress(filename: str, output: str = "",
     :param output: Path to where the compressed file will be written.
     :param comp_type: Compression type.
     :param nice_len: (LZMA Only) What should be considered a “nice length” for a match. This should be 273 or less.
+    :param max_workers: (LZMA Only) If specified, the amount of threads used for compressing streams in parallel.
+        Otherwise, it starts from the amount of CPUs and is adjusted to the measured throughput.
+    :param observer: If specified, receives an event for every finished stage of the compression.
+    :param level: (Type 2 Only) Compression level. See compress_data.
+    :param strategy: (Type 2 Only) zlib compression strategy, such as zlib.Z_FILTERED or zlib.Z_RLE.
+    :param lzma_options: (LZMA Only) Options of the LZMA filter that replace the defaults, such as lc, lp, pb,
+        dict_size, mf and depth.
+    :param memory_budget: If specified, budget of the compression. Files that do not fit into it are compressed while
+        they are read. See memory.get_memory_budget.
     :return: None
     """
 
@@ -130,93 +255,238 @@ def compress(filename: str, output: str = "",
     if not os.path.isdir(os.path.dirname(output)):
         os.makedirs(os.path.dirname(output))
 
+    file_size: int = os.path.getsize(filename)
+    if file_size > 0xFFFFFFFF:
+        raise TLZCError(f"[ERROR]\tCompression of files over 4GB is not supported.")
+
+    budget: MemoryBudget = get_memory_budget(memory_budget)
+
+    # The compressed data is at most about as large as the file
+    if not budget.fits(file_size * 2):
+        # Files that do not fit into the budget are compressed while they are read
+        with budget.reserve(budget.chunk_size * 2), stage(observer, 'tlzc.compress', 'codec', filename) as record, \
+                open(filename, "rb") as f, open(output, "wb") as cf:
+            compress_file(f, cf, file_size, comp_type, nice_len, max_workers, level, strategy, lzma_options,
+                          budget.chunk_size)
+            record.bytes = file_size
+
+            cf.flush()
+            cf.close()
+            f.close()
+
+        return
+
+    with budget.reserve(file_size * 2):
+        with stage(observer, 'tlzc.compress', 'read', filename) as record, open(filename, "rb") as f:
+            data: bytes = f.read()
+            record.bytes = len(data)
+            f.close()
+
+        with stage(observer, 'tlzc.compress', 'codec', filename) as record:
+            compressed: bytes = compress_data(data, comp_type, nice_len, max_workers, level, strategy, lzma_options)
+            record.bytes = len(data)
+
+        with stage(observer, 'tlzc.compress', 'write', output) as record, open(output, "wb") as f:
+            record.bytes = f.write(compressed)
+            f.flush()
+            f.close()
+
+def compress_data(data: bytes, comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib', nice_len: int = 64,
+                  max_workers: int | None = None, level: int | None = None, strategy: int = zlib.Z_DEFAULT_STRATEGY,
+                  lzma_options: dict[str, Any] | None = None) -> bytes:
+    """
+    Compress data held in memory into TLZC format.
+
+    :param data: Data to compress.
+    :param comp_type: Compression type.
+    :param nice_len: (LZMA Only) What should be considered a “nice length” for a match. This should be 273 or less.
+    :param max_workers: (LZMA Only) If specified, the amount of threads used for compressing streams in parallel.
+        Otherwise, it starts from the amount of CPUs and is adjusted to the measured throughput.
+    :param level: (Type 2 Only) Compression level from 0 to 9. Defaults to 9 for zlib, and to the default level of
+        zlib for deflate.
+    :param strategy: (Type 2 Only) zlib compression strategy, such as zlib.Z_FILTERED or zlib.Z_RLE.
+    :param lzma_options: (LZMA Only) Options of the LZMA filter that replace the defaults, such as lc, lp, pb,
+        dict_size, mf and depth.
+    :return: Compressed TLZC data
+    """
+
+    file_size: int = len(data)
+    if file_size > 0xFFFFFFFF:
+        raise TLZCError(f"[ERROR]\tCompression of files over 4GB is not supported.")
+
     # <!> lib is only tested with zlib for now
     if comp_type in ('deflate', 'lzma'):
         warnings.warn("[WARNING]\tSupport for Type 2 deflate and Type 4 lzma are only experimental. "
                       "Compression may fail or the compressed output may get corrupted.")
 
-    file_size: int = os.path.getsize(filename)
-    if file_size > 0xFFFFFFFF:
+    if comp_type in ('deflate', 'zlib'):
+        # Type 2 (deflate/zlib)
+        type_code: int = 0x0201
+        if comp_type == 'deflate':
+            zd = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, wbits=-zlib.MAX_WBITS,
+                                  strategy=strategy)
+            try:
+                content = zd.compress(data)
+                content += zd.flush()
+            except zlib.error:
+                raise TLZCError("[ERROR]\tdeflate Compression failed.")
+        else:
+            try:
+                if strategy == zlib.Z_DEFAULT_STRATEGY:
+                    content = zlib.compress(data, zlib.Z_BEST_COMPRESSION if level is None else level)
+                else:
+                    zc = zlib.compressobj(zlib.Z_BEST_COMPRESSION if level is None else level, strategy=strategy)
+                    content = zc.compress(data) + zc.flush()
+            except zlib.error:
+                raise TLZCError("[ERROR]\tzlib Compression failed.")
+
+        header = TLZCHeader(type_code, ctypes.sizeof(TLZCHeader) + len(content), file_size)
+
+        return bytearray(header) + content
+    elif comp_type == 'lzma':
+        return handle_lzma_compression(io.BytesIO(data), nice_len, max_workers, lzma_options)
+
+    raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {comp_type}")
+
+def handle_lzma_compression(f: io.BufferedReader, nice_len: int = 64, max_workers: int | None = None,
+                            lzma_options: dict[str, Any] | None = None) -> bytes:
+    file_size: int = len(f.read())
+    f.seek(0)
+
+    output = io.BytesIO()
+    _compress_lzma_file(f, output, file_size, nice_len, max_workers, lzma_options)
+
+    return output.getvalue()
+
+def compress_file(src: BinaryIO, dst: BinaryIO, size: int, comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib',
+                  nice_len: int = 64, max_workers: int | None = None, level: int | None = None,
+                  strategy: int = zlib.Z_DEFAULT_STRATEGY, lzma_options: dict[str, Any] | None = None,
+                  chunk_size: int = 0x100000) -> int:
+    """
+    Compress data from a file into TLZC format while it is read, holding only a chunk of it in memory at a time.
+
+    The compressed data is the same as the one of compress_data. The header is written once the data is compressed,
+    so the destination has to be seekable.
+
+    :param src: File to read the data from, starting at its current position.
+    :param dst: File to write the compressed data to, starting at its current position.
+    :param size: Amount of bytes to compress.
+    :param comp_type: Compression type.
+    :param nice_len: (LZMA Only) What should be considered a “nice length” for a match. This should be 273 or less.
+    :param max_workers: (LZMA Only) If specified, the amount of threads used for compressing streams in parallel.
+    :param level: (Type 2 Only) Compression level. See compress_data.
+    :param strategy: (Type 2 Only) zlib compression strategy, such as zlib.Z_FILTERED or zlib.Z_RLE.
+    :param lzma_options: (LZMA Only) Options of the LZMA filter that replace the defaults.
+    :param chunk_size: Amount of bytes read at a time.
+    :return: Size of the compressed data
+    """
+
+    if size > 0xFFFFFFFF:
         raise TLZCError(f"[ERROR]\tCompression of files over 4GB is not supported.")
 
-    compressed: bytes = bytes()
-    with open(filename, "rb") as f:
-        if comp_type in ('deflate', 'zlib'):
-            # Type 2 (deflate/zlib)
-            type_code: int = 0x0201
-            if comp_type == 'deflate':
-                header = TLZCHeader(type_code, file_size_compressed=file_size)
+    # <!> lib is only tested with zlib for now
+    if comp_type in ('deflate', 'lzma'):
+        warnings.warn("[WARNING]\tSupport for Type 2 deflate and Type 4 lzma are only experimental. "
+                      "Compression may fail or the compressed output may get corrupted.")
+
+    if comp_type == 'lzma':
+        return _compress_lzma_file(src, dst, size, nice_len, max_workers, lzma_options, chunk_size)
+    if comp_type not in ('deflate', 'zlib'):
+        raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {comp_type}")
 
-                zd = zlib.compressobj(wbits=-zlib.MAX_WBITS)
-                try:
-                    content = zd.compress(f.read())
-                    content += zd.flush()
-                except zlib.error:
-                    raise TLZCError("[ERROR]\tdeflate Compression failed.")
+    # Type 2 (deflate/zlib)
+    if comp_type == 'deflate':
+        zc = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, wbits=-zlib.MAX_WBITS,
+                              strategy=strategy)
+    else:
+        zc = zlib.compressobj(zlib.Z_BEST_COMPRESSION if level is None else level, strategy=strategy)
 
-                header.file_size_compressed = len(content)
-            else:
-                try:
-                    content = zlib.compress(f.read(), zlib.Z_BEST_COMPRESSION)
-                except zlib.error:
-                    raise TLZCError("[ERROR]\tzlib Compression failed.")
+    start: int = dst.tell()
+    dst.write(bytes(ctypes.sizeof(TLZCHeader)))
 
-                header = TLZCHeader(type_code, ctypes.sizeof(TLZCHeader) + len(content), file_size)
+    content_size: int = 0
+    try:
+        remaining: int = size
+        while remaining > 0:
+            chunk: bytes = src.read(min(chunk_size, remaining))
+            if not chunk: break
 
-            compressed = bytearray(header) + content
-        elif comp_type == 'lzma':
-            compressed = handle_lzma_compression(f, nice_len)
-        else:
-            raise TLZCError(f"[ERROR]\tUnsupported compression type: Type {comp_type}")
+            remaining -= len(chunk)
+            content_size += dst.write(zc.compress(chunk))
 
-        f.close()
+        content_size += dst.write(zc.flush())
+    except zlib.error:
+        raise TLZCError(f"[ERROR]\t{comp_type} Compression failed.")
 
-    with open(output, "wb") as f:
-        f.write(compressed)
-        f.flush()
-        f.close()
+    header = TLZCHeader(0x0201, ctypes.sizeof(TLZCHeader) + content_size, size)
 
-def handle_lzma_compression(f: io.BufferedReader, nice_len: int = 64) -> bytes:
-    filters: Sequence[dict[str, Any]] = Defaults.LZMA_FILTERS
-    filters[0]['nice_len'] = nice_len
+    end: int = dst.tell()
+    dst.seek(start)
+    dst.write(bytearray(header))
+    dst.seek(end)
+
+    return end - start
+
+def _compress_lzma_file(src: BinaryIO, dst: BinaryIO, file_size: int, nice_len: int = 64,
+                        max_workers: int | None = None, lzma_options: dict[str, Any] | None = None,
+                        chunk_size: int | None = None) -> int:
+    # Copy the defaults, as they are shared with every other compression. Streams are read back as raw LZMA1 with the
+    # properties written into the header, so they are always compressed as such.
+    filters: Sequence[dict[str, Any]] = [{**Defaults.LZMA_FILTERS[0], 'nice_len': nice_len, **(lzma_options or {}),
+                                          'id': lzma.FILTER_LZMA1}]
 
-    file_size: int = len(f.read())
     header = TLZCHeader(0x0401, file_size_uncompressed=file_size)
     filter_props: bytes = format_lzma_filters(filters)
     stream_count: int = (file_size + 0xffff) >> 16
 
-    header.file_size_compressed = ctypes.sizeof(header) + len(filter_props) + (stream_count * 2)
-    f.seek(header.file_size_compressed)
+    header_size: int = TYPE_4_HEADER_SIZE + len(filter_props) + (stream_count * 2)
+    header.file_size_compressed = header_size
+
+    # The header, filter properties and stream sizes are written once the streams are compressed
+    start: int = dst.tell()
+    dst.write(bytes(header_size))
+
+    # Without a chunk size, all streams are read and compressed at once
+    batch_size: int = max(stream_count if chunk_size is None else chunk_size >> 16, 1)
 
-    last_stream_len: int = file_size
     stream_sizes: list[int] = []
-    content: bytes = bytes()
-    for i in range(stream_count):
-        pre_len: int = len(content)
+    # Every stream is compressed independently, and lzma releases the GIL while compressing. A single worker
+    # compresses them on the calling thread, such as when files are already being compressed in parallel.
+    with schedule('codec', max_workers, tasks=stream_count) if max_workers != 1 else nullcontext() as executor:
+        compress_streams = map if executor is None else executor.map
+        for first in range(0, stream_count, batch_size):
+            streams: list[bytes] = [src.read(min(file_size - (i << 16), 0x10000))
+                                    for i in range(first, min(first + batch_size, stream_count))]
+
+            compressed: Iterator[bytes] = compress_streams(_compress_lzma_stream, streams, [filters] * len(streams))
+            for data, stream in zip(streams, compressed):
+                # Stream sizes are 16 bits, and streams that do not compress are stored as they are with a size of 0
+                if len(stream) >= 0x10000:
+                    stream, size = data, 0
+                else:
+                    size = len(stream)
+
+                stream_sizes.append(size)
+                header.file_size_compressed += dst.write(stream)
 
-        stream_len: int = min(last_stream_len, 0x10000)
-        lz = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=filters)
-        try:
-            content += lz.compress(f.read(stream_len))
-            content += lz.flush()
-        except lzma.LZMAError:
-            raise TLZCError("[ERROR]\tLZMA compression failed")
-
-        data_size: int = len(content) - pre_len
-        if data_size >= 0x10000:
-            data_size = 0
-
-        last_stream_len -= 0x10000
-        stream_sizes.append(data_size)
-    print("Content:", content)
-    header.file_size_compressed += len(content)
     sizes_as_bytes: bytes = bytes().join([s.to_bytes(2, 'little') for s in stream_sizes])
 
-    header_as_bytes = bytearray(header)
-    header_as_bytes += filter_props
-    header_as_bytes += sizes_as_bytes
+    end: int = dst.tell()
+    dst.seek(start)
+    dst.write(bytes(header)[:TYPE_4_HEADER_SIZE] + filter_props + sizes_as_bytes)
+    dst.seek(end)
+
+    return end - start
+
+def _compress_lzma_stream(data: bytes, filters: Sequence[dict[str, Any]]) -> bytes:
+    lz = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=filters)
+    try:
+        compressed: bytes = lz.compress(data)
+        compressed += lz.flush()
+    except lzma.LZMAError:
+        raise TLZCError("[ERROR]\tLZMA compression failed")
 
-    return header_as_bytes + content
+    return compressed
 
 def compress_lzma(data: bytes, filters: Sequence[dict[str, Any]]) -> bytes:
     try:
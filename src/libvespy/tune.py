@@ -0,0 +1,365 @@
+from dataclasses import dataclass
+from typing import Any, Literal, Sequence
+import itertools
+import time
+import lzma
+import zlib
+import os
+
+from libvespy.instrument import Observer
+from libvespy.utils import ArchiveReader
+from libvespy.parallel import create_executor
+from libvespy.res import Defaults
+from libvespy import tlzc
+
+# Uncompressed size of every LZMA stream of a TLZC file
+LZMA_STREAM_SIZE: int = 0x10000
+
+ZLIB_STRATEGIES: dict[str, int] = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'huffman': zlib.Z_HUFFMAN_ONLY,
+    'rle': zlib.Z_RLE,
+    'fixed': zlib.Z_FIXED,
+}
+
+LZMA_MATCH_FINDERS: dict[str, int] = {
+    'hc3': lzma.MF_HC3,
+    'hc4': lzma.MF_HC4,
+    'bt2': lzma.MF_BT2,
+    'bt3': lzma.MF_BT3,
+    'bt4': lzma.MF_BT4,
+}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Codec settings of a TLZC compression. Settings that are not specified keep the defaults of tlzc.compress."""
+
+    comp_type: Literal['deflate', 'zlib', 'lzma'] = 'zlib'
+    level: int | None = None            # Type 2 Only
+    strategy: str = 'default'           # Type 2 Only, one of ZLIB_STRATEGIES
+    nice_len: int = 64                  # LZMA Only
+    lc: int | None = None               # LZMA Only
+    lp: int | None = None               # LZMA Only
+    pb: int | None = None               # LZMA Only
+    dict_size: int | None = None        # LZMA Only
+    mf: str | None = None               # LZMA Only, one of LZMA_MATCH_FINDERS
+
+    @property
+    def name(self) -> str:
+        if self.comp_type != 'lzma':
+            level: int = self.level if self.level is not None else \
+                zlib.Z_BEST_COMPRESSION if self.comp_type == 'zlib' else 6
+            return f"{self.comp_type} level={level} strategy={self.strategy}"
+
+        options: dict[str, Any] = {**Defaults.LZMA_FILTERS[0], 'nice_len': self.nice_len, **self.get_lzma_options()}
+        match_finder: str = next(name for name, mf in LZMA_MATCH_FINDERS.items() if mf == options['mf'])
+        return (f"lzma lc={options['lc']} lp={options['lp']} pb={options['pb']} dict_size={options['dict_size']:#x} "
+                f"nice_len={options['nice_len']} mf={match_finder}")
+
+    def get_lzma_options(self) -> dict[str, Any]:
+        """
+        :return: LZMA filter options that replace the defaults
+        """
+
+        options: dict[str, Any] = {key: getattr(self, key) for key in ('lc', 'lp', 'pb', 'dict_size')
+                                   if getattr(self, key) is not None}
+        if self.mf is not None:
+            options['mf'] = LZMA_MATCH_FINDERS[self.mf]
+
+        return options
+
+    def get_compress_options(self) -> dict[str, Any]:
+        """
+        :return: Arguments of tlzc.compress and tlzc.compress_data that compress with these settings
+        """
+
+        if self.comp_type != 'lzma':
+            return {'comp_type': self.comp_type, 'level': self.level, 'strategy': ZLIB_STRATEGIES[self.strategy]}
+
+        return {'comp_type': self.comp_type, 'nice_len': self.nice_len, 'lzma_options': self.get_lzma_options()}
+
+    def compress_block(self, data: bytes) -> int:
+        """
+        Compress a block of data like tlzc.compress_data would, without the TLZC header.
+
+        :param data: Data to compress.
+        :return: Compressed size of the data
+        """
+
+        if self.comp_type != 'lzma':
+            default_level: int = zlib.Z_BEST_COMPRESSION if self.comp_type == 'zlib' else zlib.Z_DEFAULT_COMPRESSION
+            compressor = zlib.compressobj(default_level if self.level is None else self.level, zlib.DEFLATED,
+                                          zlib.MAX_WBITS if self.comp_type == 'zlib' else -zlib.MAX_WBITS,
+                                          strategy=ZLIB_STRATEGIES[self.strategy])
+            return len(compressor.compress(data)) + len(compressor.flush())
+
+        # Every stream of 64KiB is compressed independently as raw LZMA1, and stored as it is if it does not compress
+        filters: list[dict[str, Any]] = [{**Defaults.LZMA_FILTERS[0], 'nice_len': self.nice_len,
+                                          **self.get_lzma_options(), 'id': lzma.FILTER_LZMA1}]
+        size: int = 0
+        with memoryview(data) as view:
+            for position in range(0, len(data), LZMA_STREAM_SIZE):
+                stream = view[position:position + LZMA_STREAM_SIZE]
+                compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=filters)
+                compressed_size: int = len(compressor.compress(stream)) + len(compressor.flush())
+                size += compressed_size if compressed_size < LZMA_STREAM_SIZE else len(stream)
+
+        return size
+
+
+@dataclass
+class Measurement:
+    """Compressed size and compression time of sampled data with some settings."""
+
+    settings: Settings
+    size: int = 0               # Uncompressed size of the samples
+    compressed_size: int = 0
+    seconds: float = 0.0        # CPU time spent compressing
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_size / self.size if self.size else 1.0
+
+    @property
+    def throughput(self) -> float:
+        """Uncompressed bytes compressed per second."""
+        return self.size / self.seconds if self.seconds else float('inf')
+
+
+def get_candidates(comp_types: Sequence[Literal['deflate', 'zlib', 'lzma']] = ('zlib',),
+                   thorough: bool = False) -> list[Settings]:
+    """
+    :param comp_types: Compression types to try.
+    :param thorough: If every level and many more LZMA options should be tried, instead of a representative subset.
+    :return: Settings to try
+    """
+
+    candidates: list[Settings] = []
+    for comp_type in comp_types:
+        if comp_type in ('deflate', 'zlib'):
+            levels: Sequence[int] = range(1, 10) if thorough else (1, 3, 6, 9)
+            strategies: Sequence[str] = list(ZLIB_STRATEGIES) if thorough else ('default', 'filtered', 'rle')
+            candidates += [Settings(comp_type, level, strategy) for level, strategy in itertools.product(levels,
+                                                                                                       strategies)]
+        elif comp_type == 'lzma':
+            nice_lens: Sequence[int] = (8, 16, 32, 64, 128, 273) if thorough else (16, 64, 273)
+            match_finders: Sequence[str] = list(LZMA_MATCH_FINDERS) if thorough else ('hc4', 'bt4')
+            literal_options: Sequence[tuple[int, int, int]] = ((3, 0, 2), (0, 2, 2), (1, 0, 0), (4, 0, 2),
+                                                              (0, 0, 0), (2, 2, 2)) if thorough \
+                else ((3, 0, 2), (0, 2, 2), (1, 0, 0))
+            # Streams are 64KiB, so larger dictionaries can not find more matches
+            dict_sizes: Sequence[int | None] = (0x4000, None) if thorough else (None,)
+
+            for nice_len, mf, (lc, lp, pb), dict_size in itertools.product(nice_lens, match_finders, literal_options,
+                                                                           dict_sizes):
+                candidates.append(Settings('lzma', nice_len=nice_len, lc=lc, lp=lp, pb=pb, dict_size=dict_size, mf=mf))
+        else:
+            raise tlzc.TLZCError(f"[ERROR]\tUnsupported compression type: Type {comp_type}")
+
+    return candidates
+
+def sample_blocks(path: str | Sequence[str], block_size: int = 0x20000, max_blocks: int = 8) -> list[bytes]:
+    """
+    Read blocks spread evenly over a file, or over every file in a directory, so that large inputs can be analyzed
+    from a small part of them.
+
+    :param path: Path to a file or directory, or a list of them.
+    :param block_size: Size of every block.
+    :param max_blocks: The maximum amount of blocks.
+    :return: Sampled blocks, all of the data if it fits into them
+    """
+
+    files: list[str] = []
+    for p in [path] if isinstance(path, str) else path:
+        if os.path.isdir(p):
+            for root, dirs, names in os.walk(p):
+                dirs.sort()
+                files += [os.path.join(root, name) for name in sorted(names)]
+        else:
+            files.append(p)
+
+    sizes: list[int] = [os.path.getsize(file) for file in files]
+    total: int = sum(sizes)
+
+    # Offsets within all files joined together
+    if total <= block_size * max_blocks:
+        offsets: list[int] = list(range(0, total, block_size))
+    else:
+        offsets = [(total - block_size) * b // (max_blocks - 1) if max_blocks > 1 else 0 for b in range(max_blocks)]
+
+    blocks: list[bytes] = []
+    start: int = 0
+    offset_index: int = 0
+    for file, size in zip(files, sizes):
+        end: int = start + size
+        with open(file, "rb") as f:
+            while offset_index < len(offsets) and offsets[offset_index] < end:
+                # Blocks do not cross files, as the data around the boundary would not be compressed together
+                f.seek(offsets[offset_index] - start)
+                block: bytes = f.read(block_size)
+                if block:
+                    blocks.append(block)
+
+                offset_index += 1
+            f.close()
+
+        start = end
+
+    return blocks
+
+def analyze(path: str | Sequence[str], candidates: Sequence[Settings] | None = None, block_size: int = 0x20000,
+            max_blocks: int = 8, max_workers: int | None = None) -> list[Measurement]:
+    """
+    Compress sampled blocks of a file or directory with every candidate setting.
+
+    Blocks are compressed in parallel, and the time of each one is measured in CPU time of its thread, so that the
+    amount of parallel work does not skew the reported throughput.
+
+    :param path: Path to a file or directory, or a list of them.
+    :param candidates: Settings to try. Defaults to get_candidates().
+    :param block_size: Size of every sampled block.
+    :param max_blocks: The maximum amount of sampled blocks.
+    :param max_workers: The maximum amount of threads used for compressing blocks.
+    :return: Measurement of every candidate, from smallest to largest compressed size
+    """
+
+    candidates = get_candidates() if candidates is None else candidates
+    blocks: list[bytes] = sample_blocks(path, block_size, max_blocks)
+
+    measurements: list[Measurement] = [Measurement(settings) for settings in candidates]
+
+    # zlib and lzma release the GIL, so blocks are compressed on threads
+    with create_executor(max_workers) as executor:
+        futures = [(measurement, len(block), executor.submit(_measure_block, measurement.settings, block))
+                   for measurement, block in itertools.product(measurements, blocks)]
+
+        for measurement, size, future in futures:
+            compressed_size, seconds = future.result()
+            measurement.size += size
+            measurement.compressed_size += compressed_size
+            measurement.seconds += seconds
+
+    return sorted(measurements, key=lambda m: (m.compressed_size, -m.throughput))
+
+def _measure_block(settings: Settings, block: bytes) -> tuple[int, float]:
+    start: float = time.thread_time()
+    compressed_size: int = settings.compress_block(block)
+    return compressed_size, time.thread_time() - start
+
+def select(measurements: Sequence[Measurement], target_ratio: float | None = None, time_budget: float | None = None,
+           size: int = 0, tolerance: float = 0.01) -> Measurement:
+    """
+    Pick the best settings of an analysis.
+
+    With a size target, the fastest settings that meet it are picked, as compressing any smaller only costs time.
+    Otherwise, the fastest settings whose compressed size is within the tolerance of the smallest one are picked, so
+    that data that barely compresses better at higher settings is compressed quickly. A time budget excludes settings
+    that would take longer than it. If no settings meet the time budget and size target, the size target is dropped,
+    and then the time budget is met as closely as possible with the fastest settings.
+
+    :param measurements: Measurements of the analysis.
+    :param target_ratio: If specified, the maximum ratio of the compressed size to the uncompressed size.
+    :param time_budget: If specified, the maximum amount of seconds compressing the data may take.
+    :param size: (Time Budget Only) Size of the data that will be compressed. Defaults to the size of the samples.
+    :param tolerance: Fraction of the smallest compressed size that compressing smaller is not worth any time for.
+    :return: Measurement of the picked settings
+    """
+
+    if not measurements:
+        raise tlzc.TLZCError("[ERROR]\tNo settings were analyzed.")
+
+    eligible: list[Measurement] = [
+        m for m in measurements if (target_ratio is None or m.ratio <= target_ratio)
+        and (time_budget is None or (size or m.size) / m.throughput <= time_budget)
+    ]
+
+    if not eligible:
+        if target_ratio is not None and time_budget is not None:
+            return select(measurements, None, time_budget, size, tolerance)
+        if time_budget is not None:
+            return max(measurements, key=lambda m: m.throughput)
+
+        return min(measurements, key=lambda m: (m.compressed_size, -m.throughput))
+
+    if target_ratio is not None:
+        return max(eligible, key=lambda m: m.throughput)
+
+    smallest: int = min(m.compressed_size for m in eligible)
+    return max((m for m in eligible if m.compressed_size <= smallest * (1 + tolerance)), key=lambda m: m.throughput)
+
+def compress(filename: str, output: str = "", comp_types: Sequence[Literal['deflate', 'zlib', 'lzma']] = ('zlib',),
+             target_ratio: float | None = None, time_budget: float | None = None, tolerance: float = 0.01,
+             thorough: bool = False, block_size: int = 0x20000, max_blocks: int = 8, max_workers: int | None = None,
+             observer: Observer | None = None) -> Measurement:
+    """
+    Compress a file into TLZC format with the settings that suit its data best. See select for how settings are
+    picked.
+
+    :param filename: Path to file to compress.
+    :param output: Path to where the compressed file will be written. See tlzc.compress.
+    :param comp_types: Compression types to pick from.
+    :param target_ratio: If specified, the maximum ratio of the compressed size to the uncompressed size.
+    :param time_budget: If specified, the maximum amount of CPU seconds compressing the file may take, not including
+        the analysis.
+    :param tolerance: Fraction of the smallest compressed size that compressing smaller is not worth any time for.
+    :param thorough: If many more settings should be tried. See get_candidates.
+    :param block_size: Size of every sampled block.
+    :param max_blocks: The maximum amount of sampled blocks.
+    :param max_workers: The maximum amount of threads used for the analysis and for compressing.
+    :param observer: If specified, receives an event for every finished stage of the compression.
+    :return: Measurement of the picked settings
+    """
+
+    measurements: list[Measurement] = analyze(filename, get_candidates(comp_types, thorough), block_size, max_blocks,
+                                              max_workers)
+    picked: Measurement = select(measurements, target_ratio, time_budget, os.path.getsize(filename), tolerance)
+
+    if not output:
+        base_file, extension = os.path.splitext(filename)
+        output = f"{base_file}.cmp" if extension == '.dec' else f"{filename}.cmp"
+
+    tlzc.compress(filename, output, max_workers=max_workers, observer=observer,
+                  **picked.settings.get_compress_options())
+
+    # Compression types other than zlib are experimental, so their output is only kept if it decompresses correctly
+    if picked.settings.comp_type != 'zlib' and not is_lossless(filename, output, picked.settings.comp_type):
+        os.remove(output)
+        raise tlzc.TLZCError(f"[ERROR]\t{picked.settings.name} compression of {filename} is not lossless.")
+
+    return picked
+
+def is_lossless(filename: str, output: str, comp_type: Literal['deflate', 'zlib', 'lzma']) -> bool:
+    """
+    Check if a compressed file decompresses to the original file, reading both in pieces.
+
+    :param filename: Path to the original file.
+    :param output: Path to the compressed file.
+    :param comp_type: Compression type of the compressed file.
+    :return: If the decompressed data matches the original file
+    """
+
+    with ArchiveReader.open(filename) as original, ArchiveReader.open(output) as compressed:
+        position: int = 0
+        try:
+            for chunk in tlzc.decompress_stream(compressed.buffer, comp_type):
+                if original.read(position, len(chunk)) != chunk:
+                    return False
+
+                position += len(chunk)
+        except (tlzc.TLZCError, ValueError):
+            return False
+
+        return position == len(original)
+
+def format_report(measurements: Sequence[Measurement]) -> str:
+    """
+    :return: Table of the compressed size and throughput of every measurement
+    """
+
+    lines: list[str] = [f"{'ratio':>7} {'MiB/s':>9}  settings"]
+    for m in measurements:
+        lines.append(f"{m.ratio:7.2%} {m.throughput / 0x100000:9.1f}  {m.settings.name}")
+
+    return "\n".join(lines)
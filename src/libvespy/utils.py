@@ -1,5 +1,20 @@
-from typing import Any, Sequence
+from typing import Any, BinaryIO, Iterable, Iterator, Literal, Sequence
+import threading
+import hashlib
 import mmap
+import os
+
+# How archives are read and written:
+# mmap maps the whole file, which is fastest for large files on local storage.
+# pread reads and writes every range with positional system calls, which suits network filesystems and storage where
+# mappings are slow or unsupported.
+# buffered reads through a buffered file object, so the many small reads of parsing a header are served from memory,
+# which suits tiny files. Archives are written with positional writes like pread.
+IOStrategy = Literal['mmap', 'pread', 'buffered']
+IO_STRATEGIES: tuple[str, ...] = ('mmap', 'pread', 'buffered')
+
+# Access pattern hints given to the kernel with madvise or posix_fadvise
+Advice = Literal['normal', 'sequential', 'random', 'willneed', 'dontneed']
 
 
 def expand_and_write(mm: mmap.mmap, buffer: bytes):
@@ -17,25 +32,530 @@ def expand_and_seek(mm: mmap.mmap, pos: int, whence: int = 0):
 
     mm.seek(pos, whence)
 
+class ArchiveWriter:
+    """
+    Memory mapped writer used for building archives.
+
+    The mapping grows geometrically instead of by the exact amount of every write, so most writes are plain memory
+    copies. Regions that are skipped over (such as alignment padding or placeholders) are left as holes in the file,
+    and the file is truncated to the furthest written position when the writer is closed.
+    """
+
+    def __init__(self, file: BinaryIO, initial_size: int = 0x10000, preallocate: int = 0):
+        """
+        :param file: File opened for writing and reading (w+b) that the archive will be written into.
+        :param initial_size: Initial size of the mapping.
+        :param preallocate: If specified, the amount of bytes to allocate on disk in advance for the archive.
+        """
+
+        self.file: BinaryIO = file
+        self.size: int = 0
+        self.position: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+        self.capacity: int = max(initial_size, preallocate, 1)
+        self.file.truncate(self.capacity)
+        if preallocate and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self.file.fileno(), 0, preallocate)
+
+        self.mm: mmap.mmap = mmap.mmap(self.file.fileno(), self.capacity)
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def reserve(self, size: int):
+        """Grow the mapping so that it can hold at least the specified amount of bytes."""
+        if size <= self.capacity:
+            return
+
+        self.capacity = max(size, self.capacity * 2)
+        self.mm.resize(self.capacity)
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, pos: int, whence: int = 0):
+        """Move the cursor. Moving past the end of the written data leaves a hole once something is written after."""
+        self.position = pos if not whence else (self.position if whence == 1 else self.size) + pos
+
+    def write(self, buffer: bytes | bytearray | memoryview):
+        self.write_at(self.position, buffer)
+        self.position += len(buffer)
+
+    def write_at(self, offset: int, buffer: bytes | bytearray | memoryview):
+        """Write at an absolute offset without moving the cursor."""
+        end: int = offset + len(buffer)
+        self.reserve(end)
+
+        self.mm[offset:end] = buffer
+        self.extend(end)
+
+    def write_file(self, path: str) -> int:
+        """Copy the contents of a file into the archive at the cursor, returning the amount of bytes copied."""
+        copied: int = self.write_file_at(self.position, path)
+        self.position += copied
+
+        return copied
+
+    def write_file_at(self, offset: int, path: str) -> int:
+        """
+        Copy the contents of a file into the archive at an absolute offset without moving the cursor.
+
+        Multiple threads may copy files at the same time, as long as the space for them was reserved beforehand.
+        """
+
+        with open(path, "rb") as f:
+            length: int = os.fstat(f.fileno()).st_size
+            self.reserve(offset + length)
+
+            with memoryview(self.mm) as view:
+                copied: int = f.readinto(view[offset:offset + length])
+
+            f.close()
+
+        self.extend(offset + copied)
+
+        return copied
+
+    def copy_range_at(self, offset: int, fd: int, source_offset: int, length: int) -> int:
+        """
+        Copy a range of another file into the archive at an absolute offset without moving the cursor.
+
+        The copy is done by the kernel where supported, so the data is never read into Python. Like write_file_at,
+        multiple threads may copy at the same time, as long as the space for them was reserved beforehand.
+        """
+
+        self.reserve(offset + length)
+
+        copied: int = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < length:
+                    count: int = os.copy_file_range(fd, self.file.fileno(), length - copied,
+                                                    source_offset + copied, offset + copied)
+                    if not count: break
+                    copied += count
+            except OSError:
+                # Not supported between these files, so copy the rest by reading it
+                pass
+
+        while copied < length:
+            data: bytes = os.pread(fd, min(length - copied, 0x100000), source_offset + copied)
+            if not data: break
+
+            self.write_at(offset + copied, data)
+            copied += len(data)
+
+        self.extend(offset + copied)
+
+        return copied
+
+    def extend(self, end: int):
+        """Record that data was written up to an offset. Threads writing at the same time all extend the size."""
+        with self.lock:
+            self.size = max(self.size, end)
+
+    def pad(self, length: int):
+        """Advance the cursor by an amount of null bytes."""
+        end: int = self.position + length
+
+        # Only data that was already written has to be cleared, anything else is still a hole
+        if self.position < self.size:
+            self.write_at(self.position, bytes(min(end, self.size) - self.position))
+
+        self.reserve(end)
+        self.position = end
+        self.extend(end)
+
+    def align(self, alignment: int, offset: int = 0):
+        """Pad the cursor until it is aligned."""
+        self.pad(align_number(self.position, alignment, offset) - self.position)
+
+    def close(self):
+        """Flush the mapping and truncate the file to the size of the written data."""
+        if self.mm.closed:
+            return
+
+        self.mm.flush()
+        self.mm.close()
+
+        self.file.truncate(self.size)
+        self.file.flush()
+
+
+class PositionalArchiveWriter(ArchiveWriter):
+    """
+    Writer used for building archives with positional writes instead of a mapping.
+
+    Nothing has to be mapped or grown, which suits network filesystems and archives whose final size is far from the
+    initial guess. Like ArchiveWriter, skipped regions are left as holes, and multiple threads may write at different
+    offsets at the same time.
+    """
+
+    def __init__(self, file: BinaryIO, preallocate: int = 0):
+        """
+        :param file: File opened for writing (w+b) that the archive will be written into.
+        :param preallocate: If specified, the amount of bytes to allocate on disk in advance for the archive.
+        """
+
+        self.file: BinaryIO = file
+        self.size: int = 0
+        self.position: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.closed: bool = False
+
+        if preallocate and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self.file.fileno(), 0, preallocate)
+
+    def reserve(self, size: int):
+        """Positional writes extend the file by themselves, so there is nothing to reserve."""
+
+    def write_at(self, offset: int, buffer: bytes | bytearray | memoryview):
+        """Write at an absolute offset without moving the cursor."""
+        with memoryview(buffer) as view:
+            written: int = 0
+            while written < len(view):
+                written += os.pwrite(self.file.fileno(), view[written:], offset + written)
+
+        self.extend(offset + len(buffer))
+
+    def write_file_at(self, offset: int, path: str) -> int:
+        """
+        Copy the contents of a file into the archive at an absolute offset without moving the cursor.
+
+        Multiple threads may copy files at the same time.
+        """
+
+        with open(path, "rb") as f:
+            copied: int = self.copy_range_at(offset, f.fileno(), 0, os.fstat(f.fileno()).st_size)
+            f.close()
+
+        return copied
+
+    def close(self):
+        """Truncate the file to the size of the written data."""
+        if self.closed:
+            return
+
+        self.closed = True
+        self.file.truncate(self.size)
+        self.file.flush()
+
+def create_writer(file: BinaryIO, strategy: IOStrategy = 'mmap') -> ArchiveWriter:
+    """
+    :param file: File opened for writing and reading (w+b) that the archive will be written into.
+    :param strategy: I/O strategy of the writer.
+    :return: Writer of the archive
+    """
+
+    if strategy not in IO_STRATEGIES:
+        raise ValueError(f"Unknown I/O strategy: {strategy}")
+
+    return ArchiveWriter(file) if strategy == 'mmap' else PositionalArchiveWriter(file)
+
+
+class FileBuffer:
+    """
+    Read-only buffer over a file that reads the requested ranges on access instead of mapping the file.
+
+    Supports the parts of the buffer interface that ArchiveReader uses: its length, slicing and find.
+    """
+
+    def __init__(self, file: BinaryIO, size: int):
+        self.file: BinaryIO = file
+        self.size: int = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key: int | slice) -> int | bytes:
+        if isinstance(key, int):
+            if key < 0:
+                key += self.size
+            if not 0 <= key < self.size:
+                raise IndexError("Buffer index out of range")
+
+            return self._read(key, 1)[0]
+
+        start, stop, step = key.indices(self.size)
+        if step != 1:
+            return self._read(start, max(stop - start, 0))[::step]
+
+        return self._read(start, max(stop - start, 0))
+
+    def find(self, sub: bytes, start: int = 0, end: int | None = None) -> int:
+        end = self.size if end is None else min(end, self.size)
+
+        # Chunks overlap by the length of the searched bytes, so matches across their boundaries are found
+        position: int = max(start, 0)
+        while position < end:
+            chunk: bytes = self._read(position, min(0x10000, end - position))
+            found: int = chunk.find(sub)
+            if found >= 0:
+                return position + found
+            if position + len(chunk) >= end:
+                break
+
+            position += max(len(chunk) - len(sub) + 1, 1)
+
+        return -1
+
+    def _read(self, offset: int, size: int) -> bytes:
+        raise NotImplementedError
+
+class PreadBuffer(FileBuffer):
+    """File buffer that reads with positional reads, which can be issued from any amount of threads at once."""
+
+    def _read(self, offset: int, size: int) -> bytes:
+        size = max(min(size, self.size - offset), 0)
+        data: bytearray = bytearray(size)
+
+        with memoryview(data) as view:
+            read: int = 0
+            while read < size:
+                count: int = os.preadv(self.file.fileno(), [view[read:]], offset + read)
+                if not count: break
+                read += count
+
+        return bytes(data) if read == size else bytes(data[:read])
+
+class BufferedBuffer(FileBuffer):
+    """File buffer that reads through a buffered file object, so nearby small reads share a single system call."""
+
+    def __init__(self, file: BinaryIO, size: int):
+        super().__init__(file, size)
+
+        # The file has a single position, so reads from different threads take turns
+        self.lock: threading.Lock = threading.Lock()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(max(min(size, self.size - offset), 0))
+
+class BufferView:
+    """
+    Read-only window into a range of another buffer, which reads from it on access instead of copying the range.
+
+    Supports the length and slicing of the range, so that data inside an archive can be processed in chunks.
+    """
+
+    def __init__(self, buffer: bytes | bytearray | mmap.mmap | FileBuffer, offset: int, size: int):
+        self.buffer: bytes | bytearray | mmap.mmap | FileBuffer = buffer
+        self.offset: int = offset
+        self.size: int = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key: int | slice) -> int | bytes:
+        if isinstance(key, int):
+            if key < 0:
+                key += self.size
+            if not 0 <= key < self.size:
+                raise IndexError("Buffer index out of range")
+
+            return self.buffer[self.offset + key]
+
+        start, stop, step = key.indices(self.size)
+        if step != 1:
+            return bytes(self[i] for i in range(start, stop, step))
+
+        return self.buffer[self.offset + start:self.offset + max(stop, start)]
+
+
+class ArchiveReader:
+    """
+    Reader that reads from a shared buffer by absolute offset.
+
+    Reads never depend on or move a cursor, so a single reader (and the mapping behind it) can be shared by any
+    amount of threads reading different parts of an archive at the same time.
+    """
+
+    def __init__(self, buffer: bytes | bytearray | mmap.mmap | FileBuffer, file: BinaryIO | None = None):
+        """
+        :param buffer: Buffer containing the whole archive.
+        :param file: If specified, file that will be closed along with the reader.
+        """
+
+        self.buffer: bytes | bytearray | mmap.mmap | FileBuffer = buffer
+        self.file: BinaryIO | None = file
+
+    @staticmethod
+    def open(filename: str, strategy: IOStrategy = 'mmap') -> 'ArchiveReader':
+        """
+        Open a file for reading.
+
+        :param filename: Path to file.
+        :param strategy: I/O strategy of the reader. Files are mapped read-only by default.
+        :return: Reader of the file
+        """
+
+        if strategy not in IO_STRATEGIES:
+            raise ValueError(f"Unknown I/O strategy: {strategy}")
+
+        f = open(filename, "rb", buffering=-1 if strategy == 'buffered' else 0)
+        try:
+            size: int = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return ArchiveReader(bytes(), f)
+
+            if strategy == 'pread':
+                return ArchiveReader(PreadBuffer(f, size), f)
+            if strategy == 'buffered':
+                return ArchiveReader(BufferedBuffer(f, size), f)
+
+            return ArchiveReader(mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ), f)
+        except Exception:
+            f.close()
+            raise
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def size(self) -> int:
+        return len(self.buffer)
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self.buffer[offset:offset + size]
+
+    def view(self, offset: int, size: int) -> BufferView:
+        """Get a window into a range of the buffer, which is read in pieces as it is sliced."""
+        return BufferView(self.buffer, offset, min(size, max(len(self.buffer) - offset, 0)))
+
+    def read_chunks(self, offset: int, size: int, chunk_size: int = 0x100000) -> Iterator[bytes]:
+        """Read a range in chunks, so that only a chunk of it is held in memory at a time."""
+        for position in range(offset, offset + size, chunk_size):
+            yield self.buffer[position:min(position + chunk_size, offset + size)]
+
+    def read_int(self, offset: int, size: int = 4, byteorder: Literal['little', 'big'] = 'little') -> int:
+        return int.from_bytes(self.buffer[offset:offset + size], byteorder)
+
+    def read_null_terminated_string(self, offset: int, encoding: str = 'utf-8') -> str:
+        end: int = self.buffer.find(b'\x00', offset)
+        if end < 0:
+            end = len(self.buffer)
+
+        return self.buffer[offset:end].decode(encoding)
+
+    def advise(self, advice: Advice, offset: int = 0, length: int = 0):
+        """
+        Hint to the kernel how a range of the file will be accessed. Hints that are not supported are ignored.
+
+        :param advice: Expected access pattern of the range.
+        :param offset: Absolute offset of the range.
+        :param length: Length of the range. Defaults to the rest of the file.
+        """
+
+        length = len(self.buffer) - offset if not length else min(length, len(self.buffer) - offset)
+        if length <= 0:
+            return
+
+        try:
+            if isinstance(self.buffer, mmap.mmap):
+                option: int | None = getattr(mmap, f"MADV_{advice.upper()}", None)
+                if option is not None and hasattr(self.buffer, 'madvise'):
+                    # Ranges of a mapping are advised by whole pages
+                    start: int = offset - offset % mmap.PAGESIZE
+                    self.buffer.madvise(option, start, offset + length - start)
+            elif self.file is not None:
+                option = getattr(os, f"POSIX_FADV_{advice.upper()}", None)
+                if option is not None and hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(self.file.fileno(), offset, length, option)
+        except (OSError, ValueError):
+            # Hints never change the result of a read, so failing to give one is harmless
+            pass
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+        if self.file is not None:
+            self.file.close()
+
+
 def read_null_terminated_string(mm: mmap.mmap, encoding: str = 'utf-8', start: int = -1,
                                 reset_position: bool = True) -> str:
     cur: int = mm.tell()
-    content: bytearray = bytearray()
-    if start >= 0:
-        mm.seek(start)
+    if start < 0:
+        start = cur
 
-    while mm.tell() < mm.size():
-        c: bytes = mm.read(1)
-        if c == '\x00'.encode():
-            break
-
-        content.extend(c)
+    end: int = mm.find(b'\x00', start)
+    content: bytes = mm[start:] if end < 0 else mm[start:end]
 
     if reset_position:
         mm.seek(cur)
+    else:
+        mm.seek(mm.size() if end < 0 else end + 1)
 
     return content.decode(encoding)
 
+def hash_data(data: bytes | bytearray | memoryview | mmap.mmap) -> str:
+    """
+    Hash the contents of a file or member, for detecting identical or changed contents.
+
+    :param data: Data to hash.
+    :return: Hash as a hex string
+    """
+
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def hash_chunks(chunks: Iterable[bytes | bytearray | memoryview]) -> str:
+    """
+    Hash contents that are read in chunks. The hash is the same as the one of hash_data for the joined chunks.
+
+    :param chunks: Chunks of the data to hash.
+    :return: Hash as a hex string
+    """
+
+    hasher = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+def write_chunks(file: BinaryIO,
+                 chunks: Iterable[bytes | bytearray | memoryview]) -> Iterator[bytes | bytearray | memoryview]:
+    """
+    Write chunks into a file while passing them on, so that they can be hashed in the same pass.
+
+    :param file: File opened for writing.
+    :param chunks: Chunks of the data to write.
+    :return: The written chunks
+    """
+
+    for chunk in chunks:
+        file.write(chunk)
+        yield chunk
+
+def pack_blobs(blobs: Sequence[bytes | bytearray]) -> bytes:
+    """Join binary blobs, each prefixed by its size, so that they can be split again by unpack_blobs."""
+    return b''.join(len(blob).to_bytes(4, 'little') + bytes(blob) for blob in blobs)
+
+def unpack_blobs(data: bytes | memoryview) -> list[bytes]:
+    """Split binary blobs joined by pack_blobs."""
+    blobs: list[bytes] = []
+    position: int = 0
+    while position < len(data):
+        size: int = int.from_bytes(data[position:position + 4], 'little')
+        position += 4
+        if position + size > len(data):
+            raise ValueError("Blob exceeds the end of the data")
+
+        blobs.append(bytes(data[position:position + size]))
+        position += size
+
+    return blobs
+
 def get_alignment_from_lowest_unset_bit(alignment: int) -> int:
     bits: int = 0
     for b in range(64):
@@ -0,0 +1,70 @@
+import unittest
+import hashlib
+import shutil
+import os
+
+from settings_test import paths
+from libvespy import aio
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    async def test_extract_btl(self):
+        """Async FPS4 Extraction Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'aio_ext_btl')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'aio_btl.json')
+
+        async with aio.AsyncPool(max_concurrency=2) as pool:
+            await aio.extract(target, out_dir, manifest_dir, pool=pool)
+
+        control_checksums: dict[str, str] = {
+            "BTL_EFFECT.DAT": "5d75b49a0129e3e6eb2dc17fdf1923d70d29f592cc5790387c93889036eb3af5",
+            "BTL_EFFECT.DAV": "c20827f1e76c7a1ba55b3e320171ecbca45da94fa022d73aab2d1cf3793e3452",
+            "BTL_PACK.DAT": "2587565b2581041d063f8eaf8346bf13cbc52c60b3e194f6e6eb41ea6771350f"
+        }
+
+        self.assertEqual(len(os.listdir(out_dir)), 3, msg='Expected 3 output files')
+        for file in os.listdir(out_dir):
+            with open(os.path.join(out_dir, file), 'rb') as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+                f.close()
+
+            self.assertEqual(file_hash, control_checksums[file], msg=f"{file} does not match checksum")
+
+    async def test_compress_tlzc_zlib(self):
+        """Async TLZC zlib Compression Test: AHO_I00_02.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
+        assert os.path.isfile(target), f"{target} was not found"
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "aio_com_AHO_I00_02.DAT")
+
+        async with aio.AsyncPool() as pool:
+            await aio.compress(target, output, pool=pool)
+
+        # Compressed by Hyouta with zlib (Type 2)
+        checksum: str = "93c61d8f853e827116c4cc0bd3da56e10fd64fccc2e56841af68b89d96554f39"
+        with open(output, "rb") as f:
+            file_hash = hashlib.sha256(f.read()).hexdigest()
+            f.close()
+
+        self.assertEqual(file_hash, checksum, msg=f"{output} does not match checksum")
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,67 @@
+import unittest
+import shutil
+import time
+import os
+
+from settings_test import paths
+from libvespy import batch, fps4
+
+
+class TestBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_batch_extract_btl(self):
+        """Batch Extraction Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        input_dir = os.path.join(paths.ARTIFACTS_DIR, "batch", "input")
+        for name in ("a/btl.svo", "b/btl.svo", "c/btl.svo"):
+            os.makedirs(os.path.dirname(os.path.join(input_dir, name)), exist_ok=True)
+            shutil.copy(target, os.path.join(input_dir, name))
+
+        job_dir = os.path.join(paths.ARTIFACTS_DIR, "batch", "job")
+        output_dir = os.path.join(paths.ARTIFACTS_DIR, "batch", "output")
+        job: batch.Job = batch.create(job_dir, 'fps4.extract', input_dir, output_dir, "**/*.svo", shard_size=1,
+                                      lease_timeout=60)
+        self.assertEqual(job.shards, 3, msg='Expected a shard for every input')
+
+        # A worker that crashed while holding the first shard
+        batch.Lease.acquire(job_dir, 0, 0, 'crashed')
+        stale: float = time.time() - 120
+        os.utime(batch.get_lease_path(job_dir, 0, 0), (stale, stale))
+        self.assertEqual(batch.status(job_dir)['stale'], 1, msg='Expected the first shard to be stale')
+
+        self.assertEqual(batch.work(job_dir, 'first', max_workers=1, max_shards=1), 1)
+        self.assertEqual(batch.work(job_dir, 'second', max_workers=1), 2)
+        self.assertEqual(batch.status(job_dir)['finished'], 3, msg='Expected every shard to be finished')
+
+        merged: dict = batch.merge(job_dir)
+        self.assertEqual(merged['built'], 3, msg='Expected every input to be built')
+        self.assertEqual(sorted(merged['manifests']), ["a/btl.svo", "b/btl.svo", "c/btl.svo"])
+
+        control_dir = os.path.join(paths.ARTIFACTS_DIR, "batch", "control")
+        fps4.extract(target, control_dir)
+        for name in ("a/btl.svo.ext", "b/btl.svo.ext", "c/btl.svo.ext"):
+            for file in os.listdir(control_dir):
+                with open(os.path.join(control_dir, file), 'rb') as cf, \
+                        open(os.path.join(output_dir, name, file), 'rb') as f:
+                    self.assertEqual(f.read(), cf.read(), msg=f"{name}/{file} was not extracted correctly")
+                    f.close()
+                    cf.close()
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import unittest
+import shutil
+import os
+
+from settings_test import paths
+from libvespy.cache import PersistentHeaderCache
+from libvespy import fps4
+
+
+class TestCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_persistent_cache_btl(self):
+        """Persistent Header Cache Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        cache_dir = os.path.join(paths.ARTIFACTS_DIR, 'header_cache')
+        for columnar in (False, True):
+            with fps4.open_archive(target, columnar) as archive:
+                control: dict = fps4.generate_archive_manifest(archive)[0]
+
+            fps4.open_archive(target, columnar, cache=PersistentHeaderCache(cache_dir)).close()
+
+            # A new cache only finds the header on disk
+            cache = PersistentHeaderCache(cache_dir)
+            with fps4.open_archive(target, columnar, cache=cache) as archive:
+                self.assertEqual(cache.stats()['disk_hits'], 1, msg='Expected the header to be loaded from disk')
+                self.assertEqual(fps4.generate_archive_manifest(archive)[0], control,
+                                 msg='Cached header does not match parsed header')
+
+    def test_persistent_cache_invalidation(self):
+        """Persistent Header Cache Invalidation Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        copy = os.path.join(paths.ARTIFACTS_DIR, 'cache_btl.svo')
+        shutil.copy(target, copy)
+
+        cache_dir = os.path.join(paths.ARTIFACTS_DIR, 'header_cache_invalidation')
+        fps4.open_archive(copy, cache=PersistentHeaderCache(cache_dir)).close()
+
+        # A modified archive is parsed again
+        with open(copy, 'ab') as f:
+            f.write(bytes(0x10))
+            f.close()
+
+        cache = PersistentHeaderCache(cache_dir)
+        with fps4.open_archive(copy, cache=cache) as archive:
+            self.assertEqual(cache.stats()['disk_hits'], 0, msg='Expected the stale header to be discarded')
+            self.assertEqual(archive.fps4.file_size, os.path.getsize(copy))
+
+        cache.invalidate(copy)
+        self.assertEqual(os.listdir(cache_dir), [], msg='Expected the cached header to be removed')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,68 @@
+import threading
+import unittest
+import shutil
+import os
+
+from settings_test import paths
+from libvespy.daemon import Daemon, Client, DaemonError
+
+
+class TestDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+        self.socket_path: str = os.path.join(paths.ARTIFACTS_DIR, "libvespy.sock")
+        self.daemon = Daemon(self.socket_path, max_jobs=2)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+        # Wait until the daemon accepts connections
+        for _ in range(100):
+            try:
+                with Client(self.socket_path) as client:
+                    client.request('ping')
+                break
+            except OSError:
+                self.thread.join(0.05)
+
+    def tearDown(self):
+        with Client(self.socket_path) as client:
+            client.request('shutdown')
+
+        self.thread.join()
+
+    def test_extract_btl(self):
+        """Daemon Extraction Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        with Client(self.socket_path) as client:
+            for i in range(2):
+                out_dir = os.path.join(paths.ARTIFACTS_DIR, f'daemon_ext_btl_{i}')
+                manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', f'daemon_btl_{i}.json')
+
+                client.request('fps4.extract', filename=target, out_dir=out_dir, manifest_dir=manifest_dir)
+
+                output_count: int = len(os.listdir(out_dir))
+                self.assertEqual(output_count, 3, msg='Expected 3 output files')
+
+            stats: dict = client.request('stats')
+            self.assertEqual(stats['cache']['hits'], 1, msg='Expected the header to be parsed only once')
+
+            with self.assertRaises(DaemonError):
+                client.request('fps4.unknown')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,72 @@
+import unittest
+import tarfile
+import zipfile
+import shutil
+import os
+
+from settings_test import paths
+from libvespy import export, fps4, scenario
+
+
+class TestExport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_export_btl_tar(self):
+        """Export Test: btl.svo to tar"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'exp_btl')
+        fps4.extract(target, out_dir)
+
+        output = os.path.join(paths.ARTIFACTS_DIR, 'exp_btl.tar')
+        with open(output, 'wb') as f:
+            count: int = export.export(target, f)
+            f.close()
+
+        self.assertEqual(count, len(os.listdir(out_dir)), msg='Expected every extracted file to be exported')
+
+        with tarfile.open(output) as tar:
+            for member in tar.getmembers():
+                with open(os.path.join(out_dir, member.name), 'rb') as f:
+                    self.assertEqual(tar.extractfile(member).read(), f.read(),
+                                     msg=f"{member.name} does not match extracted file")
+                    f.close()
+
+    def test_export_scenario_zip(self):
+        """Export Test: scenario_ENG.dat to zip with decompression"""
+        target = os.path.join(paths.CONTROL_DIR, "scenario_ENG.dat")
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, "exp_scenario_ENG")
+        scenario.extract(target, out_dir, decompress=True)
+
+        output = os.path.join(paths.ARTIFACTS_DIR, 'exp_scenario_ENG.zip')
+        with open(output, 'wb') as f:
+            export.export(target, f, 'zip', decompress=True)
+            f.close()
+
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip(), msg='Exported zip is corrupted')
+            self.assertEqual(sorted(archive.namelist()), sorted(os.listdir(out_dir)))
+
+            for name in archive.namelist():
+                with open(os.path.join(out_dir, name), 'rb') as f:
+                    self.assertEqual(archive.read(name), f.read(), msg=f"{name} does not match extracted file")
+                    f.close()
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
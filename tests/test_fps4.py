@@ -1,10 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 import unittest
 import hashlib
 import shutil
 import os
 
 from settings_test import paths
-from libvespy import fps4
+from libvespy.instrument import Collector
+from libvespy.utils import hash_data
+from libvespy import fps4, memory, tlzc, utils
 
 
 class TestFPS4(unittest.TestCase):
@@ -53,6 +56,280 @@ class TestFPS4(unittest.TestCase):
 
             self.assertEqual(file_hash, control_checksums[file], msg=f"{file} does not match checksum")
 
+    def test_read_btl_concurrent(self):
+        """FPS4 Concurrent Member Read Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        control_checksums: dict[str, str] = {
+            "BTL_EFFECT.DAT": "5d75b49a0129e3e6eb2dc17fdf1923d70d29f592cc5790387c93889036eb3af5",
+            "BTL_EFFECT.DAV": "c20827f1e76c7a1ba55b3e320171ecbca45da94fa022d73aab2d1cf3793e3452",
+            "BTL_PACK.DAT": "2587565b2581041d063f8eaf8346bf13cbc52c60b3e194f6e6eb41ea6771350f"
+        }
+
+        with fps4.open_archive(target) as archive:
+            members: list[int] = [i for i in range(len(archive.files)) if archive.get_member_range(i)]
+            self.assertEqual(len(members), 3, msg='Expected 3 members')
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                contents: list[bytes] = list(executor.map(archive.read, members * 16))
+
+        for index, data in zip(members * 16, contents):
+            file: str = archive.files[index].filename
+            file_hash: str = hashlib.sha256(data).hexdigest()
+            self.assertEqual(file_hash, control_checksums[file], msg=f"{file} does not match checksum")
+
+    def test_extract_btl_observed(self):
+        """FPS4 Instrumented Extraction Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'ext_btl_observed')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'btl_observed.json')
+
+        collector = Collector()
+        fps4.extract(target, out_dir, manifest_dir, observer=collector)
+
+        report: dict = collector.report()
+        self.assertEqual(report['fps4.read']['header']['events'], 1, msg='Expected 1 header event')
+        self.assertEqual(report['fps4.extract']['member']['events'], 3, msg='Expected 3 member events')
+
+        extracted_bytes: int = sum(os.path.getsize(os.path.join(out_dir, file)) for file in os.listdir(out_dir))
+        self.assertEqual(report['fps4.extract']['member']['bytes'], extracted_bytes,
+                         msg='Reported member bytes do not match extracted bytes')
+
+    def test_extract_btl_hashes(self):
+        """FPS4 Manifest Hash Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'ext_btl_hashes')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'btl_hashes.json')
+
+        manifest: dict = fps4.extract(target, out_dir, manifest_dir)
+        for file in manifest['files']:
+            if 'path' not in file: continue
+
+            with open(file['path'], 'rb') as f:
+                self.assertEqual(file['hash'], hash_data(f.read()), msg=f"{file['path']} does not match hash")
+                f.close()
+
+        # Extracting again leaves unchanged files untouched
+        collector = Collector()
+        fps4.extract(target, out_dir, manifest_dir, observer=collector)
+        self.assertEqual(collector.report()['fps4.extract']['member']['bytes'], 0, msg='Expected no rewritten files')
+
+        # Packing copies unchanged members from btl.svo, and still picks up edited ones
+        edited: str = os.path.join(out_dir, "BTL_EFFECT.DAV")
+        with open(edited, 'ab') as f:
+            f.write(bytes(0x10))
+            f.close()
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "pck_btl_hashes", "btl.svo")
+        fps4.pack_from_manifest(output, manifest_dir)
+
+        with fps4.open_archive(output) as archive:
+            contents: dict[str, bytes] = {file.filename: archive.read(file.index) for file in archive.files
+                                          if archive.get_member_range(file.index)}
+
+        for file in os.listdir(out_dir):
+            with open(os.path.join(out_dir, file), 'rb') as f:
+                self.assertEqual(contents[file], f.read(), msg=f"{file} was not packed correctly")
+                f.close()
+
+    def test_extract_btl_filtered(self):
+        """FPS4 Filtered Extraction Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'ext_btl_filtered')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'btl_filtered.json')
+
+        manifest: dict = fps4.extract(target, out_dir, manifest_dir, members=fps4.MemberFilter(names=["*.dav"]))
+        self.assertEqual(os.listdir(out_dir), ["BTL_EFFECT.DAV"], msg='Expected only BTL_EFFECT.DAV to be extracted')
+
+        # The manifest still describes every member, so the whole archive can be packed again
+        with fps4.open_archive(target) as archive:
+            self.assertEqual(len(manifest['files']), len(archive.files))
+
+            output = os.path.join(paths.ARTIFACTS_DIR, "pck_btl_filtered", "btl.svo")
+            fps4.pack_from_manifest(output, manifest_dir)
+
+            with fps4.open_archive(output) as packed:
+                for file in archive.files:
+                    if not archive.get_member_range(file.index): continue
+                    self.assertEqual(packed.read(file.index), archive.read(file.index),
+                                     msg=f"{file.filename} was not packed correctly")
+
+    def test_extract_btl_io_strategies(self):
+        """FPS4 I/O Strategy Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        packed: dict[str, bytes] = {}
+        for io_strategy in utils.IO_STRATEGIES:
+            out_dir = os.path.join(paths.ARTIFACTS_DIR, f'ext_btl_{io_strategy}')
+            manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', f'btl_{io_strategy}.json')
+            fps4.extract(target, out_dir, manifest_dir, io_strategy=io_strategy)
+
+            output = os.path.join(paths.ARTIFACTS_DIR, f"pck_btl_{io_strategy}", "btl.svo")
+            fps4.pack_from_manifest(output, manifest_dir, io_strategy=io_strategy)
+            with open(output, 'rb') as f:
+                packed[io_strategy] = f.read()
+                f.close()
+
+            with fps4.open_archive(target, io_strategy=io_strategy) as archive, \
+                    fps4.open_archive(target, columnar=True, io_strategy=io_strategy) as columnar:
+                for file in archive.files:
+                    if not archive.get_member_range(file.index): continue
+                    self.assertEqual(columnar.read(file.index), archive.read(file.index),
+                                     msg=f"{file.filename} does not match with {io_strategy} reads")
+
+        self.assertEqual(packed['pread'], packed['mmap'], msg='Packed archives differ between I/O strategies')
+        self.assertEqual(packed['buffered'], packed['mmap'], msg='Packed archives differ between I/O strategies')
+
+    def test_pack_overlay_btl(self):
+        """FPS4 Overlay Packing Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        replacement = os.path.join(paths.ARTIFACTS_DIR, "overlay_btl", "BTL_EFFECT.DAV")
+        os.makedirs(os.path.dirname(replacement), exist_ok=True)
+        with open(replacement, 'wb') as f:
+            f.write(bytes(range(0x100)) * 3 + bytes(0x11))
+            f.close()
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "overlay_btl", "btl.svo")
+        manifest: dict = fps4.pack_overlay(target, output, {"BTL_EFFECT.DAV": replacement})
+        self.assertIsNone(manifest.get('file_terminator_address'), msg='Expected the moved terminator to be cleared')
+
+        with fps4.open_archive(target) as base, fps4.open_archive(output) as archive:
+            for file in base.files:
+                if not base.get_member_range(file.index): continue
+
+                if file.filename == "BTL_EFFECT.DAV":
+                    with open(replacement, 'rb') as f:
+                        self.assertEqual(archive.read(file.index), f.read(), msg='Member was not replaced')
+                        f.close()
+                else:
+                    self.assertEqual(archive.read(file.index), base.read(file.index),
+                                     msg=f"{file.filename} was not copied from base archive")
+
+        with self.assertRaises(fps4.FPS4Error):
+            fps4.pack_overlay(target, target, {})
+
+    def test_pack_btl_compressed(self):
+        """FPS4 Compressed Packing Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'ext_btl_compressed')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'btl_compressed.json')
+        fps4.extract(target, out_dir, manifest_dir)
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "pck_btl_compressed", "btl.svo")
+        fps4.pack_from_manifest(output, manifest_dir, compress='zlib',
+                                compress_members=fps4.MemberFilter(names=["BTL_EFFECT.DAV"]))
+
+        with fps4.open_archive(output) as archive:
+            for file in archive.files:
+                if not archive.get_member_range(file.index): continue
+
+                data: bytes = archive.read(file.index)
+                if file.filename == "BTL_EFFECT.DAV":
+                    self.assertEqual(data[:4], b'TLZC', msg='Expected BTL_EFFECT.DAV to be compressed')
+                    data = tlzc.decompress_data(data)
+
+                with open(os.path.join(out_dir, file.filename), 'rb') as f:
+                    self.assertEqual(data, f.read(), msg=f"{file.filename} was not packed correctly")
+                    f.close()
+
+    def test_pack_btl_memory_budget(self):
+        """FPS4 Memory Budget Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        # Members larger than the budget are extracted and compressed in chunks, and spilled to temporary files
+        budget = memory.MemoryBudget(0x1000, chunk_size=0x400)
+
+        packed: dict[str, bytes] = {}
+        for name, memory_budget in (('unlimited', None), ('budget', budget)):
+            out_dir = os.path.join(paths.ARTIFACTS_DIR, f'ext_btl_{name}')
+            manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', f'btl_{name}.json')
+            manifest: dict = fps4.extract(target, out_dir, manifest_dir, memory_budget=memory_budget)
+            for file in manifest['files']:
+                if 'path' not in file: continue
+                with open(file['path'], 'rb') as f:
+                    self.assertEqual(hash_data(f.read()), file['hash'], msg=f"{file['path']} was not hashed correctly")
+                    f.close()
+
+            output = os.path.join(paths.ARTIFACTS_DIR, f"pck_btl_{name}", "btl.svo")
+            fps4.pack_from_manifest(output, manifest_dir, compress='zlib', memory_budget=memory_budget)
+            with open(output, 'rb') as f:
+                packed[name] = f.read()
+                f.close()
+
+            self.assertFalse([file for file in os.listdir(os.path.dirname(output)) if file.endswith('.spill')],
+                             msg='Expected temporary files to be removed')
+
+        self.assertEqual(packed['budget'], packed['unlimited'], msg='Packed archives differ with a memory budget')
+        self.assertEqual(budget.used, 0, msg='Expected all reserved memory to be released')
+
+    def test_pack_btl_optimized_layout(self):
+        """FPS4 Optimized Layout Packing Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, 'ext_btl_layout')
+        manifest_dir = os.path.join(paths.ARTIFACTS_DIR, '.manifest', 'btl_layout.json')
+        manifest: dict = fps4.extract(target, out_dir, manifest_dir)
+
+        # Make the last member with data a copy of the first, so that they can share their data
+        paths_with_data: list[str] = [file['path'] for file in manifest['files'] if 'path' in file]
+        shutil.copyfile(paths_with_data[0], paths_with_data[-1])
+
+        layouts: dict[str, fps4.MemberLayout] = {}
+        members: dict[str, list[bytes | None]] = {}
+        for name, optimize_layout in (('entries', False), ('optimized', True)):
+            output = os.path.join(paths.ARTIFACTS_DIR, f"pck_btl_{name}", "btl.svo")
+            layouts[name] = fps4.pack_from_manifest(output, manifest_dir, optimize_layout=optimize_layout)
+            self.assertEqual(layouts[name].end, os.path.getsize(output))
+
+            with fps4.open_archive(output) as archive:
+                members[name] = [archive.read(file.index) if archive.get_member_range(file.index) else None
+                                 for file in archive.files]
+
+        self.assertEqual(members['optimized'], members['entries'], msg='Members differ with an optimized layout')
+        self.assertEqual(layouts['entries'].saved, 0)
+        self.assertGreater(layouts['optimized'].saved, 0, msg='Expected identical members to share their data')
+        self.assertEqual(layouts['entries'].end - layouts['optimized'].end, layouts['optimized'].saved)
+
+    def test_transcode_btl(self):
+        """FPS4 Transcoding Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        converted = os.path.join(paths.ARTIFACTS_DIR, "transcode_btl", "btl_big.svo")
+        fps4.transcode(target, converted, byteorder='big', alignment=0x800)
+
+        restored = os.path.join(paths.ARTIFACTS_DIR, "transcode_btl", "btl_little.svo")
+        fps4.transcode(converted, restored, byteorder='little', alignment=1)
+
+        with fps4.open_archive(target) as archive, fps4.open_archive(converted) as big, \
+                fps4.open_archive(restored) as little:
+            self.assertEqual(big.fps4.byteorder, 'big')
+            self.assertEqual(little.fps4.byteorder, 'little')
+
+            for file in archive.files:
+                if not archive.get_member_range(file.index): continue
+
+                self.assertEqual(big.get_member_range(file.index)[0] % 0x800, 0,
+                                 msg=f"{file.filename} is not aligned")
+                self.assertEqual(big.read(file.index), archive.read(file.index),
+                                 msg=f"{file.filename} was not converted correctly")
+                self.assertEqual(little.read(file.index), archive.read(file.index),
+                                 msg=f"{file.filename} was not converted correctly")
+
     def test_extract_btl_pack(self):
         """FPS4 Extraction Test: BTL_PACK.DAT"""
         target = os.path.join(paths.CONTROL_DIR, "BTL_PACK.DAT")
@@ -129,6 +406,20 @@ class TestFPS4(unittest.TestCase):
         output_count: int = len(os.listdir(out_dir))
         self.assertEqual(output_count, 294, msg='Expected 294 output file')
 
+    def test_read_npc_columnar(self):
+        """FPS4 Columnar Entry Table Test: npc.svo"""
+        target = os.path.join(paths.CONTROL_DIR, "npc.svo")
+        assert os.path.isfile(target)
+
+        with fps4.open_archive(target) as archive, fps4.open_archive(target, columnar=True) as columnar:
+            self.assertEqual(len(archive.files), len(columnar.files))
+            self.assertEqual(archive.fps4.generate_base_manifest(), columnar.fps4.generate_base_manifest())
+
+            for file, view in zip(archive.files, columnar.files):
+                self.assertEqual(file, view.materialize(), msg=f"Entry {file.index} does not match")
+                self.assertEqual(file.estimate_file_size(archive.files), view.estimate_file_size(columnar.files))
+                self.assertEqual(archive.get_member_range(file.index), columnar.get_member_range(view.index))
+
     def test_extract_room(self):
         """FPS4 Extraction Test: AHO_I00_02.tlzc"""
         target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
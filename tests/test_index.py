@@ -0,0 +1,51 @@
+import unittest
+import shutil
+import os
+
+from settings_test import paths
+from libvespy.index import ArchiveIndex
+from libvespy.utils import hash_data
+
+
+class TestIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_index_control(self):
+        """Archive Index Test: Control Files"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        database = os.path.join(paths.ARTIFACTS_DIR, 'index.db')
+        with ArchiveIndex(database) as index:
+            stats: dict[str, int] = index.update(paths.CONTROL_DIR)
+            self.assertGreater(stats['scanned'], 0, msg='Expected control files to be scanned')
+
+            stats = index.update(paths.CONTROL_DIR)
+            self.assertEqual(stats['scanned'], 0, msg='Expected unchanged control files to be skipped')
+
+            members = [m for m in index.find_by_name('btl_pack.dat') if m.container == os.path.abspath(target)]
+            self.assertEqual(len(members), 1, msg='Expected BTL_PACK.DAT to be found in btl.svo')
+
+            # The standalone copy of BTL_PACK.DAT is identical to the one in btl.svo
+            with open(os.path.join(paths.CONTROL_DIR, 'BTL_PACK.DAT'), 'rb') as f:
+                file_hash: str = hash_data(f.read())
+                f.close()
+
+            self.assertEqual(members[0].hash, file_hash, msg='BTL_PACK.DAT does not match hash')
+            self.assertIn(members[0], index.find_by_hash(file_hash))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,155 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import unittest
+import hashlib
+import shutil
+import time
+import os
+
+from settings_test import paths
+from libvespy import fps4, tlzc, parallel, utils
+
+
+class TestParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_stress_extract_pack(self):
+        """Concurrent FPS4 Extraction and Packing Stress Test: BTL_PACK.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "BTL_PACK.DAT")
+        assert os.path.isfile(target)
+
+        checksum: str = "2587565b2581041d063f8eaf8346bf13cbc52c60b3e194f6e6eb41ea6771350f"
+
+        def _roundtrip(i: int) -> str:
+            out_dir = os.path.join(paths.ARTIFACTS_DIR, "stress", f"ext_{i}")
+            manifest_dir = os.path.join(paths.ARTIFACTS_DIR, "stress", ".manifest", f"{i}.json")
+            output = os.path.join(paths.ARTIFACTS_DIR, "stress", f"pck_{i}", "BTL_PACK.DAT")
+
+            fps4.extract(target, out_dir, manifest_dir)
+            fps4.pack_from_manifest(output, manifest_dir)
+
+            with open(output, "rb") as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+                f.close()
+
+            return file_hash
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results: list[str] = list(executor.map(_roundtrip, range(32)))
+
+        for file_hash in results:
+            self.assertEqual(file_hash, checksum, msg="Packed archive does not match checksum")
+
+    def test_stress_compress(self):
+        """Concurrent TLZC Compression Stress Test: AHO_I00_02.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
+        assert os.path.isfile(target)
+
+        with open(target, "rb") as f:
+            data: bytes = f.read()
+            f.close()
+
+        # Different settings running at the same time must not affect each other
+        jobs: list[tuple[str, int]] = [('zlib', 64), ('lzma', 32), ('lzma', 273), ('deflate', 64)] * 8
+        expected: dict[tuple[str, int], bytes] = {job: tlzc.compress_data(data, *job) for job in set(jobs)}
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results: list[bytes] = list(executor.map(lambda job: tlzc.compress_data(data, *job), jobs))
+
+        for job, result in zip(jobs, results):
+            self.assertEqual(result, expected[job], msg=f"{job[0]} compression is not deterministic")
+
+        # Output that matches itself is only useful if it also decompresses to the original data
+        for job in expected:
+            if job[0] == 'zlib': continue
+            self.assertEqual(tlzc.decompress_data(bytes(expected[job]), job[0]), data,
+                             msg=f"{job[0]} compression is not lossless")
+
+        zlib_checksum: str = "93c61d8f853e827116c4cc0bd3da56e10fd64fccc2e56841af68b89d96554f39"
+        self.assertEqual(hashlib.sha256(expected[('zlib', 64)]).hexdigest(), zlib_checksum)
+
+    def test_stress_write(self):
+        """Concurrent Archive Writer Stress Test"""
+        output = os.path.join(paths.ARTIFACTS_DIR, "stress_write", "archive.bin")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+        # Every write extends the size of the archive, no matter which thread finishes last
+        for strategy in utils.IO_STRATEGIES:
+            with open(output, "w+b") as f:
+                writer = utils.create_writer(f, strategy)
+                writer.reserve(0x100 * 0x1000)
+
+                with ThreadPoolExecutor(max_workers=16) as executor:
+                    list(executor.map(lambda i: writer.write_at(i * 0x1000, bytes([i]) * 0x1000), range(0x100)))
+
+                self.assertEqual(writer.size, 0x100 * 0x1000,
+                                 msg=f"Size of the {strategy} writer is not the end of the furthest write")
+                writer.close()
+                f.close()
+
+            self.assertEqual(os.path.getsize(output), 0x100 * 0x1000)
+
+    def test_map_jobs_extract(self):
+        """Parallel Batch Extraction Test: btl.svo, item.svo"""
+        targets: list[str] = [os.path.join(paths.CONTROL_DIR, "btl.svo"), os.path.join(paths.CONTROL_DIR, "item.svo")]
+
+        jobs: list[dict] = [{'filename': target, 'out_dir': os.path.join(paths.ARTIFACTS_DIR, "batch", str(i))}
+                            for i, target in enumerate(targets)]
+        manifests: list[dict] = parallel.map_jobs(fps4.extract, jobs)
+
+        self.assertEqual(len(os.listdir(jobs[0]['out_dir'])), 3, msg='Expected 3 output files')
+        self.assertEqual(len(os.listdir(jobs[1]['out_dir'])), 2, msg='Expected 2 output files')
+        self.assertEqual(len(manifests), 2)
+
+    def test_schedule_extract(self):
+        """Adaptive Scheduling Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, "btl.svo")
+        assert os.path.isfile(target)
+
+        # Pinned limits are never adjusted, and never exceeded
+        running: list[int] = [0, 0]
+        lock = threading.Lock()
+
+        def _task(i: int) -> int:
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.001)
+            with lock:
+                running[0] -= 1
+            return i
+
+        with parallel.schedule('io', 3) as executor:
+            futures: list[Future] = [executor.submit(_task, i) for i in range(100)]
+        self.assertEqual([future.result() for future in futures], list(range(100)))
+        self.assertLessEqual(running[1], 3, msg='Pinned limit was exceeded')
+        self.assertEqual(executor.history, [3], msg='Pinned limit was adjusted')
+
+        # Adaptive and pinned extraction write the same files
+        adaptive_dir = os.path.join(paths.ARTIFACTS_DIR, "schedule", "adaptive")
+        pinned_dir = os.path.join(paths.ARTIFACTS_DIR, "schedule", "pinned")
+        fps4.extract(target, adaptive_dir)
+        fps4.extract(target, pinned_dir, max_threads=1)
+
+        self.assertEqual(sorted(os.listdir(adaptive_dir)), sorted(os.listdir(pinned_dir)))
+        for file in os.listdir(pinned_dir):
+            with open(os.path.join(adaptive_dir, file), "rb") as f, open(os.path.join(pinned_dir, file), "rb") as cf:
+                self.assertEqual(f.read(), cf.read(), msg=f"{file} was not extracted correctly")
+                cf.close()
+                f.close()
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
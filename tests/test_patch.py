@@ -0,0 +1,91 @@
+import unittest
+import shutil
+import os
+
+from settings_test import paths
+from libvespy.index import ArchiveIndex
+from libvespy import fps4, patch
+
+
+class TestPatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_patch_btl(self):
+        """Patch Test: btl.svo"""
+        target = os.path.join(paths.CONTROL_DIR, 'btl.svo')
+        assert os.path.isfile(target)
+
+        # Change a few bytes of a member in place
+        with fps4.open_archive(target) as archive:
+            index: int = next(file.index for file in archive.files if file.filename == "BTL_EFFECT.DAV")
+            member: bytearray = bytearray(archive.read(index))
+
+        member[0x10:0x14] = b'TEST'
+        replacement = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "BTL_EFFECT.DAV")
+        os.makedirs(os.path.dirname(replacement), exist_ok=True)
+        with open(replacement, 'wb') as f:
+            f.write(member)
+            f.close()
+
+        source = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "btl.svo")
+        shutil.copyfile(target, source)
+        newer = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "btl_new.svo")
+        fps4.pack_overlay(source, newer, {"BTL_EFFECT.DAV": replacement})
+
+        with open(newer, 'rb') as f:
+            expected: bytes = f.read()
+            f.close()
+
+        with ArchiveIndex(os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "index.db")) as archive_index:
+            archive_index.update([source, newer])
+
+            for options in ({}, {'index': archive_index}, {'delta': False}):
+                patch_file = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "btl.patch")
+                stats: dict[str, int] = patch.diff(source, newer, patch_file, **options)
+                self.assertEqual(stats['changed'], 1, msg=f"Expected a single changed member with {options}")
+                self.assertEqual(stats['size'], os.path.getsize(patch_file))
+
+                output = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "btl_patched.svo")
+                patch.apply(source, patch_file, output)
+                with open(output, 'rb') as f:
+                    self.assertEqual(f.read(), expected, msg=f"Patched file does not match with {options}")
+                    f.close()
+
+                if options.get('delta', True):
+                    self.assertLess(stats['size'], len(member), msg='Expected only the changed bytes to be stored')
+
+        with self.assertRaises(patch.PatchError):
+            patch.apply(newer, patch_file, output)
+
+        # A source with the same size and header, but a changed member that is copied from it
+        with patch.ArchiveReader.open(source) as reader:
+            _, offset, _ = next(member for member in patch.get_members(reader, source)
+                                if member[0] != "BTL_EFFECT.DAV")
+        changed = os.path.join(paths.ARTIFACTS_DIR, "patch_btl", "btl_changed.svo")
+        shutil.copyfile(source, changed)
+        with open(changed, 'r+b') as f:
+            f.seek(offset)
+            byte: int = f.read(1)[0]
+            f.seek(offset)
+            f.write(bytes([byte ^ 0xFF]))
+            f.close()
+
+        with self.assertRaises(patch.PatchError):
+            patch.apply(changed, patch_file, output)
+        self.assertFalse(os.path.exists(output), msg='Expected the mismatching output to be removed')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,74 @@
+import unittest
+import hashlib
+import shutil
+import json
+import os
+
+from settings_test import paths
+from libvespy import pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_build_npc_cap_003(self):
+        """Incremental Pipeline Test: CAP_I00_03.DAT"""
+        target: str = os.path.join(paths.CONTROL_DIR, "CAP_I00_03.DAT")
+        assert os.path.isfile(target)
+
+        build_dir: str = os.path.join(paths.ARTIFACTS_DIR, "pipeline")
+        os.makedirs(build_dir)
+
+        pipeline_file: str = os.path.join(build_dir, "pipeline.json")
+        with open(pipeline_file, "w") as f:
+            json.dump({'pipelines': [{'name': 'map', 'steps': [
+                {'op': 'tlzc.decompress', 'input': target, 'output': "CAP_I00_03.dec"},
+                {'op': 'fps4.extract', 'input': "CAP_I00_03.dec", 'output': "CAP_I00_03.ext",
+                 'manifest': ".manifest/CAP_I00_03.json"},
+                {'op': 'fps4.pack', 'input': ".manifest/CAP_I00_03.json", 'output': "CAP_I00_03.pck"},
+                {'op': 'tlzc.compress', 'input': "CAP_I00_03.pck", 'output': "CAP_I00_03.cmp"},
+            ]}]}, f)
+            f.close()
+
+        state_file: str = os.path.join(build_dir, "state.json")
+        steps: list[pipeline.Step] = pipeline.load(pipeline_file)
+
+        results = pipeline.build(steps, state_file)
+        self.assertEqual(list(results.values()).count('built'), 4, msg='Expected all 4 steps to be built')
+
+        cmp_cs: str = "a51520ea94a321a220d3871ed3a3fc612de4435f4d388eca039fad168d1d52d8"
+        file_hash: str = ""
+        with open(os.path.join(build_dir, "CAP_I00_03.cmp"), "rb") as f:
+            file_hash = hashlib.sha256(f.read()).hexdigest()
+            f.close()
+
+        self.assertEqual(file_hash, cmp_cs, msg="Compressed Map file was not built correctly!")
+
+        results = pipeline.build(steps, state_file)
+        self.assertEqual(list(results.values()).count('skipped'), 4, msg='Expected all 4 steps to be skipped')
+
+        # Changing an extracted member only rebuilds the steps after extraction
+        with open(os.path.join(build_dir, "CAP_I00_03.ext", "0000"), "ab") as f:
+            f.write(bytes(1))
+            f.close()
+
+        results = pipeline.build(pipeline.load(pipeline_file), state_file)
+        self.assertEqual(results['map::1:fps4.extract'], 'skipped', msg='Expected extraction to be skipped')
+        self.assertEqual(results['map::2:fps4.pack'], 'built', msg='Expected packing to be rebuilt')
+        self.assertEqual(results['map::3:tlzc.compress'], 'built', msg='Expected compression to be rebuilt')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -51,5 +51,37 @@ class TestScenario(unittest.TestCase):
 
         self.assertEqual(file_hash, checksum)
 
+    def test_scenario_compressed_roundtrip(self):
+        """Scenario Compressed Pack and Decompressed Extraction Test: scenario_ENG.dat"""
+        target = os.path.join(paths.CONTROL_DIR, "scenario_ENG.dat")
+        assert os.path.isfile(target)
+
+        source = os.path.join(paths.ARTIFACTS_DIR, "dec_scenario_src")
+        os.makedirs(source, exist_ok=True)
+
+        control_checksums: dict[str, str] = {}
+        with open(target, "rb") as f:
+            for i in range(8):
+                data: bytes = f.read(0x400 * (i + 1))
+                control_checksums[str(i * 2)] = hashlib.sha256(data).hexdigest()
+                with open(os.path.join(source, str(i * 2)), "wb") as sf:
+                    sf.write(data)
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "cmp_scenario_src.dat")
+        scenario.pack(source, output, compress='zlib')
+
+        self.assertIs(os.path.isfile(output), True)
+
+        out_dir = os.path.join(paths.ARTIFACTS_DIR, "dec_scenario_ext")
+        scenario.extract(output, out_dir, decompress=True)
+
+        self.assertEqual(len(os.listdir(out_dir)), len(control_checksums))
+        for file, checksum in control_checksums.items():
+            with open(os.path.join(out_dir, file), "rb") as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+                f.close()
+
+            self.assertEqual(file_hash, checksum, msg=f"{file} does not match checksum")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
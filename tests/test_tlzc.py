@@ -4,7 +4,7 @@ import shutil
 import os
 
 from settings_test import paths
-from libvespy import tlzc
+from libvespy import memory, tlzc
 
 
 class TestTLZC(unittest.TestCase):
@@ -62,5 +62,46 @@ class TestTLZC(unittest.TestCase):
 
         self.assertEqual(file_hash, checksum)
 
+    def test_tlzc_memory_budget(self):
+        """TLZC Streaming Compression and Decompression Test: AHO_I00_02.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
+        assert os.path.isfile(target), f"{target} was not found"
+
+        # A budget smaller than the file makes both directions stream it in chunks
+        budget = memory.MemoryBudget(0x20000, chunk_size=0x8000)
+        self.assertFalse(budget.fits(os.path.getsize(target)), msg='Expected the file to not fit into the budget')
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "stream_com_AHO_I00_02.DAT")
+        tlzc.compress(target, output, memory_budget=budget)
+
+        checksum: str = "93c61d8f853e827116c4cc0bd3da56e10fd64fccc2e56841af68b89d96554f39"
+        with open(output, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), checksum)
+            f.close()
+
+        decompressed = os.path.join(paths.ARTIFACTS_DIR, "stream_dec_AHO_I00_02.DAT")
+        tlzc.decompress(output, decompressed, memory_budget=budget)
+
+        with open(target, "rb") as f, open(decompressed, "rb") as df:
+            self.assertEqual(df.read(), f.read(), msg='Streamed roundtrip is not lossless')
+            df.close()
+            f.close()
+
+        self.assertEqual(budget.used, 0, msg='Expected all reserved memory to be released')
+
+    def test_tlzc_lzma_roundtrip(self):
+        """TLZC Type 4 lzma Roundtrip Test"""
+        # Data that compresses, data that does not (stored as is) and sizes around the 64KiB streams
+        samples: list[bytes] = [bytes(range(0x100)) * (size // 0x100) + bytes(size % 0x100)
+                                for size in (0, 1000, 0x10000, 200000)]
+        samples += [os.urandom(size) for size in (1000, 0x10000, 200000)]
+
+        for data in samples:
+            compressed: bytes = bytes(tlzc.compress_data(data, 'lzma'))
+            self.assertEqual(tlzc.decompress_data(compressed), data,
+                             msg=f"lzma roundtrip of {len(data)} bytes is not lossless")
+            self.assertEqual(b''.join(tlzc.decompress_stream(compressed)), data,
+                             msg=f"Streamed lzma roundtrip of {len(data)} bytes is not lossless")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
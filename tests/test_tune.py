@@ -0,0 +1,67 @@
+import unittest
+import shutil
+import os
+
+from settings_test import paths
+from libvespy import tlzc, tune
+
+
+class TestTune(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create clean artifacts folder"""
+        contents: list[str] = os.listdir(paths.ARTIFACTS_DIR)
+        for content in contents:
+            path: str = os.path.join(paths.ARTIFACTS_DIR, content)
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def setUp(self):
+        """Display current Test Case"""
+        print(self._testMethodDoc)
+
+    def test_analyze_tlzc_zlib(self):
+        """TLZC Codec Analysis Test: AHO_I00_02.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
+        assert os.path.isfile(target), f"{target} was not found"
+
+        candidates: list[tune.Settings] = tune.get_candidates(('zlib',))
+        measurements: list[tune.Measurement] = tune.analyze(target, candidates)
+        self.assertEqual(len(measurements), len(candidates), msg='Expected a measurement for every candidate')
+
+        sizes: list[int] = [m.compressed_size for m in measurements]
+        self.assertEqual(sizes, sorted(sizes), msg='Expected measurements from smallest to largest')
+
+        # With a size target, the fastest settings that meet it are picked
+        target_ratio: float = measurements[len(measurements) // 2].ratio
+        picked: tune.Measurement = tune.select(measurements, target_ratio=target_ratio)
+        self.assertLessEqual(picked.ratio, target_ratio)
+        for m in measurements:
+            if m.ratio <= target_ratio:
+                self.assertLessEqual(m.throughput, picked.throughput)
+
+        # The default settings compress exactly like tlzc.compress
+        with open(target, "rb") as f:
+            data: bytes = f.read()
+            f.close()
+
+        self.assertEqual(tlzc.compress_data(data, **tune.Settings().get_compress_options()), tlzc.compress_data(data))
+
+    def test_compress_tlzc_tuned(self):
+        """TLZC Tuned Compression Test: AHO_I00_02.DAT"""
+        target = os.path.join(paths.CONTROL_DIR, "AHO_I00_02.tlzc")
+        assert os.path.isfile(target), f"{target} was not found"
+
+        output = os.path.join(paths.ARTIFACTS_DIR, "tuned_AHO_I00_02.DAT")
+        picked: tune.Measurement = tune.compress(target, output, time_budget=60.0)
+        self.assertEqual(picked.settings.comp_type, 'zlib')
+
+        with open(target, "rb") as f, open(output, "rb") as cf:
+            self.assertEqual(tlzc.decompress_data(cf.read()), f.read(), msg='Tuned compression is not lossless')
+            cf.close()
+            f.close()
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)